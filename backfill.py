@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backfill Runner
+===============
+複数デバイス・複数日のタイムブロックプロンプトをまとめて再生成するバックフィルジョブ
+プロンプト（timeblock_endpoint_v2.py）を変更した際の過去分の再生成に使用する
+
+- 処理単位は (device_id, date) の1日分（process_day_v3 で各テーブル1回の取得・1回のUPSERT）
+- 同時実行数とレート制限（1秒あたりの開始単位数）を設定可能
+- 完了した単位をチェックポイントファイルに記録し、中断後は続きから再開
+  （BACKFILL_CHECKPOINT_INTERVAL 単位または BACKFILL_CHECKPOINT_SECONDS 秒ごと・終了時にスレッドで書き出す）
+- スループット（blocks/s）と残り時間（ETA）を報告
+
+使用例:
+    python backfill.py --devices d067d407-...,9f7d6e27-... --start-date 2025-09-01 --end-date 2025-09-30 \\
+        --concurrency 4 --rate 2 --checkpoint data/backfill/september.json
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import contextvars
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from dotenv import load_dotenv
+
+from jobs import DEFAULT_MAX_RETAINED, DEFAULT_RESULT_TTL
+from timeblock_endpoint import TIME_BLOCKS
+from timeblock_endpoint_v2 import process_day_v3
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CHECKPOINT_DIR = os.getenv("BACKFILL_CHECKPOINT_DIR", "data/backfill")
+CHECKPOINT_INTERVAL = int(os.getenv("BACKFILL_CHECKPOINT_INTERVAL", "20"))
+CHECKPOINT_SECONDS = float(os.getenv("BACKFILL_CHECKPOINT_SECONDS", "5"))
+
+# job_id はチェックポイントのファイル名に使うため、ディレクトリ外を指せない文字のみ許可
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# チェックポイントから再開する場合に一致している必要があるパラメータ
+CHECKPOINT_PARAMS = ("device_ids", "start_date", "end_date", "start_block", "end_block")
+
+
+def date_range(start_date: str, end_date: str) -> List[str]:
+    """start_date〜end_date（両端を含む）の日付文字列リスト"""
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    if end < start:
+        raise ValueError("end_date must be on or after start_date")
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+class RateLimiter:
+    """1秒あたりの開始数を制限する単純なレートリミッター"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class BackfillJob:
+    """(device_id, date) 単位のバックフィルジョブ"""
+
+    def __init__(self, supabase_client, device_ids: List[str], start_date: str, end_date: str, *,
+                 concurrency: int = DEFAULT_CONCURRENCY, rate: Optional[float] = None,
+                 checkpoint_path: Optional[str] = None,
+                 start_block: Optional[str] = None, end_block: Optional[str] = None,
+                 job_id: Optional[str] = None):
+        if job_id is not None and not JOB_ID_PATTERN.match(job_id):
+            raise ValueError(f"Invalid job_id: {job_id!r} (allowed: A-Z a-z 0-9 _ -, up to 64 characters)")
+        for block in (start_block, end_block):
+            if block is not None and block not in TIME_BLOCKS:
+                raise ValueError(f"Invalid time block: {block!r} (e.g. 14-30)")
+
+        self.supabase_client = supabase_client
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.device_ids = device_ids
+        self.start_date = start_date
+        self.end_date = end_date
+        self.start_block = start_block
+        self.end_block = end_block
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.checkpoint_path = checkpoint_path or os.path.join(DEFAULT_CHECKPOINT_DIR, f"{self.job_id}.json")
+
+        self.units: List[Tuple[str, str]] = [
+            (device_id, date) for device_id in device_ids for date in date_range(start_date, end_date)
+        ]
+        self.completed: Dict[str, int] = {}   # "device_id|date" → 処理ブロック数
+        self.failed: Dict[str, str] = {}      # "device_id|date" → エラー内容
+        self.status = "pending"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.blocks_this_run = 0
+        self.units_this_run = 0
+        self.task: Optional[asyncio.Task] = None
+        self._unsaved_units = 0
+        self._saved_at = time.monotonic()
+        self._save_lock = asyncio.Lock()
+        self._load_checkpoint()
+
+    @staticmethod
+    def unit_key(device_id: str, date: str) -> str:
+        return f"{device_id}|{date}"
+
+    def _load_checkpoint(self):
+        """
+        チェックポイントがあれば完了済みの単位を読み込む（失敗した単位は再実行する）
+        デバイス・期間・タイムブロックの範囲が異なる場合は ValueError（別の範囲に完了済みの記録を適用しない）
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        mismatched = [name for name in CHECKPOINT_PARAMS if name in checkpoint and checkpoint[name] != getattr(self, name)]
+        if mismatched:
+            raise ValueError(
+                f"Checkpoint {self.checkpoint_path} was created with different parameters: {', '.join(mismatched)}"
+            )
+        self.completed = checkpoint.get("completed", {})
+        logger.info("Resuming backfill %s: %d/%d units already done", self.job_id, len(self.completed), len(self.units),
+                    extra={"job_id": self.job_id})
+
+    async def _save_checkpoint(self, force: bool = False):
+        """
+        チェックポイントを書き出す（CHECKPOINT_INTERVAL 単位または CHECKPOINT_SECONDS 秒ごと、force=True で常に）
+        シリアライズとファイル書き込みはスレッドで実行し、イベントループを止めない
+        """
+        self._unsaved_units += 1
+        if not force:
+            due = (self._unsaved_units >= CHECKPOINT_INTERVAL
+                   or time.monotonic() - self._saved_at >= CHECKPOINT_SECONDS)
+            if not due or self._save_lock.locked():
+                return
+        async with self._save_lock:
+            self._unsaved_units = 0
+            self._saved_at = time.monotonic()
+            checkpoint = {
+                "job_id": self.job_id,
+                "device_ids": self.device_ids,
+                "start_date": self.start_date,
+                "end_date": self.end_date,
+                "start_block": self.start_block,
+                "end_block": self.end_block,
+                "completed": dict(self.completed),
+                "failed": dict(self.failed),
+                "updated_at": datetime.now().isoformat()
+            }
+            await asyncio.to_thread(self._write_checkpoint, checkpoint)
+
+    def _write_checkpoint(self, checkpoint: Dict[str, Any]):
+        """一時ファイル経由で置き換え"""
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def progress(self) -> Dict[str, Any]:
+        """進捗・スループット・ETA"""
+        now = self.finished_at or time.monotonic()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        done = len(self.completed)
+        remaining = len(self.units) - done
+        blocks_per_sec = self.blocks_this_run / elapsed if elapsed > 0 else 0.0
+        units_per_sec = self.units_this_run / elapsed if elapsed > 0 else 0.0
+        eta = remaining / units_per_sec if units_per_sec > 0 and self.status == "running" else None
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "units_total": len(self.units),
+            "units_completed": done,
+            "units_failed": len(self.failed),
+            "units_remaining": remaining,
+            "blocks_processed": sum(self.completed.values()),
+            "elapsed_seconds": round(elapsed, 1),
+            "blocks_per_second": round(blocks_per_sec, 2),
+            "units_per_second": round(units_per_sec, 3),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "checkpoint_path": self.checkpoint_path
+        }
+
+    async def _process_unit(self, device_id: str, date: str):
+        key = self.unit_key(device_id, date)
+        try:
+            result = await process_day_v3(
+                self.supabase_client, device_id, date, self.start_block, self.end_block
+            )
+            if not result.get("dashboard_saved"):
+                raise RuntimeError("dashboard save failed")
+            self.completed[key] = result.get("processed_count", 0)
+            self.failed.pop(key, None)
+            self.blocks_this_run += self.completed[key]
+            self.units_this_run += 1
+        except Exception as e:
+            logger.warning("Backfill unit failed: %s", e,
+                           extra={"job_id": self.job_id, "device_id": device_id, "date": date})
+            self.failed[key] = str(e)
+        await self._save_checkpoint()
+
+        progress = self.progress()
+        logger.info("Backfill progress %d/%d units", progress["units_completed"], progress["units_total"], extra={
+            "job_id": self.job_id,
+            "blocks_per_second": progress["blocks_per_second"],
+            "eta_seconds": progress["eta_seconds"],
+        })
+
+    async def run(self) -> Dict[str, Any]:
+        """未完了の単位を同時実行数・レート制限付きで処理"""
+        pending = [
+            (device_id, date) for device_id, date in self.units
+            if self.unit_key(device_id, date) not in self.completed
+        ]
+        self.status = "running"
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for unit in pending:
+            queue.put_nowait(unit)
+        limiter = RateLimiter(self.rate)
+
+        async def worker():
+            while True:
+                try:
+                    device_id, date = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await limiter.acquire()
+                await self._process_unit(device_id, date)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)) or 1)))
+            self.status = "completed" if not self.failed else "completed_with_errors"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        finally:
+            self.finished_at = time.monotonic()
+            await self._save_checkpoint(force=True)
+
+        return self.progress()
+
+
+# 管理エンドポイントから起動したジョブ（job_id → ジョブ）
+# 終了したジョブは非同期モードのジョブ（jobs.py）と同じく JOB_RESULT_TTL 秒・最大 JOB_MAX_RETAINED 件保持
+backfill_jobs: Dict[str, BackfillJob] = {}
+
+
+def expire_backfill_jobs():
+    """保持期間を過ぎた（または保持数の上限を超えた）終了済みのジョブを終了が古いものから削除"""
+    result_ttl = float(os.getenv("JOB_RESULT_TTL", DEFAULT_RESULT_TTL))
+    max_retained = int(os.getenv("JOB_MAX_RETAINED", DEFAULT_MAX_RETAINED))
+    now = time.monotonic()
+    finished = sorted(
+        (job for job in backfill_jobs.values() if job.finished_at is not None and job.status != "running"),
+        key=lambda job: job.finished_at
+    )
+    excess = len(backfill_jobs) - max_retained
+    for job in finished:
+        if excess <= 0 and now - job.finished_at <= result_ttl:
+            break
+        del backfill_jobs[job.job_id]
+        excess -= 1
+
+
+def start_backfill_job(supabase_client, device_ids: List[str], start_date: str, end_date: str,
+                       **options) -> BackfillJob:
+    """
+    バックフィルジョブをバックグラウンドタスクとして開始
+    同じjob_idを指定すると、そのチェックポイントから再開する
+    """
+    job_id = options.get("job_id")
+    if job_id and job_id in backfill_jobs and backfill_jobs[job_id].status == "running":
+        raise ValueError(f"Backfill job {job_id} is already running")
+
+    job = BackfillJob(supabase_client, device_ids, start_date, end_date, **options)
+    backfill_jobs[job.job_id] = job
+    expire_backfill_jobs()
+    # 開始したリクエストのコンテキスト（トレース）を引き継がないよう空のコンテキストで実行
+    job.task = asyncio.create_task(job.run(), context=contextvars.Context())
+    return job
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="タイムブロックプロンプトのバックフィル")
+    parser.add_argument("--devices", required=True, help="デバイスIDのカンマ区切りリスト")
+    parser.add_argument("--start-date", required=True, help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("--end-date", required=True, help="終了日 (YYYY-MM-DD、含む)")
+    parser.add_argument("--start-block", default=None, help="開始タイムブロック (例: 00-00)")
+    parser.add_argument("--end-block", default=None, help="終了タイムブロック (例: 23-30)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時に処理する単位数")
+    parser.add_argument("--rate", type=float, default=None, help="1秒あたりに開始する単位数の上限")
+    parser.add_argument("--checkpoint", default=None, help="チェックポイントファイル（既存なら続きから再開）")
+    parser.add_argument("--job-id", default=None, help="ジョブID（チェックポイントファイル名の既定値に使用）")
+    args = parser.parse_args()
+
+    from data_access import create_client_from_env
+    from log_config import setup_logging
+
+    # CLIでは既定で読みやすいテキスト形式
+    setup_logging(fmt=os.getenv("LOG_FORMAT", "text"))
+
+    async def run():
+        client = create_client_from_env()
+        try:
+            job = BackfillJob(
+                client,
+                [device_id.strip() for device_id in args.devices.split(",") if device_id.strip()],
+                args.start_date,
+                args.end_date,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                checkpoint_path=args.checkpoint,
+                start_block=args.start_block,
+                end_block=args.end_block,
+                job_id=args.job_id,
+            )
+            return await job.run()
+        finally:
+            await client.aclose()
+
+    result = asyncio.run(run())
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
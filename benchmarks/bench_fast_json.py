@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSONデコード・エンコードのマイクロベンチマーク
+==============================================
+- 1ブロック分の selected_features_timeline（JSON文字列）のデコード: json.loads と fast_json.loads
+- 通常の文字列のtranscription: json.loads を試みる場合と事前判定でスキップする場合
+- 1日分（48ブロック、プロンプト本文付き）のレスポンス: FastAPI既定（jsonable_encoder + JSONResponse）と
+  FastJSONResponse の直接エンコード
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import fast_json
+
+
+def make_timeline_json(seconds: int = 60) -> str:
+    """emotion_opensmile.selected_features_timeline と同じ形のJSON文字列"""
+    return json.dumps([
+        {
+            "timestamp": f"10:30:{second:02d}",
+            "features": {
+                "Loudness_sma3": 0.1 + second * 0.013,
+                "jitterLocal_sma3nz": 0.0 if second % 4 == 0 else 0.01 + second * 0.0002,
+                "F0semitoneFrom27.5Hz_sma3nz": 30.5 + second * 0.1,
+                "shimmerLocaldB_sma3nz": 1.2 + second * 0.01,
+            },
+        }
+        for second in range(seconds)
+    ])
+
+
+def make_day_response(prompt_length: int = 3000) -> dict:
+    """/generate-timeblock-prompts-day?include_prompts=true 相当のレスポンス"""
+    prompt = ("観測対象者は午前中に家族と会話している。" * (prompt_length // 20 + 1))[:prompt_length]
+    return {
+        "status": "success",
+        "version": "v3-improved",
+        "device_id": "9f7d6e27-98c3-4c19-bdfb-f7fda58b9a93",
+        "date": "2025-09-15",
+        "processed_count": 48,
+        "skipped_count": 0,
+        "dashboard_saved": True,
+        "results": {
+            f"{hour:02d}-{minute}": {
+                "status": "success",
+                "prompt_length": len(prompt),
+                "has_transcription": True,
+                "has_sed_data": True,
+                "has_opensmile_data": True,
+                "sed_events_count": 20,
+                "opensmile_seconds": 60,
+                "prompt": prompt,
+                "dashboard_saved": True,
+                "status_updates": {"whisper_updated": True, "yamnet_updated": True, "opensmile_updated": True},
+            }
+            for hour in range(24) for minute in ["00", "30"]
+        },
+    }
+
+
+def bench(label: str, func, iterations: int) -> float:
+    """1回あたりのマイクロ秒を返す"""
+    func()  # ウォームアップ
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call_us = (time.perf_counter() - started) / iterations * 1e6
+    print(f"  {label:<52} {per_call_us:10.1f} µs")
+    return per_call_us
+
+
+def try_json_loads(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text.strip()
+
+
+def precheck_then_loads(text: str):
+    if not fast_json.may_be_json(text):
+        return text.strip()
+    try:
+        return fast_json.loads(text)
+    except fast_json.JSONDecodeError:
+        return text.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONデコード・エンコードのマイクロベンチマーク")
+    parser.add_argument("-n", "--iterations", type=int, default=2000, help="繰り返し回数")
+    args = parser.parse_args()
+    n = args.iterations
+
+    print(f"backend: {'orjson' if fast_json.orjson is not None else 'json'}  iterations: {n}")
+
+    timeline_json = make_timeline_json()
+    print(f"decode selected_features_timeline (per block, {len(timeline_json)} bytes):")
+    bench("json.loads", lambda: json.loads(timeline_json), n)
+    bench("fast_json.loads", lambda: fast_json.loads(timeline_json), n)
+
+    transcription = "きょうは公園でブランコに乗ったよ。すべり台もやった。" * 4
+    print("plain-text transcription (per block):")
+    bench("json.loads + JSONDecodeError", lambda: try_json_loads(transcription), n * 10)
+    bench("may_be_json precheck", lambda: precheck_then_loads(transcription), n * 10)
+
+    day = make_day_response()
+    print("encode day response (48 blocks with prompts):")
+    bench("jsonable_encoder + JSONResponse", lambda: JSONResponse(jsonable_encoder(day)).body, n // 10 or 1)
+    bench("FastJSONResponse", lambda: fast_json.FastJSONResponse(day).body, n // 10 or 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OpenSMILE時系列のマイクロベンチマーク
+======================================
+1日分（48ブロック × 60秒）のOpenSMILEデータについて、
+- 辞書のリストのまま保持した場合と OpenSmileTimeline（array('d')列）に変換した場合のメモリ量
+- 両プロンプト生成関数に辞書のリスト / OpenSmileTimeline を渡した場合の1日分の生成時間
+を計測する
+
+変更前との比較は bench_prompt_templates.py と同様に --src で変更前のツリーを指定する
+（変更前のツリーでは辞書のリストのみ計測）
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_day_records(seconds: int = 60):
+    """48ブロック分の selected_features_timeline（辞書のリスト）"""
+    return [
+        [
+            {
+                "timestamp": f"{block // 2:02d}:{(block % 2) * 30:02d}:{second:02d}",
+                "features": {
+                    "Loudness_sma3": 0.1 + ((block * 7 + second) % 13) * 0.03,
+                    "jitterLocal_sma3nz": 0.0 if (block + second) % 4 == 0 else 0.01 + second * 0.0002,
+                },
+            }
+            for second in range(seconds)
+        ]
+        for block in range(48)
+    ]
+
+
+def measure_memory(build) -> int:
+    """build() が返すオブジェクトを保持した状態で確保されているバイト数"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    obj = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del obj
+    return size
+
+
+def bench_day(label: str, generate, day_inputs, repeat: int) -> float:
+    """1日分（48ブロック）の生成を repeat 回行い、1ブロックあたりのマイクロ秒を返す"""
+    for data in day_inputs:  # ウォームアップ
+        generate(data)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for data in day_inputs:
+            generate(data)
+    per_block_us = (time.perf_counter() - started) / (repeat * len(day_inputs)) * 1e6
+    print(f"  {label:<48} {per_block_us:9.1f} µs/block")
+    return per_block_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenSMILE時系列のマイクロベンチマーク")
+    parser.add_argument("--src", default=ROOT, help="生成関数をimportするソースツリー（既定: このリポジトリ）")
+    parser.add_argument("-r", "--repeat", type=int, default=200, help="1日分の生成を繰り返す回数")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SUPABASE_URL", "http://localhost")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    sys.path.insert(0, os.path.abspath(args.src))
+
+    timeblock_endpoint = importlib.import_module("timeblock_endpoint")
+    timeblock_endpoint_v2 = importlib.import_module("timeblock_endpoint_v2")
+    try:
+        opensmile_timeline = importlib.import_module("opensmile_timeline")
+    except ImportError:
+        opensmile_timeline = None
+
+    day_records = make_day_records()
+    print(f"source: {os.path.abspath(args.src)}  repeat: {args.repeat} days")
+
+    print("memory (1 day held in memory):")
+    print(f"  {'list of dicts':<48} {measure_memory(make_day_records) / 1024:9.1f} KiB")
+    if opensmile_timeline is not None:
+        from_records = opensmile_timeline.OpenSmileTimeline.from_records
+        print(f"  {'OpenSmileTimeline':<48} "
+              f"{measure_memory(lambda: [from_records(records) for records in day_records]) / 1024:9.1f} KiB")
+
+    def v1(data):
+        return timeblock_endpoint.generate_timeblock_prompt(None, None, "10-30", "2025-09-15", None, data)
+
+    def v2(data):
+        return timeblock_endpoint_v2.generate_timeblock_prompt_v2(None, None, "10-30", "2025-09-15", None, data)
+
+    print("render:")
+    bench_day("generate_timeblock_prompt (list)", v1, day_records, args.repeat)
+    bench_day("generate_timeblock_prompt_v2 (list)", v2, day_records, args.repeat)
+    if opensmile_timeline is not None:
+        day_timelines = [opensmile_timeline.OpenSmileTimeline.from_records(records) for records in day_records]
+        bench_day("generate_timeblock_prompt (OpenSmileTimeline)", v1, day_timelines, args.repeat)
+        bench_day("generate_timeblock_prompt_v2 (OpenSmileTimeline)", v2, day_timelines, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+プロンプト生成のマイクロベンチマーク
+====================================
+generate_timeblock_prompt / generate_timeblock_prompt_v2 / generate_daily_summary_prompt を
+同じ入力で N 回（既定 10,000 回）生成し、1回あたりのコストを計測する
+
+変更前との比較は、変更前のコミットを別ディレクトリに展開して --src で指定する:
+    git worktree add /tmp/before <変更前のコミット>
+    python benchmarks/bench_prompt_templates.py --src /tmp/before
+    python benchmarks/bench_prompt_templates.py
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_fixtures():
+    """実データに近いサイズの入力（発話・YAMNet・OpenSMILE 60秒・1日分のタイムライン）"""
+    transcription = "きょうは公園でブランコに乗ったよ。すべり台もやった。" * 4
+    sed_labels = ["Speech", "Child speech, kid speaking", "Music", "Television", "Laughter",
+                  "Noise", "Dishes, pots, and pans", "Door", "Footsteps", "Silence"]
+    sed_data = [{"label": sed_labels[i % len(sed_labels)], "prob": round(0.95 - i * 0.04, 3)} for i in range(20)]
+    opensmile_data = [
+        {
+            "timestamp": f"10:30:{second:02d}",
+            "features": {
+                "Loudness_sma3": 0.2 + (second % 7) * 0.05,
+                "jitterLocal_sma3nz": 0.0 if second % 3 == 0 else 0.012 + second * 0.0001,
+            },
+        }
+        for second in range(60)
+    ]
+    subject_info = {"name": "太郎", "age": 5, "gender": "男性", "notes": "保育園に通っている"}
+    timeline = [
+        {
+            "time_block": f"{hour:02d}-{minute}",
+            "summary": "家族と朝食をとりながら楽しそうに会話している。" if hour % 3 else "静かに過ごしている。",
+            "vibe_score": (hour * 7 + (30 if minute == "30" else 0)) % 120 - 50,
+        }
+        for hour in range(24) for minute in ["00", "30"]
+    ][:30]
+    statistics = {"avg_vibe_score": 12.5, "positive_blocks": 10, "negative_blocks": 5,
+                  "neutral_blocks": 15, "total_blocks": len(timeline)}
+    return transcription, sed_data, opensmile_data, subject_info, timeline, statistics
+
+
+def bench(label: str, func, iterations: int) -> float:
+    """1回あたりのマイクロ秒を返す"""
+    func()  # ウォームアップ
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call_us = (time.perf_counter() - started) / iterations * 1e6
+    print(f"  {label:<40} {per_call_us:9.1f} µs/render")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロンプト生成のマイクロベンチマーク")
+    parser.add_argument("--src", default=ROOT, help="生成関数をimportするソースツリー（既定: このリポジトリ）")
+    parser.add_argument("-n", "--iterations", type=int, default=10000, help="生成回数")
+    args = parser.parse_args()
+
+    # main.py はimport時に環境変数を参照しないが、念のためダミーを設定
+    os.environ.setdefault("SUPABASE_URL", "http://localhost")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    sys.path.insert(0, os.path.abspath(args.src))
+
+    timeblock_endpoint = importlib.import_module("timeblock_endpoint")
+    timeblock_endpoint_v2 = importlib.import_module("timeblock_endpoint_v2")
+    main_module = importlib.import_module("main")
+
+    transcription, sed_data, opensmile_data, subject_info, timeline, statistics = make_fixtures()
+    date = "2025-09-15"
+
+    print(f"source: {os.path.abspath(args.src)}  iterations: {args.iterations}")
+    bench("generate_timeblock_prompt", lambda: timeblock_endpoint.generate_timeblock_prompt(
+        transcription, sed_data, "10-30", date, subject_info, opensmile_data), args.iterations)
+    bench("generate_timeblock_prompt_v2", lambda: timeblock_endpoint_v2.generate_timeblock_prompt_v2(
+        transcription, sed_data, "10-30", date, subject_info, opensmile_data), args.iterations)
+    bench("generate_daily_summary_prompt", lambda: main_module.generate_daily_summary_prompt(
+        "device", date, timeline, statistics, "14-30", subject_info), args.iterations)
+
+    # テンプレート単体: コンパイル済みのrender と 毎回パースする str.format の比較
+    template = getattr(main_module, "DAILY_SUMMARY_PROMPT", None)
+    if template is not None:
+        values = dict(subject_description="5歳の男性", date=date, weekday="月曜日", day_context="祝日（敬老の日）",
+                      season="秋", hour=14, minute=30, holiday_notice="", total_blocks=30,
+                      timeline_text="[10:30]  +20 | 楽しそうに遊んでいる", burst_events_text="", time_context="午後")
+        bench("DAILY_SUMMARY_PROMPT.render", lambda: template.render(**values), args.iterations)
+        bench("str.format(DAILY_SUMMARY_PROMPT.source)", lambda: template.source.format(**values), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SEDイベント要約のマイクロベンチマーク
+======================================
+1ブロック分のYAMNetイベントについて、変更前の処理（確率順の全件ソート2回 + ラベルの部分文字列走査）と
+sed_summary.summarize_sed_events（語彙の整数ID + 1パス集計 + top-k選択）を比較する
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sed_summary import YAMNET_LABELS, summarize_sed_events
+
+
+def make_events(count: int, seed: int = 0):
+    """YAMNetの出力と同程度の件数・確率分布のイベント"""
+    rng = random.Random(seed)
+    return [{"label": rng.choice(YAMNET_LABELS[1:]), "prob": round(rng.random() ** 3, 4)} for _ in range(count)]
+
+
+def legacy_summary(sed_data):
+    """変更前の generate_timeblock_prompt と同じ集計（統計用と詳細表示用に2回ソート）"""
+    sorted_events = sorted(sed_data, key=lambda x: x.get('prob', 0), reverse=True)
+    high_prob_events = [e for e in sorted_events if e.get('prob', 0) >= 0.7]
+    mid_prob_events = [e for e in sorted_events if 0.4 <= e.get('prob', 0) < 0.7]
+    speech_prob = next((e.get('prob', 0) * 100 for e in sorted_events if 'Speech' in e.get('label', '')), 0)
+    has_child_voice = any('Child' in e.get('label', '') or 'Baby' in e.get('label', '') for e in sorted_events[:20])
+    has_noise = any('Noise' in e.get('label', '') for e in sorted_events[:10])
+    activity_diversity = len([e for e in sorted_events[:20] if e.get('prob', 0) > 0.3])
+    sorted_events = sorted(sed_data, key=lambda x: x.get('prob', 0), reverse=True)
+    top_events = [(e.get('label', 'Unknown'), e.get('prob', 0)) for e in sorted_events[:20]]
+    return (len(sed_data), len(high_prob_events), len(mid_prob_events), speech_prob,
+            has_child_voice, has_noise, activity_diversity, top_events)
+
+
+def bench(label: str, func, iterations: int) -> float:
+    func()  # ウォームアップ
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call_us = (time.perf_counter() - started) / iterations * 1e6
+    print(f"  {label:<32} {per_call_us:9.1f} µs/block")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SEDイベント要約のマイクロベンチマーク")
+    parser.add_argument("-n", "--iterations", type=int, default=5000, help="繰り返し回数")
+    args = parser.parse_args()
+
+    for count in (20, 100, 521):
+        events = make_events(count)
+        assert tuple(summarize_sed_events(events)) == legacy_summary(events)
+        print(f"{count} events:")
+        bench("legacy (sort x2 + scans)", lambda: legacy_summary(events), args.iterations)
+        bench("summarize_sed_events", lambda: summarize_sed_events(events), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ベンチマーク用の合成データ
+==========================
+本番のSupabaseと同じ形のレコードを乱数シードから再現可能に生成する
+
+- vibe_whisper: 発話あり・発話なし（空文字列）・レコードなしが混在する1日48ブロック
+- behavior_yamnet: 1ブロックあたり10〜80件のYAMNetイベント（label / prob）
+- emotion_opensmile: 1ブロック60秒の selected_features_timeline（JSONBをパースした辞書のリスト）
+- devices / subjects: 観測対象者情報
+- dashboard: summary と vibe_score が入った分析済みブロック（/generate-dashboard-summary 用）
+
+このモジュールはリポジトリのモジュールをimportしない（--src で変更前のツリーを計測するため）
+
+フェイクバックエンド（SUPABASE_BACKEND=fake）の初期データとしてJSONファイルに書き出す:
+    python benchmarks/fixtures.py --devices 20 -o /tmp/fake_data.json
+"""
+
+import json
+import random
+import argparse
+from typing import Any, Dict, List, Optional
+
+
+TIME_BLOCKS = [f"{hour:02d}-{minute:02d}" for hour in range(24) for minute in (0, 30)]
+
+SENTENCES = [
+    "きょうは公園でブランコに乗ったよ。",
+    "ごはんまだ？おなかすいた。",
+    "ママ、これ見て！すごいでしょ。",
+    "もう一回やりたい。",
+    "テレビ消して、宿題やるから。",
+    "おやすみなさい。",
+    "それでね、先生がね、明日は遠足だって。",
+    "いやだ、まだ遊びたい。",
+]
+
+SED_LABELS = [
+    "Speech", "Child speech, kid speaking", "Conversation", "Babbling", "Male speech, man speaking",
+    "Female speech, woman speaking", "Laughter", "Baby laughter", "Crying, sobbing", "Singing",
+    "Music", "Television", "Silence", "Noise", "Environmental noise", "White noise",
+    "Inside, small room", "Vehicle", "Walk, footsteps", "Door", "Dishes, pots, and pans",
+    "Water tap, faucet", "Typing", "Dog", "Bird", "Rain", "Air conditioning", "Mechanical fan",
+]
+
+SUMMARIES = [
+    "静かに過ごしている。", "家族と会話して楽しそう。", "遊びに夢中になっている。",
+    "少し機嫌が悪く泣いている。", "テレビを見ながらくつろいでいる。", "",
+]
+
+VIBE_SCORES = [None, -80, -35, -10, 0, 5, 10, 25, 40, 60, 90]
+
+
+def make_transcription(rng: random.Random) -> str:
+    """1ブロック分の発話テキスト（約2割は発話なしの空文字列）"""
+    if rng.random() < 0.2:
+        return ""
+    return "".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 8)))
+
+
+def make_sed_events(rng: random.Random, count: Optional[int] = None) -> List[Dict[str, Any]]:
+    """behavior_yamnet.events と同じ形のイベントリスト"""
+    if count is None:
+        count = rng.randint(10, 80)
+    return [{"label": rng.choice(SED_LABELS), "prob": round(rng.random() ** 3, 4)} for _ in range(count)]
+
+
+def make_opensmile_records(rng: random.Random, block: str, seconds: int = 60) -> List[Dict[str, Any]]:
+    """emotion_opensmile.selected_features_timeline と同じ形の1秒ごとの特徴量"""
+    hour, minute = block.split("-")
+    speaking = rng.random()
+    return [
+        {
+            "timestamp": f"{hour}:{minute}:{second:02d}",
+            "features": {
+                "Loudness_sma3": round(rng.uniform(0.05, 1.2), 4),
+                "jitterLocal_sma3nz": round(rng.uniform(0.005, 0.05), 4) if rng.random() < speaking else 0.0,
+                "F0semitoneFrom27.5Hz_sma3nz": round(rng.uniform(20.0, 45.0), 3),
+                "shimmerLocaldB_sma3nz": round(rng.uniform(0.5, 2.5), 3),
+            },
+        }
+        for second in range(seconds)
+    ]
+
+
+def make_subject(rng: random.Random, subject_id: str) -> Dict[str, Any]:
+    return {
+        "subject_id": subject_id,
+        "name": f"subject-{subject_id[:8]}",
+        "age": rng.randint(3, 12),
+        "gender": rng.choice(["男性", "女性"]),
+        "avatar_url": None,
+        "notes": rng.choice(["元気", "人見知り", ""]),
+        "prefecture": "東京都",
+        "city": "渋谷区",
+    }
+
+
+def device_ids(count: int) -> List[str]:
+    """UUID形式の決定的なデバイスID"""
+    return [f"{index:08x}-0000-4000-8000-{index:012x}" for index in range(1, count + 1)]
+
+
+class InputPools:
+    """
+    SEDイベント・OpenSMILE時系列の候補（デバイス数を増やしてもメモリ量が一定になるよう各ブロックで使い回す）
+    行はこれらのリストを共有する（アプリ側は読み取りのみ）
+    """
+
+    def __init__(self, rng: random.Random, sed_variants: int = 256, opensmile_variants: int = 2):
+        self.sed_events = [make_sed_events(rng) for _ in range(sed_variants)]
+        self.opensmile = {
+            block: [make_opensmile_records(rng, block) for _ in range(opensmile_variants)] for block in TIME_BLOCKS
+        }
+
+
+def make_day(rng: random.Random, device_id: str, date: str, pools: InputPools,
+             coverage: float = 0.9, analyzed: float = 0.8) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    1デバイス1日分の各テーブルのレコード
+
+    Args:
+        pools: SEDイベント・OpenSMILE時系列の候補
+        coverage: 録音・解析済みのブロックの割合（それ以外はレコードなし）
+        analyzed: dashboardに分析結果（summary / vibe_score）があるブロックの割合
+    """
+    tables: Dict[str, List[Dict[str, Any]]] = {
+        "vibe_whisper": [], "behavior_yamnet": [], "emotion_opensmile": [], "dashboard": []
+    }
+    for block in TIME_BLOCKS:
+        key = {"device_id": device_id, "date": date, "time_block": block}
+        if rng.random() < coverage:
+            tables["vibe_whisper"].append({**key, "transcription": make_transcription(rng), "status": "pending"})
+            tables["behavior_yamnet"].append({**key, "events": rng.choice(pools.sed_events), "status": "pending"})
+            tables["emotion_opensmile"].append({
+                **key, "selected_features_timeline": rng.choice(pools.opensmile[block]), "status": "pending"
+            })
+        if rng.random() < analyzed:
+            tables["dashboard"].append({
+                **key, "summary": rng.choice(SUMMARIES), "vibe_score": rng.choice(VIBE_SCORES), "status": "completed"
+            })
+    return tables
+
+
+def make_dataset(devices: int = 4, dates: Optional[List[str]] = None, seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    複数デバイス・複数日の全テーブルのレコード（テーブル名 → 行のリスト）
+    同じ引数からは常に同じデータが生成される
+    """
+    rng = random.Random(seed)
+    pools = InputPools(rng)
+    dates = dates or ["2025-09-15", "2025-09-16"]
+    tables: Dict[str, List[Dict[str, Any]]] = {
+        "vibe_whisper": [], "behavior_yamnet": [], "emotion_opensmile": [], "dashboard": [],
+        "devices": [], "subjects": [], "dashboard_summary": [], "vibe_whisper_prompt": [],
+    }
+    for index, device_id in enumerate(device_ids(devices)):
+        subject_id = f"5{index:07x}-0000-4000-8000-{index:012x}"
+        tables["subjects"].append(make_subject(rng, subject_id))
+        tables["devices"].append({"device_id": device_id, "subject_id": subject_id})
+        for date in dates:
+            for table, rows in make_day(rng, device_id, date, pools).items():
+                tables[table].extend(rows)
+    return tables
+
+
+def make_timeline(rng: random.Random, blocks: int = 48) -> List[Dict[str, Any]]:
+    """generate_daily_summary_prompt / detect_burst_events に渡すタイムライン（summary と vibe_score）"""
+    return [
+        {"time_block": block, "summary": rng.choice(SUMMARIES), "vibe_score": rng.choice(VIBE_SCORES)}
+        for block in TIME_BLOCKS[:blocks]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成データをJSONファイルに書き出す（FAKE_SUPABASE_DATA 用）")
+    parser.add_argument("--devices", type=int, default=4, help="デバイス数")
+    parser.add_argument("--dates", default="2025-09-15,2025-09-16", help="日付のカンマ区切りリスト")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("-o", "--output", required=True, help="出力先のJSONファイル")
+    args = parser.parse_args()
+
+    tables = make_dataset(devices=args.devices, dates=args.dates.split(","), seed=args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(tables, f, ensure_ascii=False)
+    print(f"saved: {args.output} ({', '.join(f'{name}={len(rows)}' for name, rows in tables.items())})")
+
+
+if __name__ == "__main__":
+    main()
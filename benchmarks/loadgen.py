@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+負荷試験
+========
+指定した同時実行数・リクエストの比率で、多数の合成デバイス・日付に対してエンドポイントを呼び出し、
+エンドポイントごとのスループット・レイテンシ（p50/p95/p99）・エラー率とイベントループの遅延を集計する
+
+実行方法:
+- インプロセス（既定）: ASGI経由でアプリを直接呼び出す。バックエンドはフェイク（fake_supabase.py）
+  イベントループの遅延はアプリ自身のCPU処理による遅延（1ワーカーの容量の目安）
+- --url: 起動済みのサーバー（uvicorn / docker）に対してHTTPで呼び出す
+  サーバー側は同じ合成データのフェイクで起動する（イベントループの遅延は負荷生成側のもの）
+
+使用例:
+    # インプロセス、同時16リクエストで30秒、クエリあたり中央値5msのレイテンシ
+    python benchmarks/loadgen.py -c 16 -d 30 --latency lognormal:5:0.5
+
+    # リクエストの比率を指定（重み）
+    python benchmarks/loadgen.py --mix timeblock=6,summary=3,mood=1
+
+    # ローカルのuvicornに対して実行
+    python benchmarks/fixtures.py --devices 50 -o /tmp/fake_data.json
+    SUPABASE_BACKEND=fake FAKE_SUPABASE_DATA=/tmp/fake_data.json FAKE_SUPABASE_LATENCY=lognormal:5:0.5 \\
+        gunicorn -c gunicorn.conf.py main:app
+    python benchmarks/loadgen.py --url http://localhost:8009 --devices 50 -c 32 -d 60
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import contextlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+
+import fixtures
+
+
+# リクエストの種類 → パス
+ENDPOINTS = {
+    "timeblock": "/generate-timeblock-prompt",
+    "summary": "/generate-dashboard-summary",
+    "mood": "/generate-mood-prompt-supabase",
+    "day": "/generate-timeblock-prompts-day",
+}
+
+DEFAULT_MIX = "timeblock=6,summary=3,mood=1"
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'timeblock=6,summary=3,mood=1' → 種類ごとの重み"""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name} (expected one of {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """ソート済みの値の百分位（最近傍）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(values_ms: List[float]) -> Dict[str, float]:
+    values = sorted(values_ms)
+    return {
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+
+class RequestFactory:
+    """合成データのデバイス・日付・タイムブロックからリクエストのパラメータを作る"""
+
+    def __init__(self, dataset: Dict[str, List[Dict]], mix: Dict[str, float], seed: int, force: bool):
+        self.rng = random.Random(seed)
+        self.blocks = [(row["device_id"], row["date"], row["time_block"]) for row in dataset["vibe_whisper"]]
+        self.days = sorted({(device_id, date) for device_id, date, _ in self.blocks})
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.force = force
+
+    def next(self) -> Tuple[str, Dict[str, str]]:
+        name = self.rng.choices(self.names, self.weights)[0]
+        if name == "timeblock":
+            device_id, date, time_block = self.rng.choice(self.blocks)
+            params = {"device_id": device_id, "date": date, "time_block": time_block}
+            if self.force:
+                params["force"] = "true"
+            return name, params
+        device_id, date = self.rng.choice(self.days)
+        return name, {"device_id": device_id, "date": date}
+
+
+class LoadResult:
+    """リクエストの種類ごとのレイテンシとエラー"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.status_codes: Dict[str, Dict[int, int]] = {name: {} for name in ENDPOINTS}
+        self.loop_lag_ms: List[float] = []
+
+    def record(self, name: str, elapsed_ms: float, status_code: Optional[int]):
+        self.latencies[name].append(elapsed_ms)
+        codes = self.status_codes[name]
+        codes[status_code or 0] = codes.get(status_code or 0, 0) + 1
+        if status_code is None or not 200 <= status_code < 300:
+            self.errors[name] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            endpoints[name] = {
+                "path": ENDPOINTS[name],
+                "requests": len(latencies),
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(latencies), 4),
+                "status_codes": {str(code): count for code, count in sorted(self.status_codes[name].items())},
+                **latency_summary(latencies),
+            }
+        all_latencies = [value for latencies in self.latencies.values() for value in latencies]
+        total_errors = sum(self.errors.values())
+        return {
+            "total": {
+                "requests": len(all_latencies),
+                "throughput_rps": round(len(all_latencies) / elapsed, 2),
+                "errors": total_errors,
+                "error_rate": round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+                **latency_summary(all_latencies),
+            },
+            "endpoints": endpoints,
+            "event_loop_lag": {
+                "samples": len(self.loop_lag_ms),
+                **latency_summary(self.loop_lag_ms),
+            },
+        }
+
+
+async def monitor_loop_lag(result: LoadResult, interval: float = 0.01):
+    """interval秒のsleepが予定より遅れて再開した時間（イベントループがブロックされていた時間）を記録"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        result.loop_lag_ms.append(max(0.0, (loop.time() - started - interval) * 1000))
+
+
+async def worker(client: httpx.AsyncClient, factory: RequestFactory, result: LoadResult,
+                 deadline: float, remaining: Optional[List[int]]):
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        name, params = factory.next()
+        started = time.perf_counter()
+        try:
+            response = await client.get(ENDPOINTS[name], params=params)
+            status_code = response.status_code
+        except httpx.HTTPError:
+            status_code = None
+        result.record(name, (time.perf_counter() - started) * 1000, status_code)
+
+
+async def run_load(client: httpx.AsyncClient, factory: RequestFactory, concurrency: int,
+                   duration: float, requests: Optional[int], warmup: int) -> Tuple[LoadResult, float]:
+    # ウォームアップ（import・キャッシュの初回構築を計測から除く）
+    for _ in range(warmup):
+        name, params = factory.next()
+        await client.get(ENDPOINTS[name], params=params)
+
+    result = LoadResult()
+    monitor = asyncio.create_task(monitor_loop_lag(result))
+    remaining = [requests] if requests is not None else None
+    started = time.perf_counter()
+    deadline = started + duration if requests is None else float("inf")
+    await asyncio.gather(*(worker(client, factory, result, deadline, remaining) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    monitor.cancel()
+    return result, elapsed
+
+
+def create_client(args, dataset) -> Tuple[httpx.AsyncClient, Optional[Any]]:
+    """--url の場合はHTTPクライアント、それ以外はフェイクバックエンドに接続したアプリへのASGIクライアント"""
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        return httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout), None
+
+    os.environ.setdefault("SUPABASE_URL", "http://localhost")
+    os.environ.setdefault("SUPABASE_KEY", "loadgen")
+    sys.path.insert(0, ROOT)
+    from fake_supabase import FakeDataClient, parse_latency
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+    import log_config
+    # アプリのログは出力処理の負荷はそのままに出力先を捨てる（結果の表示と混ざらないように）
+    log_config.setup_logging(stream=open(os.devnull, "w"))
+
+    backend = FakeDataClient(dataset, latency=parse_latency(args.latency), error_rate=args.error_rate,
+                             timeout=args.timeout, seed=args.seed)
+    main.supabase_client = backend
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://loadgen",
+                               timeout=args.timeout)
+    return client, backend
+
+
+def print_report(report: Dict[str, Any]):
+    header = f"  {'endpoint':<34} {'reqs':>7} {'req/s':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    print(header + "   (ms)")
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, stats in rows:
+        label = stats.get("path", name)
+        print(f"  {label:<34} {stats['requests']:>7} {stats['throughput_rps']:>8.1f} {stats['error_rate'] * 100:>5.1f}% "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+    lag = report["event_loop_lag"]
+    print(f"  event loop lag: p50 {lag['p50_ms']:.1f} ms  p99 {lag['p99_ms']:.1f} ms  max {lag['max_ms']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エンドポイントの負荷試験（インプロセスまたはURL指定）")
+    parser.add_argument("--url", help="負荷をかけるサーバーのURL（省略時はインプロセスでASGI経由）")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同時リクエスト数")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="計測秒数")
+    parser.add_argument("-n", "--requests", type=int, help="リクエスト総数（指定時は --duration より優先）")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"リクエストの比率（{', '.join(ENDPOINTS)} の重み、既定: {DEFAULT_MIX}）")
+    parser.add_argument("--devices", type=int, default=20, help="合成デバイス数（1デバイス --days 日分）")
+    parser.add_argument("--days", type=int, default=2, help="1デバイスあたりの日数")
+    parser.add_argument("--no-force", action="store_true",
+                        help="/generate-timeblock-prompt を force なしで呼ぶ（入力が同一なら unchanged）")
+    parser.add_argument("--warmup", type=int, default=20, help="計測前のウォームアップのリクエスト数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--latency", help="インプロセス時のフェイクのレイテンシ分布（例: lognormal:5:0.5）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="インプロセス時のフェイクのエラー率")
+    parser.add_argument("--seed", type=int, default=0, help="合成データ・リクエスト選択の乱数シード")
+    parser.add_argument("--request-seed", type=int,
+                        help="リクエスト選択の乱数シード（既定: --seed。複数の負荷生成プロセスで別の順序にする場合）")
+    parser.add_argument("-o", "--output", help="結果のJSONの保存先")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    dates = [f"2025-09-{15 + day:02d}" for day in range(args.days)]
+    dataset = fixtures.make_dataset(devices=args.devices, dates=dates, seed=args.seed)
+    request_seed = args.seed if args.request_seed is None else args.request_seed
+    factory = RequestFactory(dataset, mix, request_seed, force=not args.no_force)
+    client, backend = create_client(args, dataset)
+
+    print(f"target: {args.url or 'in-process (ASGI + fake_supabase)'}  concurrency: {args.concurrency}  "
+          f"{'requests: ' + str(args.requests) if args.requests else f'duration: {args.duration:g}s'}  "
+          f"mix: {args.mix}  devices: {args.devices} x {args.days} days")
+
+    async def run():
+        try:
+            return await run_load(client, factory, args.concurrency, args.duration, args.requests, args.warmup)
+        finally:
+            await client.aclose()
+
+    # インプロセス時、アプリのprint出力は結果の表示と混ざらないように捨てる
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if backend is not None else sys.stdout):
+        result, elapsed = asyncio.run(run())
+
+    report = {
+        "meta": {
+            "target": args.url or "in-process",
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "mix": mix,
+            "devices": args.devices,
+            "days": args.days,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+        },
+        **result.report(elapsed),
+    }
+    if backend is not None:
+        report["backend"] = backend.stats()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ワーカー数のスケーリング計測
+============================
+gunicorn（gunicorn.conf.py、UvicornWorker）をフェイクバックエンドで1〜Nワーカー起動し、
+それぞれに同じ負荷（loadgen.py --url）をかけてスループットの伸び（1ワーカー比の倍率・効率）を計測する
+
+- 負荷生成側もPythonのため、--clients 個のloadgenプロセスで同時実行数を分担する
+  （負荷生成側がボトルネックにならないよう、サーバーのワーカー数以上のCPUコアがあるマシンで実行する）
+- フェイクのレイテンシ（--latency）はI/O待ちの代わり。CPU処理（プロンプト生成・集計）の比率が高いほどワーカー数の効果が大きい
+
+使用例:
+    # 1 / 2 / 4ワーカー、負荷生成4プロセス・同時64リクエストで各30秒
+    python benchmarks/scaling.py --workers 1,2,4 --clients 4 -c 64 -d 30 --latency lognormal:5:0.5 \\
+        -o benchmarks/results/scaling.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+
+import fixtures
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def wait_until_ready(url: str, timeout: float = 30.0):
+    """/health が200を返すまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not become ready: {url}")
+
+
+def start_server(args, workers: int, data_path: str, log_file) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SUPABASE_URL": "http://localhost",
+        "SUPABASE_KEY": "scaling",
+        "SUPABASE_BACKEND": "fake",
+        "FAKE_SUPABASE_DATA": data_path,
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(args.port),
+    }
+    if args.latency:
+        env["FAKE_SUPABASE_LATENCY"] = args.latency
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def run_clients(args, url: str, workdir: str, workers: int) -> List[Dict[str, Any]]:
+    """--clients 個のloadgenを同時に実行し、各プロセスの結果のJSONを返す"""
+    concurrency = max(1, args.concurrency // args.clients)
+    processes = []
+    for index in range(args.clients):
+        output = os.path.join(workdir, f"load-{workers}-{index}.json")
+        command = [
+            sys.executable, os.path.join(BENCH_DIR, "loadgen.py"), "--url", url,
+            "-c", str(concurrency), "-d", str(args.duration), "--mix", args.mix,
+            "--devices", str(args.devices), "--days", str(args.days),
+            "--seed", str(args.seed), "--request-seed", str(args.seed + index), "-o", output,
+        ]
+        processes.append((subprocess.Popen(command, stdout=subprocess.DEVNULL), output))
+    reports = []
+    for process, output in processes:
+        if process.wait() != 0:
+            raise RuntimeError(f"loadgen failed (exit {process.returncode})")
+        with open(output) as f:
+            reports.append(json.load(f))
+    return reports
+
+
+def aggregate(workers: int, reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """負荷生成プロセスごとの結果を合算（スループット・エラーは合計、レイテンシは最も遅いプロセスの値）"""
+    totals = [report["total"] for report in reports]
+    requests = sum(total["requests"] for total in totals)
+    errors = sum(total["errors"] for total in totals)
+    return {
+        "workers": workers,
+        "requests": requests,
+        "throughput_rps": round(sum(total["throughput_rps"] for total in totals), 2),
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "p50_ms": max(total["p50_ms"] for total in totals),
+        "p99_ms": max(total["p99_ms"] for total in totals),
+        "client_loop_lag_p99_ms": max(report["event_loop_lag"]["p99_ms"] for report in reports),
+    }
+
+
+def print_report(rows: List[Dict[str, Any]]):
+    print(f"  {'workers':>7} {'req/s':>9} {'speedup':>8} {'eff.':>6} {'err%':>6} {'p50':>8} {'p99':>8}   (ms)")
+    for row in rows:
+        print(f"  {row['workers']:>7} {row['throughput_rps']:>9.1f} {row['speedup']:>7.2f}x {row['efficiency'] * 100:>5.0f}% "
+              f"{row['error_rate'] * 100:>5.1f}% {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gunicornのワーカー数ごとのスループットを計測")
+    parser.add_argument("--workers", default="1,2,4", help="計測するワーカー数のカンマ区切りリスト")
+    parser.add_argument("--clients", type=int, default=4, help="負荷生成プロセス数")
+    parser.add_argument("-c", "--concurrency", type=int, default=64, help="同時リクエスト数（全負荷生成プロセスの合計）")
+    parser.add_argument("-d", "--duration", type=float, default=30.0, help="ワーカー数ごとの計測秒数")
+    parser.add_argument("--mix", default="timeblock=6,summary=3,mood=1", help="リクエストの比率（loadgen.py と同じ形式）")
+    parser.add_argument("--devices", type=int, default=50, help="合成デバイス数")
+    parser.add_argument("--days", type=int, default=2, help="1デバイスあたりの日数")
+    parser.add_argument("--latency", help="フェイクのレイテンシ分布（例: lognormal:5:0.5）")
+    parser.add_argument("--port", type=int, default=8790, help="サーバーの待ち受けポート")
+    parser.add_argument("--seed", type=int, default=0, help="合成データの乱数シード")
+    parser.add_argument("-o", "--output", help="結果のJSONの保存先")
+    args = parser.parse_args()
+
+    worker_counts = [int(value) for value in args.workers.split(",")]
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"cpus: {available_cpus()}  workers: {args.workers}  clients: {args.clients}  concurrency: {args.concurrency}  "
+          f"duration: {args.duration:g}s  latency: {args.latency}  devices: {args.devices} x {args.days} days")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # loadgen.py と同じ引数で合成データを作成（サーバー側のフェイクの初期データ）
+        dates = [f"2025-09-{15 + day:02d}" for day in range(args.days)]
+        data_path = os.path.join(workdir, "fake_data.json")
+        with open(data_path, "w", encoding="utf-8") as f:
+            json.dump(fixtures.make_dataset(devices=args.devices, dates=dates, seed=args.seed), f, ensure_ascii=False)
+
+        for workers in worker_counts:
+            log_path = os.path.join(workdir, f"server-{workers}.log")
+            with open(log_path, "w") as log_file:
+                server = start_server(args, workers, data_path, log_file)
+                try:
+                    wait_until_ready(url)
+                    rows.append(aggregate(workers, run_clients(args, url, workdir, workers)))
+                except Exception:
+                    with open(log_path) as f:
+                        sys.stderr.write(f.read()[-4000:])
+                    raise
+                finally:
+                    stop_server(server)
+            print(f"  {workers} workers: {rows[-1]['throughput_rps']:.1f} req/s")
+
+    baseline = rows[0]["throughput_rps"] / rows[0]["workers"]
+    for row in rows:
+        row["speedup"] = round(row["throughput_rps"] / rows[0]["throughput_rps"], 2) if rows[0]["throughput_rps"] else 0.0
+        row["efficiency"] = round(row["throughput_rps"] / (baseline * row["workers"]), 3) if baseline else 0.0
+
+    print_report(rows)
+    if args.output:
+        report = {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": available_cpus(),
+                "clients": args.clients,
+                "concurrency": args.concurrency,
+                "duration_seconds": args.duration,
+                "mix": args.mix,
+                "devices": args.devices,
+                "days": args.days,
+                "latency": args.latency,
+            },
+            "results": rows,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
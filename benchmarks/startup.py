@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+起動時間の計測
+==============
+フェイクバックエンドでサーバー（uvicorn）を起動し、以下を計測する（--runs 回の中央値）
+
+- import: `import main` の所要時間（別プロセス）
+- live: プロセス起動から /health/live（変更前のツリーでは /health）が200を返すまで
+- ready: プロセス起動から /health/ready が200を返すまで（エンドポイントがないツリーでは live と同じ）
+- first / second request: ready 後の最初と2回目の /generate-timeblock-prompt のレイテンシ
+
+使用例:
+    python benchmarks/startup.py --runs 5
+
+    # 変更前のツリーと比較
+    git worktree add /tmp/before HEAD~1
+    python benchmarks/startup.py --src /tmp/before --runs 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+
+import fixtures
+
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def server_env(args, data_path: str) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        "SUPABASE_URL": "http://localhost",
+        "SUPABASE_KEY": "startup",
+        "SUPABASE_BACKEND": "fake",
+        "FAKE_SUPABASE_DATA": data_path,
+        "LOG_LEVEL": "WARNING",
+    }
+    if args.latency:
+        env["FAKE_SUPABASE_LATENCY"] = args.latency
+    return env
+
+
+def measure_import(src: str, env: Dict[str, str]) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=src, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def wait_for(client: httpx.Client, paths, started: float, timeout: float) -> Optional[float]:
+    """paths のいずれかが200を返すまでの経過秒（全てが404の場合はNone）"""
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        missing = 0
+        for path in paths:
+            try:
+                status_code = client.get(path).status_code
+            except httpx.HTTPError:
+                break
+            if status_code == 200:
+                return time.perf_counter() - started
+            missing += status_code == 404
+        if missing == len(paths):
+            return None
+        time.sleep(0.005)
+    raise RuntimeError(f"Timed out waiting for {', '.join(paths)}")
+
+
+def timed_get(client: httpx.Client, path: str, params: Dict[str, str]) -> float:
+    started = time.perf_counter()
+    client.get(path, params=params).raise_for_status()
+    return time.perf_counter() - started
+
+
+def run_once(args, env: Dict[str, str], params: Dict[str, str]) -> Dict[str, float]:
+    url = f"http://127.0.0.1:{args.port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=args.src, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=url, timeout=30.0) as client:
+            live = wait_for(client, ["/health/live", "/health"], started, args.timeout)
+            ready = wait_for(client, ["/health/ready"], started, args.timeout)
+            first = timed_get(client, "/generate-timeblock-prompt", params)
+            second = timed_get(client, "/generate-timeblock-prompt", params)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "live_ms": live * 1000,
+        "ready_ms": (ready if ready is not None else live) * 1000,
+        "first_request_ms": first * 1000,
+        "second_request_ms": second * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import時間・readyまでの時間・最初のリクエストのレイテンシを計測")
+    parser.add_argument("--src", default=ROOT, help="計測するツリー（既定: このリポジトリ）")
+    parser.add_argument("--runs", type=int, default=3, help="計測回数（中央値を出力）")
+    parser.add_argument("--latency", help="フェイクのレイテンシ分布（例: constant:20）")
+    parser.add_argument("--port", type=int, default=8791, help="サーバーの待ち受けポート")
+    parser.add_argument("--timeout", type=float, default=60.0, help="起動を待つ最大秒数")
+    parser.add_argument("-o", "--output", help="結果のJSONの保存先")
+    args = parser.parse_args()
+    args.src = os.path.abspath(args.src)
+
+    dataset = fixtures.make_dataset(devices=4)
+    row = dataset["vibe_whisper"][0]
+    params = {"device_id": row["device_id"], "date": row["date"], "time_block": row["time_block"], "force": "true"}
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        data_path = os.path.join(workdir, "fake_data.json")
+        with open(data_path, "w", encoding="utf-8") as f:
+            json.dump(dataset, f, ensure_ascii=False)
+        env = server_env(args, data_path)
+        for _ in range(args.runs):
+            runs.append({"import_ms": measure_import(args.src, env) * 1000, **run_once(args, env, params)})
+
+    summary = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    print(f"src: {args.src}  runs: {args.runs}  latency: {args.latency}")
+    for key, value in summary.items():
+        print(f"  {key:<20} {value:>9.1f} ms")
+
+    if args.output:
+        report: Dict[str, Any] = {
+            "meta": {
+                "src": args.src,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "runs": args.runs,
+                "latency": args.latency,
+            },
+            "median": summary,
+            "runs": runs,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ベンチマークスイート
+====================
+合成データ（fixtures.py）とインプロセスのフェイクバックエンド（fake_supabase.py）で、
+プロンプト生成関数と各エンドポイント（ASGI経由のend-to-end）を計測する
+
+計測値（ケースごと）:
+- ops_per_sec: 1秒あたりの実行回数
+- p50_us / p99_us: 1回あたりのレイテンシ（マイクロ秒）
+- alloc_kib: 1回の実行中に確保されたメモリのピーク（tracemalloc、中央値）
+- errors: エンドポイントが2xx以外を返した回数
+
+使用例:
+    python benchmarks/suite.py                                   # 結果を benchmarks/results/<commit>.json に保存
+    python benchmarks/suite.py --filter endpoint                 # 名前に endpoint を含むケースのみ
+    python benchmarks/suite.py --src /tmp/before -o before.json  # 変更前のツリーを計測
+    python benchmarks/suite.py --compare before.json             # 今回の結果と比較
+    python benchmarks/suite.py --compare before.json after.json  # 保存済みの結果同士を比較
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import importlib
+import itertools
+import contextlib
+import subprocess
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures
+
+# フェイクバックエンドは --src の指定に関わらずこのリポジトリのものを使う
+sys.path.insert(0, ROOT)
+from fake_supabase import FakeDataClient
+sys.path.remove(ROOT)
+
+
+class Case:
+    """計測ケース（sync: 通常の関数、async: コルーチン関数）"""
+
+    def __init__(self, name: str, func: Callable, is_async: bool = False):
+        self.name = name
+        self.func = func
+        self.is_async = is_async
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """ソート済みの値の百分位（最近傍）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples_ns: List[int], total_ns: int, alloc_bytes: List[int], errors: int) -> Dict[str, Any]:
+    samples_us = sorted(sample / 1000 for sample in samples_ns)
+    alloc_sorted = sorted(alloc_bytes)
+    return {
+        "iterations": len(samples_us),
+        "ops_per_sec": round(len(samples_us) / (total_ns / 1e9), 1) if total_ns else 0.0,
+        "p50_us": round(percentile(samples_us, 0.50), 1),
+        "p99_us": round(percentile(samples_us, 0.99), 1),
+        "mean_us": round(sum(samples_us) / len(samples_us), 1) if samples_us else 0.0,
+        "alloc_kib": round(percentile(alloc_sorted, 0.50) / 1024, 1),
+        "errors": errors,
+    }
+
+
+def run_sync(case: Case, min_time: float, min_iterations: int, alloc_iterations: int) -> Dict[str, Any]:
+    func = case.func
+    for _ in range(3):  # ウォームアップ
+        func()
+
+    samples, errors = [], 0
+    started = time.perf_counter_ns()
+    deadline = started + int(min_time * 1e9)
+    while len(samples) < min_iterations or time.perf_counter_ns() < deadline:
+        t0 = time.perf_counter_ns()
+        ok = func()
+        samples.append(time.perf_counter_ns() - t0)
+        errors += ok is False
+    total = time.perf_counter_ns() - started
+
+    alloc = []
+    tracemalloc.start()
+    for _ in range(alloc_iterations):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func()
+        alloc.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return summarize(samples, total, alloc, errors)
+
+
+async def run_async(case: Case, min_time: float, min_iterations: int, alloc_iterations: int) -> Dict[str, Any]:
+    func = case.func
+    for _ in range(3):  # ウォームアップ
+        await func()
+
+    samples, errors = [], 0
+    started = time.perf_counter_ns()
+    deadline = started + int(min_time * 1e9)
+    while len(samples) < min_iterations or time.perf_counter_ns() < deadline:
+        t0 = time.perf_counter_ns()
+        ok = await func()
+        samples.append(time.perf_counter_ns() - t0)
+        errors += ok is False
+    total = time.perf_counter_ns() - started
+
+    alloc = []
+    tracemalloc.start()
+    for _ in range(alloc_iterations):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        await func()
+        alloc.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return summarize(samples, total, alloc, errors)
+
+
+# ===== ケース定義 =====
+
+def function_cases(modules: Dict[str, Any], dataset: Dict[str, List[Dict]], seed: int) -> List[Case]:
+    """プロンプト生成関数とバースト検出（データベースを使わない純粋な関数）"""
+    timeblock_endpoint = modules["timeblock_endpoint"]
+    timeblock_endpoint_v2 = modules["timeblock_endpoint_v2"]
+    main = modules["main"]
+
+    rng = random.Random(seed)
+    subjects = {row["subject_id"]: row for row in dataset["subjects"]}
+    subject_by_device = {row["device_id"]: subjects[row["subject_id"]] for row in dataset["devices"]}
+    transcriptions = {
+        (row["device_id"], row["date"], row["time_block"]): row["transcription"] for row in dataset["vibe_whisper"]
+    }
+    opensmile = {
+        (row["device_id"], row["date"], row["time_block"]): row["selected_features_timeline"]
+        for row in dataset["emotion_opensmile"]
+    }
+    # ブロックごとの入力（DBから取得した直後の形: OpenSMILEはJSONBをパースした辞書のリスト）
+    block_inputs = [
+        (transcriptions[key], row["events"], row["time_block"], row["date"],
+         subject_by_device[row["device_id"]], opensmile[key])
+        for row in dataset["behavior_yamnet"]
+        for key in [(row["device_id"], row["date"], row["time_block"])]
+    ]
+    v1_inputs = itertools.cycle(block_inputs)
+    v2_inputs = itertools.cycle(block_inputs)
+
+    timelines = [fixtures.make_timeline(rng) for _ in range(8)]
+    timeline_inputs = itertools.cycle(timelines)
+    summary_inputs = itertools.cycle([
+        (
+            timeline,
+            {
+                "avg_vibe_score": 10.0,
+                "positive_blocks": 10,
+                "negative_blocks": 5,
+                "neutral_blocks": 20,
+                "total_blocks": len(timeline),
+            },
+            subject,
+        )
+        for timeline, subject in zip(timelines, itertools.cycle(subjects.values()))
+    ])
+    texts = [
+        f"[{block}] {fixtures.make_transcription(rng) or '(発話なし)'}" for block in fixtures.TIME_BLOCKS
+    ]
+
+    def v1():
+        timeblock_endpoint.generate_timeblock_prompt(*next(v1_inputs))
+
+    def v2():
+        timeblock_endpoint_v2.generate_timeblock_prompt_v2(*next(v2_inputs))
+
+    def daily_summary():
+        timeline, statistics, subject = next(summary_inputs)
+        main.generate_daily_summary_prompt("device", "2025-09-15", timeline, statistics, "23-30", subject)
+
+    def chatgpt():
+        main.generate_chatgpt_prompt("device", "2025-09-15", texts)
+
+    def burst():
+        main.detect_burst_events(next(timeline_inputs))
+
+    return [
+        Case("generate_timeblock_prompt", v1),
+        Case("generate_timeblock_prompt_v2", v2),
+        Case("generate_daily_summary_prompt", daily_summary),
+        Case("generate_chatgpt_prompt", chatgpt),
+        Case("detect_burst_events", burst),
+    ]
+
+
+def endpoint_cases(client, dataset: Dict[str, List[Dict]]) -> List[Case]:
+    """各エンドポイントのend-to-end（ASGI経由、フェイクバックエンド）"""
+    days = sorted({(row["device_id"], row["date"]) for row in dataset["vibe_whisper"]})
+    blocks = itertools.cycle([
+        (row["device_id"], row["date"], row["time_block"]) for row in dataset["vibe_whisper"]
+    ])
+    day_cycles = {name: itertools.cycle(days) for name in ("day", "summary", "incremental", "mood")}
+    unchanged_block = (dataset["vibe_whisper"][0]["device_id"], dataset["vibe_whisper"][0]["date"],
+                       dataset["vibe_whisper"][0]["time_block"])
+
+    async def get(path: str, **params) -> bool:
+        response = await client.get(path, params=params)
+        return 200 <= response.status_code < 300
+
+    async def post(path: str, **params) -> bool:
+        response = await client.post(path, params=params)
+        return 200 <= response.status_code < 300
+
+    async def health():
+        return await get("/health")
+
+    async def timeblock():
+        device_id, date, time_block = next(blocks)
+        return await get("/generate-timeblock-prompt", device_id=device_id, date=date,
+                         time_block=time_block, force="true")
+
+    async def timeblock_unchanged():
+        device_id, date, time_block = unchanged_block
+        return await get("/generate-timeblock-prompt", device_id=device_id, date=date, time_block=time_block)
+
+    async def day():
+        device_id, date = next(day_cycles["day"])
+        return await get("/generate-timeblock-prompts-day", device_id=device_id, date=date)
+
+    async def dashboard_summary():
+        device_id, date = next(day_cycles["summary"])
+        return await get("/generate-dashboard-summary", device_id=device_id, date=date)
+
+    async def dashboard_summary_incremental():
+        device_id, date = next(day_cycles["incremental"])
+        return await get("/generate-dashboard-summary", device_id=device_id, date=date, incremental="true")
+
+    async def mood_prompt():
+        device_id, date = next(day_cycles["mood"])
+        return await get("/generate-mood-prompt-supabase", device_id=device_id, date=date)
+
+    async def invalidate_subject_cache():
+        return await post("/subject-cache/invalidate")
+
+    return [
+        Case("endpoint:/health", health, True),
+        Case("endpoint:/generate-timeblock-prompt", timeblock, True),
+        Case("endpoint:/generate-timeblock-prompt (unchanged)", timeblock_unchanged, True),
+        Case("endpoint:/generate-timeblock-prompts-day", day, True),
+        Case("endpoint:/generate-dashboard-summary", dashboard_summary, True),
+        Case("endpoint:/generate-dashboard-summary (incremental)", dashboard_summary_incremental, True),
+        Case("endpoint:/generate-mood-prompt-supabase", mood_prompt, True),
+        Case("endpoint:/subject-cache/invalidate", invalidate_subject_cache, True),
+    ]
+
+
+# ===== 実行・保存・比較 =====
+
+def git_commit(src: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "-C", src, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_modules(src: str) -> Dict[str, Any]:
+    os.environ.setdefault("SUPABASE_URL", "http://localhost")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    sys.path.insert(0, os.path.abspath(src))
+    with contextlib.redirect_stdout(io.StringIO()):
+        modules = {
+            name: importlib.import_module(name)
+            for name in ("timeblock_endpoint", "timeblock_endpoint_v2", "main")
+        }
+    discard_app_logs()
+    return modules
+
+
+def discard_app_logs():
+    """アプリのログ（log_config.py があるツリーのみ）は出力処理の負荷はそのままに出力先を捨てる"""
+    try:
+        log_config = importlib.import_module("log_config")
+    except ImportError:
+        return
+    log_config.setup_logging(stream=open(os.devnull, "w"))
+
+
+def run_suite(args) -> Dict[str, Any]:
+    modules = load_modules(args.src)
+    main = modules["main"]
+    dataset = fixtures.make_dataset(devices=args.devices, seed=args.seed)
+
+    # エンドポイントはフェイクバックエンドに接続（get_supabase_client は設定済みのクライアントを返す）
+    backend = FakeDataClient(dataset)
+    main.supabase_client = backend
+
+    import httpx
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+
+    cases = function_cases(modules, dataset, args.seed) + endpoint_cases(client, dataset)
+    if args.filter:
+        cases = [case for case in cases if args.filter in case.name]
+
+    results = {}
+    loop = asyncio.new_event_loop()
+    try:
+        for case in cases:
+            # エンドポイント内のprint出力は計測結果の表示と混ざらないように捨てる
+            with contextlib.redirect_stdout(io.StringIO()):
+                if case.is_async:
+                    result = loop.run_until_complete(
+                        run_async(case, args.min_time, args.min_iterations, args.alloc_iterations))
+                else:
+                    result = run_sync(case, args.min_time, args.min_iterations, args.alloc_iterations)
+            results[case.name] = result
+            print(f"  {case.name:<52} {result['ops_per_sec']:>10.1f} ops/s  p50 {result['p50_us']:>9.1f} µs  "
+                  f"p99 {result['p99_us']:>9.1f} µs  alloc {result['alloc_kib']:>8.1f} KiB"
+                  + (f"  errors {result['errors']}" if result["errors"] else ""))
+        loop.run_until_complete(client.aclose())
+    finally:
+        loop.close()
+
+    return {
+        "meta": {
+            "commit": git_commit(args.src),
+            "src": os.path.abspath(args.src),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "devices": args.devices,
+            "min_time": args.min_time,
+            "backend": backend.stats(),
+        },
+        "results": results,
+    }
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any]):
+    """2つの結果の比較（p50・ops/s・allocの変化率、負の値ほど速い/少ない）"""
+    print(f"base: {base['meta'].get('commit')} ({base['meta'].get('created_at')})  "
+          f"head: {head['meta'].get('commit')} ({head['meta'].get('created_at')})")
+    print(f"  {'case':<52} {'p50 base':>10} {'p50 head':>10} {'Δp50':>8} {'Δops/s':>8} {'Δalloc':>8}")
+
+    def delta(before: float, after: float) -> str:
+        return f"{(after - before) / before * 100:+7.1f}%" if before else "      -"
+
+    for name, after in head["results"].items():
+        before = base["results"].get(name)
+        if before is None:
+            print(f"  {name:<52} {'-':>10} {after['p50_us']:>10.1f}   (new)")
+            continue
+        print(f"  {name:<52} {before['p50_us']:>10.1f} {after['p50_us']:>10.1f} "
+              f"{delta(before['p50_us'], after['p50_us']):>8} {delta(before['ops_per_sec'], after['ops_per_sec']):>8} "
+              f"{delta(before['alloc_kib'], after['alloc_kib']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロンプト生成・エンドポイントのベンチマークスイート")
+    parser.add_argument("--src", default=ROOT, help="計測するソースツリー（既定: このリポジトリ）")
+    parser.add_argument("--filter", help="名前にこの文字列を含むケースのみ実行")
+    parser.add_argument("--min-time", type=float, default=1.0, help="1ケースあたりの最小計測秒数")
+    parser.add_argument("--min-iterations", type=int, default=100, help="1ケースあたりの最小実行回数")
+    parser.add_argument("--alloc-iterations", type=int, default=20, help="メモリ確保量を計測する実行回数")
+    parser.add_argument("--devices", type=int, default=4, help="合成データのデバイス数（1デバイス2日分）")
+    parser.add_argument("--seed", type=int, default=0, help="合成データの乱数シード")
+    parser.add_argument("-o", "--output", help="結果のJSONの保存先（既定: benchmarks/results/<commit>.json）")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT_JSON",
+                        help="比較する結果（1つ指定: 今回の結果と比較、2つ指定: 保存済みの結果同士を比較）")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f0, open(args.compare[1]) as f1:
+            compare(json.load(f0), json.load(f1))
+        return
+
+    print(f"source: {os.path.abspath(args.src)}  python: {platform.python_version()}")
+    report = run_suite(args)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or 'working-tree'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved: {output}")
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
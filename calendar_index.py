@@ -0,0 +1,138 @@
+"""
+Japanese Calendar Index
+=======================
+日付ごとの曜日・平日/週末・季節・祝日名・連休コンテキストを事前計算したテーブル
+プロンプト生成のたびに strptime と jpholiday を呼ぶ代わりに、日付文字列でO(1)参照する
+
+- 対象期間は CALENDAR_INDEX_START_YEAR 〜 CALENDAR_INDEX_END_YEAR（既定: 今年の前後2年）
+- 期間外の日付はその場で同じ規則により計算する（結果は同一）
+- jpholidayが利用できない場合は祝日なしとして扱う
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, NamedTuple, Optional
+
+
+WEEKDAYS_JA = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
+DEFAULT_YEARS_AROUND = 2
+
+
+class CalendarDay(NamedTuple):
+    """1日分のカレンダー情報"""
+    weekday: str                # 曜日名（日本語）
+    is_weekend: bool            # 土曜日または日曜日
+    day_type: str               # "週末" / "平日"
+    season: str                 # 日本の季節
+    is_holiday: bool
+    holiday_name: Optional[str]
+    consecutive_context: str    # "3連休の中日" / "連休初日" / "連休最終日" / "祝日" / "週末" / ""
+
+
+def get_season(month: int) -> str:
+    """月から季節を判定（日本の季節）"""
+    if month in [3, 4, 5]:
+        return "春"
+    elif month in [6, 7, 8]:
+        return "夏"
+    elif month in [9, 10, 11]:
+        return "秋"
+    else:
+        return "冬"
+
+
+def _holiday_name_lookup(start: date, end: date) -> Dict[date, str]:
+    """期間内の祝日をまとめて取得（jpholidayが無い場合は空）"""
+    try:
+        import jpholiday
+    except ImportError:
+        return {}
+
+    holidays = {}
+    for year in range(start.year, end.year + 1):
+        for holiday_date, name in jpholiday.year_holidays(year):
+            holidays[holiday_date] = name
+    return holidays
+
+
+def _build_day(day: date, holidays: Dict[date, str]) -> CalendarDay:
+    """前後の日付の祝日・週末から連休コンテキストを含めて1日分を計算"""
+    holiday_name = holidays.get(day)
+    is_holiday = holiday_name is not None
+
+    day_before = day - timedelta(days=1)
+    day_after = day + timedelta(days=1)
+    holiday_before = holidays.get(day_before)
+    holiday_after = holidays.get(day_after)
+    is_weekend_before = day_before.weekday() >= 5
+    is_weekend_after = day_after.weekday() >= 5
+    is_weekend = day.weekday() >= 5  # 土曜日(5)または日曜日(6)
+
+    # 連休のコンテキスト
+    consecutive_context = ""
+    if (holiday_before or is_weekend_before) and (holiday_after or is_weekend_after):
+        consecutive_context = "3連休の中日"
+    elif holiday_after or is_weekend_after:
+        consecutive_context = "連休初日"
+    elif holiday_before or is_weekend_before:
+        consecutive_context = "連休最終日"
+    elif is_holiday:
+        consecutive_context = "祝日"
+    elif is_weekend:
+        consecutive_context = "週末"
+
+    return CalendarDay(
+        weekday=WEEKDAYS_JA[day.weekday()],
+        is_weekend=is_weekend,
+        day_type="週末" if is_weekend else "平日",
+        season=get_season(day.month),
+        is_holiday=is_holiday,
+        holiday_name=holiday_name,
+        consecutive_context=consecutive_context,
+    )
+
+
+def build_calendar_index(start_year: int, end_year: int) -> Dict[str, CalendarDay]:
+    """start_year〜end_yearの全日付（YYYY-MM-DD）の索引を作成"""
+    start = date(start_year, 1, 1)
+    end = date(end_year, 12, 31)
+    # 期間の両端の連休判定のため前後1日分の祝日も取得
+    holidays = _holiday_name_lookup(start - timedelta(days=1), end + timedelta(days=1))
+
+    index = {}
+    day = start
+    while day <= end:
+        index[day.isoformat()] = _build_day(day, holidays)
+        day += timedelta(days=1)
+    return index
+
+
+_calendar_index: Optional[Dict[str, CalendarDay]] = None
+
+
+def get_calendar_index() -> Dict[str, CalendarDay]:
+    """索引を遅延作成して取得"""
+    global _calendar_index
+    if _calendar_index is None:
+        this_year = datetime.now().year
+        start_year = int(os.getenv("CALENDAR_INDEX_START_YEAR", this_year - DEFAULT_YEARS_AROUND))
+        end_year = int(os.getenv("CALENDAR_INDEX_END_YEAR", this_year + DEFAULT_YEARS_AROUND))
+        _calendar_index = build_calendar_index(start_year, end_year)
+    return _calendar_index
+
+
+def get_calendar_day(date_str: str) -> CalendarDay:
+    """
+    日付文字列（YYYY-MM-DD）のカレンダー情報を取得
+
+    Raises:
+        ValueError / TypeError: 日付として解釈できない場合
+    """
+    day = get_calendar_index().get(date_str)
+    if day is not None:
+        return day
+
+    # 索引の期間外（または非ゼロ埋めなど表記揺れ）の場合はその場で計算
+    day_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+    holidays = _holiday_name_lookup(day_obj - timedelta(days=1), day_obj + timedelta(days=1))
+    return _build_day(day_obj, holidays)
@@ -0,0 +1,203 @@
+"""
+Async Data Access Layer
+=======================
+Supabase（PostgREST）への非同期アクセス層
+同期版supabase-pyの.execute()はイベントループをブロックするため、
+全てのfetch/update/upsertはこのクライアント経由で await して実行する
+
+- 共有のkeep-alive接続プール（h2がインストールされていればHTTP/2）
+- プールサイズ・タイムアウトは環境変数で設定可能
+- クエリの組み立て方は supabase-py と同じ（table().select().eq()...execute()）
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, Optional, Union
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+
+from metrics import observe_db_call
+from tracing import span
+
+
+# 接続プール設定（環境変数で上書き可能）
+DEFAULT_POOL_SIZE = 20          # 最大同時接続数
+DEFAULT_POOL_KEEPALIVE = 10     # keep-aliveで保持する接続数
+DEFAULT_KEEPALIVE_EXPIRY = 60.0  # アイドル接続の保持秒数
+DEFAULT_TIMEOUT = 10.0          # 1回のクエリのタイムアウト（秒）
+
+# クエリの種類を表すビルダーのメソッド名
+OPERATIONS = ("select", "insert", "upsert", "update", "delete")
+
+
+def _http2_available() -> bool:
+    """HTTP/2に必要なh2パッケージが利用可能か"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncQuery:
+    """
+    postgrestのリクエストビルダーをラップし、execute()にタイムアウトを適用する
+    フィルタ等のメソッド呼び出しはそのまま委譲し、戻り値のビルダーも再度ラップする
+    """
+
+    def __init__(self, builder, table: str, operation: str, timeout: Optional[float]):
+        self._builder = builder
+        self.table = table
+        self.operation = operation
+        self.timeout = timeout
+
+    def _wrap(self, result, operation: str):
+        if hasattr(result, "execute"):
+            return AsyncQuery(result, self.table, operation, self.timeout)
+        return result
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            # not_ などのプロパティ
+            return self._wrap(attr, self.operation)
+
+        operation = name if name in OPERATIONS else self.operation
+
+        def method(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs), operation)
+        return method
+
+    def select_returned(self, *columns: str) -> "AsyncQuery":
+        """
+        update / upsert で返す行の列を指定（PostgRESTの select パラメータ、returning=representation の場合）
+        書き込んだ行の確認に必要な列のみを返させ、大きな列（特徴量等）の転送を避ける
+        """
+        self._builder.params = self._builder.params.set("select", ",".join(columns))
+        return self
+
+    async def execute(self, timeout: Optional[float] = None):
+        """
+        クエリを実行
+
+        Args:
+            timeout: この呼び出しのみに適用するタイムアウト（秒）。省略時はクライアントの設定値
+        """
+        started = time.perf_counter()
+        try:
+            with span(f"{self.table}.{self.operation}"):
+                result = await asyncio.wait_for(self._builder.execute(), timeout=timeout or self.timeout)
+        except BaseException:
+            observe_db_call(self.table, self.operation, time.perf_counter() - started, ok=False)
+            raise
+        observe_db_call(self.table, self.operation, time.perf_counter() - started, ok=True)
+        return result
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    """接続プール設定済みのhttpx.AsyncClientを使うPostgRESTクライアント"""
+
+    def __init__(self, base_url: str, *, headers: Dict[str, str], timeout: float,
+                 limits: httpx.Limits, http2: bool):
+        self._limits = limits
+        self._http2 = http2
+        super().__init__(base_url, headers=headers, timeout=timeout)
+
+    def create_session(self, base_url: str, headers: Dict[str, str],
+                       timeout: Union[int, float, httpx.Timeout]) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=self._limits,
+            http2=self._http2,
+        )
+
+
+class AsyncDataClient:
+    """
+    Supabase REST API用の非同期クライアント
+    supabase-pyのClientと同じく table() からクエリを組み立て、execute() を await する
+    """
+
+    def __init__(self, url: str, key: str, *,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 keepalive: int = DEFAULT_POOL_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 http2: bool = True):
+        self.timeout = timeout
+        self.http2 = http2 and _http2_available()
+
+        headers = {
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apiKey": key,
+            "Authorization": f"Bearer {key}",
+        }
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.postgrest = _PooledPostgrestClient(
+            f"{url}/rest/v1",
+            headers=headers,
+            timeout=timeout,
+            limits=limits,
+            http2=self.http2,
+        )
+
+    def table(self, table_name: str) -> AsyncQuery:
+        """テーブル操作のクエリビルダーを取得"""
+        return AsyncQuery(self.postgrest.from_(table_name), table_name, "select", self.timeout)
+
+    async def aclose(self):
+        """接続プールを閉じる"""
+        await self.postgrest.aclose()
+
+
+def create_async_client_from_env() -> AsyncDataClient:
+    """
+    環境変数から非同期クライアントを生成
+
+    環境変数:
+        SUPABASE_URL / SUPABASE_KEY: 接続先（必須）
+        SUPABASE_POOL_SIZE: 最大同時接続数
+        SUPABASE_POOL_KEEPALIVE: keep-aliveで保持する接続数
+        SUPABASE_TIMEOUT: 1回のクエリのタイムアウト（秒）
+        SUPABASE_HTTP2: HTTP/2を使用するか（"false"で無効化）
+    """
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+
+    if not url or not key:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+
+    return AsyncDataClient(
+        url,
+        key,
+        pool_size=int(os.getenv("SUPABASE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        keepalive=int(os.getenv("SUPABASE_POOL_KEEPALIVE", DEFAULT_POOL_KEEPALIVE)),
+        timeout=float(os.getenv("SUPABASE_TIMEOUT", DEFAULT_TIMEOUT)),
+        http2=os.getenv("SUPABASE_HTTP2", "true").lower() not in ("0", "false", "no"),
+    )
+
+
+def create_client_from_env():
+    """
+    SUPABASE_BACKEND に応じたクライアントを生成
+
+    環境変数:
+        SUPABASE_BACKEND: "supabase"（既定）は AsyncDataClient、
+            "fake" はメモリ上のフェイク（fake_supabase.FakeDataClient、負荷試験・ベンチマーク用）
+    """
+    backend = os.getenv("SUPABASE_BACKEND", "supabase").lower()
+    if backend == "fake":
+        from fake_supabase import create_fake_client_from_env
+        return create_fake_client_from_env()
+    if backend != "supabase":
+        raise ValueError(f"Unknown SUPABASE_BACKEND: {backend} (expected 'supabase' or 'fake')")
+    return create_async_client_from_env()
@@ -0,0 +1,535 @@
+"""
+Fake Supabase Backend
+=====================
+data_access.AsyncDataClient と同じ table().select().eq()...execute() の形で、
+メモリ上のテーブルに対してクエリを実行するインプロセスのフェイク（ネットワーク・PostgRESTを経由しない）
+本番のSupabaseに負荷をかけずに、ベンチマーク・負荷試験をローカルで行うために使用する
+
+- SUPABASE_BACKEND=fake で get_supabase_client がこのクライアントを返す
+- 1回のクエリごとのレイテンシ（固定・一様・正規・対数正規分布）とエラー率を設定可能
+- テーブル・操作ごとの呼び出し回数、エラー回数を記録
+
+対応している操作（このリポジトリで使っているもののみ）:
+- select（'*'・列名・埋め込みリソース subjects(...)）
+- eq / neq / gt / gte / lt / lte / in_ / is_ と not_ による否定
+- order / limit / single / maybe_single
+- insert / upsert（on_conflict、既存行には渡された列のみをマージ）/ update / delete
+- returning=ReturnMethod.minimal（dataは空のリスト）/ select_returned による返却列の指定
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import copy
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+from metrics import observe_db_call
+from tracing import span
+
+
+# テーブルごとの主キー（upsertの既定の衝突判定に使用）
+PRIMARY_KEYS: Dict[str, Tuple[str, ...]] = {
+    "vibe_whisper": ("device_id", "date", "time_block"),
+    "behavior_yamnet": ("device_id", "date", "time_block"),
+    "emotion_opensmile": ("device_id", "date", "time_block"),
+    "dashboard": ("device_id", "date", "time_block"),
+    "dashboard_summary": ("device_id", "date"),
+    "vibe_whisper_prompt": ("device_id", "date"),
+    "devices": ("device_id",),
+    "subjects": ("subject_id",),
+}
+
+# 埋め込みリソース（多対1）: 親テーブル → {埋め込むテーブル: 結合する列}
+FOREIGN_KEYS: Dict[str, Dict[str, str]] = {
+    "devices": {"subjects": "subject_id"},
+}
+
+
+class LatencyDistribution:
+    """
+    1回のクエリのレイテンシ（秒）の分布
+
+    書式（ミリ秒）:
+        "constant:5"          常に5ms
+        "uniform:2:10"        2〜10msの一様分布
+        "normal:5:1"          平均5ms・標準偏差1msの正規分布（負の値は0）
+        "lognormal:5:0.5"     中央値5ms・σ=0.5の対数正規分布（裾の長い実際のレイテンシに近い）
+    """
+
+    KINDS = ("constant", "uniform", "normal", "lognormal")
+
+    def __init__(self, kind: str = "constant", *params: float):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        expected = 1 if kind == "constant" else 2
+        if len(params) != expected:
+            raise ValueError(f"Latency distribution '{kind}' takes {expected} parameter(s)")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, *params = spec.strip().split(":")
+        return cls(kind, *(float(param) for param in params))
+
+    def sample(self, rng: random.Random) -> float:
+        """レイテンシ（秒）"""
+        if self.kind == "constant":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            ms = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            ms = median * rng.lognormvariate(0.0, sigma)
+        return max(ms, 0.0) / 1000
+
+    def __repr__(self) -> str:
+        return ":".join([self.kind, *(f"{param:g}" for param in self.params)])
+
+
+def parse_latency(spec: Optional[str]) -> Dict[str, LatencyDistribution]:
+    """
+    操作ごとのレイテンシ設定を解析
+    "lognormal:5:0.5" は全操作、"select=lognormal:5:0.5,upsert=constant:20" は操作ごと（"*" で既定値）
+    """
+    latency: Dict[str, LatencyDistribution] = {}
+    if not spec:
+        return latency
+    for item in spec.split(","):
+        operation, _, distribution = item.rpartition("=")
+        latency[operation.strip() or "*"] = LatencyDistribution.parse(distribution)
+    return latency
+
+
+class FakeResponse:
+    """postgrestのAPIResponseと同じく data と count を持つ結果"""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _split_columns(columns: str) -> List[str]:
+    """'a,b,subjects(c,d)' を括弧の外のカンマで分割"""
+    parts, depth, current = [], 0, []
+    for char in columns:
+        if char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        current.append(char)
+    if current:
+        parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def _filter_value(value: Any) -> Any:
+    """is_ の 'null' / 'true' / 'false' をPythonの値に変換"""
+    if isinstance(value, str):
+        return {"null": None, "true": True, "false": False}.get(value.lower(), value)
+    return value
+
+
+def _compare(operator: str, actual: Any, expected: Any) -> bool:
+    if operator == "eq":
+        return actual == expected
+    if operator == "neq":
+        return actual != expected
+    if operator == "is":
+        return actual is _filter_value(expected)
+    if operator == "in":
+        return actual in expected
+    if actual is None:
+        # NULLとの大小比較は常に偽（PostgreSQLと同じ）
+        return False
+    if operator == "gt":
+        return actual > expected
+    if operator == "gte":
+        return actual >= expected
+    if operator == "lt":
+        return actual < expected
+    if operator == "lte":
+        return actual <= expected
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+class FakeTable:
+    """
+    1テーブル分の行（主キー → 行の辞書、挿入順を維持）
+    主キーの先頭の列（device_id、device_id + date）で索引を持ち、eqで絞り込むクエリは全件を走査しない
+    """
+
+    def __init__(self, name: str, rows: Iterable[Dict[str, Any]] = ()):
+        self.name = name
+        self.primary_key = PRIMARY_KEYS.get(name, ("id",))
+        self.rows: Dict[Tuple, Dict[str, Any]] = {}
+        # 主キーの先頭k列の値 → 主キー（k = 1 〜 主キーの列数-1）
+        self._index: List[Dict[Tuple, Dict[Tuple, None]]] = [{} for _ in self.primary_key[:-1]]
+        for row in rows:
+            self.put(row, self.primary_key)
+
+    def _key(self, row: Dict[str, Any]) -> Tuple:
+        return tuple(row.get(column) for column in self.primary_key)
+
+    def put(self, row: Dict[str, Any], conflict_columns: Tuple[str, ...]) -> Dict[str, Any]:
+        """衝突判定の列が一致する行があれば渡された列をマージし、なければ追加"""
+        if conflict_columns == self.primary_key:
+            existing = self.rows.get(self._key(row))
+        else:
+            existing = next((
+                stored for stored in self.rows.values()
+                if all(stored.get(column) == row.get(column) for column in conflict_columns)
+            ), None)
+        if existing is not None:
+            self.update(existing, row)
+            return existing
+        stored = dict(row)
+        key = self._key(stored)
+        self.rows[key] = stored
+        for depth, index in enumerate(self._index, 1):
+            index.setdefault(key[:depth], {})[key] = None
+        return stored
+
+    def remove(self, row: Dict[str, Any]):
+        key = self._key(row)
+        del self.rows[key]
+        for depth, index in enumerate(self._index, 1):
+            index[key[:depth]].pop(key, None)
+
+    def update(self, stored: Dict[str, Any], values: Dict[str, Any]):
+        """行に値をマージ（主キーの列の変更は索引が古くなるため非対応）"""
+        if any(column in values and values[column] != stored.get(column) for column in self.primary_key):
+            raise ValueError(f"Updating primary key columns is not supported: {self.name}")
+        stored.update(values)
+
+    def candidates(self, equals: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """eqフィルタの値から、条件を満たし得る行を索引で絞り込む"""
+        depth = 0
+        while depth < len(self.primary_key) and self.primary_key[depth] in equals:
+            depth += 1
+        if depth == 0:
+            return list(self.rows.values())
+        prefix = tuple(equals[column] for column in self.primary_key[:depth])
+        if depth == len(self.primary_key):
+            row = self.rows.get(prefix)
+            return [row] if row is not None else []
+        return [self.rows[key] for key in self._index[depth - 1].get(prefix, ())]
+
+
+class FakeQuery:
+    """AsyncQueryと同じ形のクエリビルダー（フィルタ等のメソッドは自身を返す）"""
+
+    def __init__(self, backend: "FakeDataClient", table: str):
+        self._backend = backend
+        self.table = table
+        self.operation = "select"
+        self._columns: List[str] = ["*"]
+        self._filters: List[Tuple[str, str, Any, bool]] = []
+        self._order: List[Tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._payload: Any = None
+        self._on_conflict: Tuple[str, ...] = ()
+        self._minimal = False
+        self._single: Optional[str] = None
+        self._negate = False
+
+    # ===== 操作 =====
+
+    def select(self, *columns: str, count=None) -> "FakeQuery":
+        self.operation = "select"
+        self._columns = _split_columns(",".join(columns)) or ["*"]
+        return self
+
+    def insert(self, json: Any, *, count=None, returning=None, upsert: bool = False) -> "FakeQuery":
+        return self._mutation("upsert" if upsert else "insert", json, returning)
+
+    def upsert(self, json: Any, *, count=None, returning=None, ignore_duplicates: bool = False,
+               on_conflict: str = "") -> "FakeQuery":
+        self._on_conflict = tuple(column.strip() for column in on_conflict.split(",") if column.strip())
+        return self._mutation("upsert", json, returning)
+
+    def update(self, json: Dict[str, Any], *, count=None, returning=None) -> "FakeQuery":
+        return self._mutation("update", json, returning)
+
+    def delete(self, *, count=None, returning=None) -> "FakeQuery":
+        return self._mutation("delete", None, returning)
+
+    def select_returned(self, *columns: str) -> "FakeQuery":
+        self._columns = _split_columns(",".join(columns)) or ["*"]
+        return self
+
+    def _mutation(self, operation: str, payload: Any, returning) -> "FakeQuery":
+        self.operation = operation
+        self._payload = payload
+        self._minimal = getattr(returning, "value", returning) == "minimal"
+        return self
+
+    # ===== フィルタ =====
+
+    @property
+    def not_(self) -> "FakeQuery":
+        self._negate = True
+        return self
+
+    def _filter(self, operator: str, column: str, value: Any) -> "FakeQuery":
+        self._filters.append((column, operator, value, self._negate))
+        self._negate = False
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("eq", column, value)
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("neq", column, value)
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("gt", column, value)
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("gte", column, value)
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("lt", column, value)
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("lte", column, value)
+
+    def in_(self, column: str, values: Iterable[Any]) -> "FakeQuery":
+        return self._filter("in", column, list(values))
+
+    def is_(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("is", column, value)
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: bool = False, foreign_table=None) -> "FakeQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, *, foreign_table=None) -> "FakeQuery":
+        self._limit = size
+        return self
+
+    def single(self) -> "FakeQuery":
+        self._single = "single"
+        return self
+
+    def maybe_single(self) -> "FakeQuery":
+        self._single = "maybe_single"
+        return self
+
+    # ===== 実行 =====
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        for column, operator, value, negate in self._filters:
+            if _compare(operator, row.get(column), value) == negate:
+                return False
+        return True
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """select した列（と埋め込みリソース）のみの行のコピー"""
+        if self._columns == ["*"]:
+            return dict(row)
+        projected = {}
+        for column in self._columns:
+            if column == "*":
+                projected.update(row)
+            elif "(" in column:
+                resource, inner = column[:-1].split("(", 1)
+                projected[resource] = self._backend.embed(self.table, resource.strip(), row, _split_columns(inner))
+            else:
+                projected[column] = row.get(column)
+        return projected
+
+    def _run(self) -> FakeResponse:
+        table = self._backend.get_table(self.table)
+
+        if self.operation in ("insert", "upsert"):
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            conflict_columns = self._on_conflict or table.primary_key
+            rows = [table.put(row, conflict_columns) for row in payload]
+            return FakeResponse([] if self._minimal else copy.deepcopy(rows))
+
+        equals = {column: value for column, operator, value, negate in self._filters
+                  if operator == "eq" and not negate}
+        rows = [row for row in table.candidates(equals) if self._matches(row)]
+
+        if self.operation == "update":
+            for row in rows:
+                table.update(row, self._payload)
+            return FakeResponse([] if self._minimal else [copy.deepcopy(self._project(row)) for row in rows])
+
+        if self.operation == "delete":
+            for row in rows:
+                table.remove(row)
+            return FakeResponse([] if self._minimal else rows)
+
+        for column, desc in reversed(self._order):
+            # NULLは昇順では最後、降順では最初（PostgreSQLの既定と同じ）
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        data = [self._project(row) for row in rows]
+
+        if self._single is not None:
+            if len(data) > 1 or (len(data) == 0 and self._single == "single"):
+                raise APIError({
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                    "code": "PGRST116",
+                    "hint": None,
+                    "details": f"The result contains {len(data)} rows",
+                })
+            return FakeResponse(data[0] if data else None)
+        return FakeResponse(data)
+
+    async def execute(self, timeout: Optional[float] = None) -> FakeResponse:
+        """設定されたレイテンシだけ待ってから実行（AsyncQueryと同じくタイムアウトを適用）"""
+        return await asyncio.wait_for(self._backend.execute(self), timeout=timeout or self._backend.timeout)
+
+
+class FakeDataClient:
+    """
+    AsyncDataClientの代わりに使うメモリ上のクライアント
+
+    使用例:
+        client = FakeDataClient(tables, latency={"*": LatencyDistribution.parse("lognormal:5:0.5")}, error_rate=0.01)
+        main.supabase_client = client
+        ...
+        client.stats()  # 呼び出し回数・エラー回数
+    """
+
+    http2 = False
+
+    def __init__(self, tables: Optional[Dict[str, Iterable[Dict[str, Any]]]] = None, *,
+                 latency: Optional[Dict[str, LatencyDistribution]] = None,
+                 error_rate: float = 0.0,
+                 timeout: Optional[float] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            tables: テーブル名 → 行のリスト（主キーが同じ行は後の行で上書き）
+            latency: 操作名（select / insert / upsert / update / delete、"*" は既定値）→ レイテンシ分布
+            error_rate: クエリが APIError で失敗する確率（0.0〜1.0）
+            timeout: 1回のクエリのタイムアウト（秒）。Noneの場合はタイムアウトしない
+            seed: レイテンシ・エラー発生の乱数シード
+        """
+        self.tables: Dict[str, FakeTable] = {
+            name: FakeTable(name, rows) for name, rows in (tables or {}).items()
+        }
+        self.latency = latency or {}
+        self.error_rate = error_rate
+        self.timeout = timeout
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.call_counts: Counter = Counter()
+        self.error_counts: Counter = Counter()
+
+    def get_table(self, name: str) -> FakeTable:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+    def embed(self, table: str, resource: str, row: Dict[str, Any], columns: List[str]) -> Optional[Dict[str, Any]]:
+        """多対1の埋め込みリソース（devices → subjects）"""
+        join_column = FOREIGN_KEYS.get(table, {}).get(resource)
+        if join_column is None:
+            raise ValueError(f"Unknown embedded resource: {table} -> {resource}")
+        value = row.get(join_column)
+        if value is None:
+            return None
+        target = self.get_table(resource).rows.get((value,))
+        if target is None:
+            return None
+        return dict(target) if columns == ["*"] else {column: target.get(column) for column in columns}
+
+    def table(self, table_name: str) -> FakeQuery:
+        return FakeQuery(self, table_name)
+
+    async def execute(self, query: FakeQuery) -> FakeResponse:
+        """1回のクエリを記録し、レイテンシの待機・エラーの注入をしてから実行"""
+        key = f"{query.table}.{query.operation}"
+        self.calls += 1
+        self.call_counts[key] += 1
+
+        started = time.perf_counter()
+        try:
+            with span(key):
+                distribution = self.latency.get(query.operation) or self.latency.get("*")
+                # レイテンシ0でも実際のI/Oと同じく1回はイベントループに制御を戻す
+                await asyncio.sleep(distribution.sample(self._rng) if distribution is not None else 0)
+
+                if self.error_rate > 0 and self._rng.random() < self.error_rate:
+                    self.error_counts[key] += 1
+                    raise APIError({
+                        "message": f"Injected fake error: {key}",
+                        "code": "FAKE",
+                        "hint": None,
+                        "details": f"error_rate={self.error_rate}",
+                    })
+                response = query._run()
+        except BaseException:
+            observe_db_call(query.table, query.operation, time.perf_counter() - started, ok=False)
+            raise
+        observe_db_call(query.table, query.operation, time.perf_counter() - started, ok=True)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """呼び出し回数・エラー回数（テーブル.操作 ごと）"""
+        return {
+            "calls": self.calls,
+            "errors": sum(self.error_counts.values()),
+            "call_counts": dict(self.call_counts),
+            "error_counts": dict(self.error_counts),
+            "latency": {operation: repr(distribution) for operation, distribution in self.latency.items()},
+            "error_rate": self.error_rate,
+        }
+
+    def reset_stats(self):
+        self.calls = 0
+        self.call_counts.clear()
+        self.error_counts.clear()
+
+    async def aclose(self):
+        pass
+
+
+def load_tables(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """テーブル名 → 行のリスト のJSONファイルを読み込む（未知のテーブル名はエラー）"""
+    with open(path, encoding="utf-8") as f:
+        tables = json.load(f)
+    unknown = set(tables) - set(PRIMARY_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown tables in {path}: {', '.join(sorted(unknown))}")
+    return tables
+
+
+def create_fake_client_from_env() -> FakeDataClient:
+    """
+    環境変数からフェイククライアントを生成
+
+    環境変数:
+        FAKE_SUPABASE_DATA: 初期データのJSONファイル（テーブル名 → 行のリスト、省略時は空）
+        FAKE_SUPABASE_LATENCY: レイテンシ分布（例: "lognormal:5:0.5"、"select=uniform:2:8,upsert=constant:15"）
+        FAKE_SUPABASE_ERROR_RATE: クエリが失敗する確率（0.0〜1.0）
+        FAKE_SUPABASE_SEED: レイテンシ・エラー発生の乱数シード
+        SUPABASE_TIMEOUT: 1回のクエリのタイムアウト（秒）
+    """
+    data_path = os.getenv("FAKE_SUPABASE_DATA")
+    seed = os.getenv("FAKE_SUPABASE_SEED")
+    timeout = os.getenv("SUPABASE_TIMEOUT")
+    return FakeDataClient(
+        load_tables(data_path) if data_path else None,
+        latency=parse_latency(os.getenv("FAKE_SUPABASE_LATENCY")),
+        error_rate=float(os.getenv("FAKE_SUPABASE_ERROR_RATE", "0")),
+        timeout=float(timeout) if timeout else None,
+        seed=int(seed) if seed else None,
+    )
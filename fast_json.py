@@ -0,0 +1,63 @@
+"""
+Fast JSON
+=========
+JSONのデコード・エンコードを1か所にまとめた層
+orjsonがインストールされていればorjson、なければ標準のjsonモジュールを使用する
+
+- loads: JSONカラム（selected_features_timeline 等のJSON文字列）のデコード
+- dumps: UTF-8のbytesにエンコード（非ASCII文字はエスケープしない・区切りの空白なし）
+- FastJSONResponse: 全エンドポイントの既定のレスポンスクラス
+"""
+
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson未インストール環境
+    orjson = None
+
+
+# デコード失敗時の例外（orjson.JSONDecodeError も json.JSONDecodeError のサブクラス）
+JSONDecodeError = json.JSONDecodeError
+
+# JSONとして解釈され得る文字列の先頭文字（json.loads が受け付けるNaN/Infinityを含む）
+_JSON_START_CHARS = frozenset('{["-0123456789tfnNI')
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """
+    JSON文字列（またはbytes）をデコード
+    orjsonが受け付けない値（NaN / Infinity 等、json.loads は受け付ける）を含む場合は json.loads でデコードし直す
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """UTF-8のJSON bytesにエンコード（dictのキーは文字列以外も可）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def may_be_json(text: str) -> bool:
+    """
+    デコードを試す価値がある文字列か（先頭の非空白文字による安価な事前判定）
+    Falseの場合、その文字列は json.loads でも必ずデコードに失敗する
+    """
+    stripped = text.lstrip()
+    return bool(stripped) and stripped[0] in _JSON_START_CHARS
+
+
+class FastJSONResponse(JSONResponse):
+    """fast_json.dumps でエンコードするJSONレスポンス"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
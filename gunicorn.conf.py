@@ -0,0 +1,75 @@
+"""
+Gunicorn設定（マルチプロセス運用）
+==================================
+uvicornのワーカー（UvicornWorker）を WEB_CONCURRENCY 個起動し、ワーカーごとに1つのイベントループで処理する
+
+    gunicorn -c gunicorn.conf.py main:app
+
+- preload_app: アプリのコード（テンプレートなどのimport時の初期化）とカレンダー索引はマスターで1回だけ作成し、
+  ワーカーはforkでコピーオンライトで共有する（各ワーカーのウォームアップ（warmup.py）は接続プール等のみ）
+- Supabaseクライアント（接続プール）・ログのリスナースレッドはfork後に各ワーカーで作り直す
+  （main.py / log_config.py の os.register_at_fork）
+- 観測対象者情報キャッシュ・インクリメンタル集計・ジョブキュー・メトリクスはワーカーごと
+  インクリメンタル集計（1件約35KiB）・観測対象者情報キャッシュ・ジョブキュー（待機数・保持数）は、
+  SUMMARY_STATE_MAX_SIZE / SUBJECT_CACHE_MAX_SIZE / JOB_QUEUE_MAX_SIZE・JOB_MAX_RETAINED をワーカー数で割った件数を
+  ワーカーごとの上限とし、プロセス全体のメモリ量がワーカー数に比例して増えないようにする
+- 既定は1ワーカー。観測対象者情報キャッシュの無効化（POST /subject-cache/invalidate）・
+  バックフィルの進捗（GET /admin/backfill/{job_id}）はリクエストを受けたワーカーにしか作用しないため、
+  複数ワーカーではこれらの制約を許容できる場合のみ WEB_CONCURRENCY を増やす
+  非同期モードのジョブ（GET /jobs/{job_id}）は JOB_STATE_DIR を指定した場合のみワーカー間で共有される
+
+環境変数:
+    WEB_CONCURRENCY: ワーカー数（既定: 1）
+    PORT: 待ち受けポート（既定: 8009）
+    GUNICORN_PRELOAD: アプリをマスターで読み込んでからforkするか（既定: true）
+    GUNICORN_TIMEOUT: ワーカーの応答がない場合に再起動するまでの秒数（既定: 60）
+    GUNICORN_MAX_REQUESTS: 指定したリクエスト数でワーカーを再起動（既定: 0 = 再起動しない）
+"""
+
+import os
+import math
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8009')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or 1)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    """ワーカーのfork前にカレンダー索引を作成（preload_app の場合のみ、ワーカーごとの作成を省く）"""
+    if server.cfg.preload_app:
+        from calendar_index import get_calendar_index
+        get_calendar_index()
+    if server.cfg.workers > 1:
+        server.log.warning("%d workers: subject cache invalidation and backfill status "
+                           "only apply to the worker that receives the request", server.cfg.workers)
+        if not os.getenv("JOB_STATE_DIR"):
+            server.log.warning("JOB_STATE_DIR is not set: async job status is only available "
+                               "from the worker that accepted the job")
+
+
+def _per_worker(server, name: str, default: int) -> int:
+    """環境変数の上限（全ワーカーの合計）をワーカー数で割った、ワーカーごとの上限"""
+    return max(1, math.ceil(int(os.getenv(name, default)) / server.cfg.workers))
+
+
+def post_fork(server, worker):
+    """ワーカーごとのキャッシュ・ジョブキューの上限を設定"""
+    from jobs import DEFAULT_MAX_QUEUED, DEFAULT_MAX_RETAINED, job_queue
+    from subject_cache import DEFAULT_MAX_SIZE, subject_cache
+    from summary_state import DEFAULT_MAX_STATES, summary_states
+
+    summary_states.resize(_per_worker(server, "SUMMARY_STATE_MAX_SIZE", DEFAULT_MAX_STATES))
+    subject_cache.resize(_per_worker(server, "SUBJECT_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE))
+    job_queue.resize(_per_worker(server, "JOB_QUEUE_MAX_SIZE", DEFAULT_MAX_QUEUED),
+                     _per_worker(server, "JOB_MAX_RETAINED", DEFAULT_MAX_RETAINED))
+    server.log.info("Worker %s: limits summary states %d, subjects %d, queued jobs %d, retained jobs %d",
+                    worker.pid, summary_states.max_size, subject_cache.max_size,
+                    job_queue.max_queued, job_queue.max_retained)
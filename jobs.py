@@ -0,0 +1,333 @@
+"""
+Job Queue
+=========
+非同期モード（async_mode=true）のリクエストをプロセス内のキューに積み、ワーカーで処理する
+呼び出し側（Lambda）は 202 Accepted と job_id を受け取ってすぐに終了し、結果は GET /jobs/{job_id} で確認する
+
+- 同時に処理するジョブ数は JOB_WORKERS
+- 同じキー（種類・device_id・date・time_block・オプション）のジョブが待機中の場合は新たに積まず、そのジョブを返す（重複排除）
+  実行中のジョブとは重複排除しない（実行中のジョブがデータを読み込んだ後に入力が更新された可能性があるため）
+- 終了したジョブの状態・結果は JOB_RESULT_TTL 秒（最大 JOB_MAX_RETAINED 件）保持
+- キューはプロセス内のメモリのみ。シャットダウン時は JOB_SHUTDOWN_TIMEOUT 秒まで待機中・実行中のジョブの完了を待つ
+  （強制終了・再起動では待機中のジョブは失われる）
+- JOB_STATE_DIR を指定した場合、ジョブの状態（受け付け・開始・終了の各時点）を <JOB_STATE_DIR>/<job_id>.json に書き出し、
+  自プロセスにないジョブは書き出された状態を返す（gunicornの複数ワーカーでも、どのワーカーからでも状態・結果を取得できる）
+  書き出し・削除は専用の1スレッドで順に行い、イベントループを止めない。保持期間を過ぎたファイルは削除する
+
+環境変数:
+    JOB_WORKERS: 同時に処理するジョブ数（既定: 4）
+    JOB_QUEUE_MAX_SIZE: 待機できるジョブ数の上限（超えた場合は503、既定: 10000）
+    JOB_RESULT_TTL: 終了したジョブの状態を保持する秒数（既定: 3600）
+    JOB_MAX_RETAINED: 保持するジョブ数の上限（既定: 2000）
+    JOB_SHUTDOWN_TIMEOUT: シャットダウン時にジョブの完了を待つ秒数（既定: 20）
+    JOB_STATE_DIR: ワーカー間で共有するジョブの状態の書き出し先（既定: なし = プロセス内のみ）
+"""
+
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import fast_json
+from metrics import JOBS, JOB_QUEUE_DEPTH, JOB_QUEUE_WAIT, JOB_RUN_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUED = 10000
+DEFAULT_RESULT_TTL = 3600
+DEFAULT_MAX_RETAINED = 2000
+DEFAULT_SHUTDOWN_TIMEOUT = 20
+
+# job_id は状態のファイル名に使うため、生成する形式（uuid4の先頭12桁）以外は参照しない
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{12}$")
+
+
+class Job:
+    """1件の非同期処理（status: queued → running → completed / failed / cancelled）"""
+
+    def __init__(self, kind: str, key: Tuple, run: Callable[[], Awaitable[Any]], params: Dict[str, Any]):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.params = params
+        self.run = run
+        self.status = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.created = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.error_status: Optional[int] = None
+        self.duplicates = 0   # 重複排除でこのジョブにまとめたリクエスト数
+
+    def to_dict(self) -> Dict[str, Any]:
+        """GET /jobs/{job_id} のレスポンス（終了後は処理結果またはエラーを含む）"""
+        now = time.monotonic()
+        info = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "queued_ms": round(((self.started or now) - self.created) * 1000, 1),
+            "run_ms": round(((self.finished or now) - self.started) * 1000, 1) if self.started else None,
+            "duplicates": self.duplicates,
+        }
+        if self.status == "completed":
+            info["result"] = self.result
+        elif self.status == "failed":
+            info["error"] = self.error
+            info["error_status"] = self.error_status
+        return info
+
+
+class JobQueue:
+    """プロセス内のジョブキューとワーカー（ワーカーは最初のジョブの受け付け時に起動）"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 result_ttl: float = DEFAULT_RESULT_TTL, max_retained: int = DEFAULT_MAX_RETAINED,
+                 state_dir: Optional[str] = None):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.max_retained = max_retained
+        self.jobs: Dict[str, Job] = {}
+        # 終了したジョブ（終了した順）。保持期間・保持数の上限による削除はこちらの先頭から
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()
+        self._queued_keys: Dict[Tuple, Job] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running = 0
+        self.state_dir = state_dir or None
+        # 状態ファイルの書き出し・削除を順に行うスレッド（fork後の最初の利用時に作成）
+        self._io: Optional[ThreadPoolExecutor] = None
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._queued_keys.clear()
+        # ワーカーは受け付けたリクエストのコンテキスト（トレース等）を引き継がないよう空のコンテキストで起動
+        self._worker_tasks = [
+            loop.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+        ]
+
+    def submit(self, kind: str, key: Tuple, run: Callable[[], Awaitable[Any]],
+               params: Dict[str, Any]) -> Tuple[Job, bool]:
+        """
+        ジョブを受け付ける
+
+        Returns:
+            (ジョブ, 待機中の同じキーのジョブにまとめたか)
+
+        Raises:
+            asyncio.QueueFull: 待機中のジョブ数が上限に達している場合
+        """
+        self._ensure_workers()
+        self._expire()
+
+        existing = self._queued_keys.get(key)
+        if existing is not None:
+            existing.duplicates += 1
+            JOBS.inc(kind=kind, outcome="deduplicated")
+            return existing, True
+
+        if self._queue.qsize() >= self.max_queued:
+            JOBS.inc(kind=kind, outcome="rejected")
+            raise asyncio.QueueFull(f"Job queue is full ({self.max_queued} jobs)")
+
+        job = Job(kind, key, run, params)
+        self.jobs[job.job_id] = job
+        self._queued_keys[key] = job
+        self._queue.put_nowait(job)
+        JOBS.inc(kind=kind, outcome="queued")
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+        self._persist(job)
+        return job, False
+
+    def resize(self, max_queued: int, max_retained: int):
+        """待機できるジョブ数・保持するジョブ数の上限を変更（超えている終了済みのジョブは古いものから削除）"""
+        self.max_queued = max_queued
+        self.max_retained = max_retained
+        self._expire()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態（自プロセスにない場合は JOB_STATE_DIR に書き出された状態、見つからなければNone）"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.state_dir is None or not JOB_ID_PATTERN.match(job_id):
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), _read_state, self._state_path(job_id))
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._io is None:
+            self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-state")
+            # 以前のプロセス（再起動・強制終了したワーカー）が残した期限切れの状態ファイルを削除
+            self._io.submit(_sweep_states, self.state_dir, self.result_ttl)
+        return self._io
+
+    def _persist(self, job: Job):
+        """ジョブの状態を書き出す（JOB_STATE_DIR 指定時のみ。書き出しは専用スレッドで受け付けた順に行う）"""
+        if self.state_dir is None:
+            return
+        future = self._executor().submit(_write_state, self._state_path(job.job_id), job.to_dict())
+        future.add_done_callback(_log_io_error)
+
+    def _expire(self):
+        """
+        保持期間を過ぎた（または保持数の上限を超えた）終了済みのジョブを終了が古いものから削除
+        （待機中・実行中のジョブは削除しない）
+        """
+        now = time.monotonic()
+        expired = []
+        while self._finished:
+            job = next(iter(self._finished.values()))
+            if now - job.finished <= self.result_ttl and len(self.jobs) <= self.max_retained:
+                break
+            self._finished.popitem(last=False)
+            del self.jobs[job.job_id]
+            expired.append(job.job_id)
+        if expired and self.state_dir is not None:
+            future = self._executor().submit(_remove_states, [self._state_path(job_id) for job_id in expired])
+            future.add_done_callback(_log_io_error)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        if self._queued_keys.get(job.key) is job:
+            del self._queued_keys[job.key]
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+        job.status = "running"
+        job.started = time.monotonic()
+        JOB_QUEUE_WAIT.observe(job.started - job.created, kind=job.kind)
+        self._running += 1
+        self._persist(job)
+        try:
+            job.result = await job.run()
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            # HTTPException は detail / status_code をそのまま記録
+            job.status = "failed"
+            job.error = str(getattr(e, "detail", e))
+            job.error_status = getattr(e, "status_code", 500)
+            logger.warning("Job failed: %s", job.error, extra={"job_id": job.job_id, "kind": job.kind, **job.params})
+        finally:
+            self._running -= 1
+            job.finished = time.monotonic()
+            self._finished[job.job_id] = job
+            self._persist(job)
+            self._expire()
+            JOB_RUN_DURATION.observe(job.finished - job.started, kind=job.kind)
+            JOBS.inc(kind=job.kind, outcome=job.status)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "retained": len(self.jobs),
+            "workers": self.workers,
+        }
+
+    async def close(self, timeout: Optional[float] = None):
+        """シャットダウン時: 待機中・実行中のジョブの完了を timeout 秒まで待ち、ワーカーを停止"""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        if timeout is None:
+            timeout = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", DEFAULT_SHUTDOWN_TIMEOUT))
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Shutting down with unfinished jobs", extra=self.stats())
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        if self._io is not None:
+            # 書き出し待ちの状態ファイルを書き出してからスレッドを停止
+            await asyncio.get_running_loop().run_in_executor(None, self._io.shutdown)
+            self._io = None
+        self._worker_tasks = []
+        self._loop = None
+        self._queue = None
+
+
+def _write_state(path: str, info: Dict[str, Any]):
+    """一時ファイル経由で置き換え（読み込み側が書きかけのファイルを読まないため）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(fast_json.dumps(info))
+    os.replace(tmp_path, path)
+
+
+def _read_state(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as f:
+            return fast_json.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _remove_states(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _sweep_states(state_dir: str, result_ttl: float):
+    """更新から result_ttl 秒を過ぎた状態ファイルを削除"""
+    try:
+        entries = list(os.scandir(state_dir))
+    except FileNotFoundError:
+        return
+    deadline = time.time() - result_ttl
+    _remove_states([entry.path for entry in entries if entry.name.endswith(".json") and entry.stat().st_mtime < deadline])
+
+
+def _log_io_error(future):
+    if future.exception() is not None:
+        logger.warning("Failed to write job state: %s", future.exception())
+
+
+def create_job_queue_from_env() -> JobQueue:
+    return JobQueue(
+        workers=int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS)),
+        max_queued=int(os.getenv("JOB_QUEUE_MAX_SIZE", DEFAULT_MAX_QUEUED)),
+        result_ttl=float(os.getenv("JOB_RESULT_TTL", DEFAULT_RESULT_TTL)),
+        max_retained=int(os.getenv("JOB_MAX_RETAINED", DEFAULT_MAX_RETAINED)),
+        state_dir=os.getenv("JOB_STATE_DIR"),
+    )
+
+
+# プロセス内で共有するジョブキュー
+job_queue = create_job_queue_from_env()
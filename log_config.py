@@ -0,0 +1,185 @@
+"""
+Logging
+=======
+構造化ログ（JSON Lines）の設定
+ログの整形と標準出力への書き込みはキュー経由でリスナースレッドが行い、イベントループ上では
+メッセージの確定（%形式の引数の展開）とキューへの追加のみを行う
+
+- 各モジュールは logging.getLogger(__name__) を使用し、追加の項目は extra={...} で渡す
+  （JSONの各キーとして出力。リクエスト処理中はトレースID（tracing.py）も付与）
+- タイムブロック単位のデバッグログは get_block_logger(__name__)（"<モジュール名>.blocks"）に出力し、
+  LOG_BLOCK_SAMPLE_RATE の割合だけ出力する（48ブロック×デバイス数で大量になるため）
+
+環境変数:
+    LOG_LEVEL: ルートのログレベル（既定: INFO）
+    LOG_LEVELS: ロガーごとのレベル（例: "timeblock_endpoint_v2=DEBUG,data_access=WARNING"）
+    LOG_FORMAT: json / text（既定: json）
+    LOG_BLOCK_SAMPLE_RATE: タイムブロック単位のデバッグログを出力する割合（0〜1、既定: 1）
+"""
+
+import os
+import sys
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+import fast_json
+from tracing import current_trace
+
+
+BLOCK_LOGGER_SUFFIX = ".blocks"
+
+# ライブラリのロガーの既定レベル（httpxはSupabaseへの全リクエストをINFOで出力するため）
+LIBRARY_LOG_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "hpack": "WARNING"}
+
+# LogRecordの標準属性（これ以外の属性を extra の項目として出力する）
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_settings: Dict[str, Any] = {}
+
+
+def get_block_logger(name: str) -> logging.Logger:
+    """タイムブロック単位のデバッグログ用ロガー（LOG_BLOCK_SAMPLE_RATE でサンプリング）"""
+    return logging.getLogger(name + BLOCK_LOGGER_SUFFIX)
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSON（timestamp / level / logger / message / extraの各項目 / exception）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return fast_json.dumps(entry).decode("utf-8")
+
+
+class TextFormatter(logging.Formatter):
+    """ローカル開発用の1行テキスト（extraの項目は key=value で末尾に付加）"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class BlockSampler(logging.Filter):
+    """"*.blocks" ロガーのDEBUG以下のレコードを sample_rate の割合だけ通す"""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not record.name.endswith(BLOCK_LOGGER_SUFFIX):
+            return True
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    呼び出し側ではメッセージの確定（引数が後で変更されても出力が変わらないように）とトレースIDの付与のみ行い、
+    例外のトレースバックを含む整形はリスナースレッドで行う
+    （標準の QueueHandler.prepare は呼び出し側でレコードの複製と整形まで行う。同一プロセス内のキューのため不要）
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        trace = current_trace()
+        if trace is not None and "trace_id" not in vars(record):
+            record.trace_id = trace.trace_id
+        return record
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for part in spec.split(","):
+        if part.strip():
+            name, _, level = part.partition("=")
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                  block_sample_rate: Optional[float] = None, stream=None) -> QueueListener:
+    """
+    ルートロガーにキュー経由のハンドラーを設定し、リスナースレッドを開始（2回目以降は再設定）
+
+    Args:
+        level / fmt / block_sample_rate: 省略時は環境変数 LOG_LEVEL / LOG_FORMAT / LOG_BLOCK_SAMPLE_RATE
+        stream: 出力先（既定: 標準出力）
+    """
+    global _listener, _settings
+    shutdown_logging()
+    _settings = {"level": level, "fmt": fmt, "block_sample_rate": block_sample_rate, "stream": stream}
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    if block_sample_rate is None:
+        block_sample_rate = float(os.getenv("LOG_BLOCK_SAMPLE_RATE", "1"))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _RecordQueueHandler(log_queue)
+    handler.addFilter(BlockSampler(block_sample_rate))
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, _RecordQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    levels = {**LIBRARY_LOG_LEVELS, **_parse_levels(os.getenv("LOG_LEVELS", ""))}
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """キューに残っているレコードを書き出してリスナースレッドを停止"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    """
+    fork後の子プロセスでリスナースレッドを起動し直す（スレッドはforkで引き継がれないため、
+    そのままではキューに積まれたレコードが出力されない。gunicornの preload_app など）
+    """
+    global _listener
+    if _listener is not None:
+        _listener = None
+        setup_logging(**_settings)
+
+
+atexit.register(shutdown_logging)
+os.register_at_fork(after_in_child=_restart_after_fork)
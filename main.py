@@ -7,13 +7,18 @@ https://api.hey-watch.me/vibe-aggregator
 Supabase対応版: vibe_whisperテーブルから読み込み、vibe_whisper_promptテーブルに保存
 """
 
+import time
+
+# 起動時間の計測開始（import時間・readyまでの時間は warmup.StartupState に記録）
+_startup_started = time.perf_counter()
+
 import os
-import json
-import uvicorn
-from datetime import datetime, timedelta
+import asyncio
+import logging
+import threading
+from datetime import datetime
 from typing import List, Dict, Any, Optional
-import jpholiday
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
@@ -21,13 +26,25 @@ from fastapi.middleware.cors import CORSMiddleware
 # .envファイルの読み込み
 load_dotenv()
 
-from supabase import create_client, Client
+from log_config import setup_logging
+
+# 構造化ログ（キュー経由で標準出力へ、LOG_LEVEL / LOG_FORMAT / LOG_BLOCK_SAMPLE_RATE）
+setup_logging()
+logger = logging.getLogger(__name__)
+
+from data_access import create_client_from_env
+from fast_json import FastJSONResponse
+from metrics import MetricsMiddleware, CONTENT_TYPE, observe_prompt, register_cache, render_latest
+from tracing import TracingMiddleware, create_exporter_from_env, span
+from warmup import StartupState, run_warm_up
+from write_behind import dashboard_writes
 
 # FastAPIアプリケーションの初期化
 app = FastAPI(
     title="Mood Chart Prompt Generator API",
     description="1日分のトランスクリプションを統合し、ChatGPT分析用プロンプトを生成 (Supabase対応版)",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS設定
@@ -39,27 +56,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Supabaseクライアントの遅延初期化
+# エンドポイントごとのリクエスト数・レイテンシ（GET /metrics で公開）
+app.add_middleware(MetricsMiddleware)
+
+# フェーズごとの所要時間（Server-Timing ヘッダー、TRACE_EXPORT_PATH 指定時はJSON Linesにも出力）
+app.add_middleware(TracingMiddleware, exporter=create_exporter_from_env())
+
+# Supabaseクライアントの遅延初期化（非同期・接続プール共有）
+# プロセス（ワーカー）ごとに1つ。fork後の子プロセスでは親の接続プールを使わずに作り直す
 supabase_client = None
+_supabase_client_lock = threading.Lock()
 
 def get_supabase_client():
-    """Supabaseクライアントを遅延初期化して取得"""
+    """Supabaseクライアント（非同期データアクセス層）を遅延初期化して取得（スレッドセーフ）"""
     global supabase_client
     if supabase_client is None:
-        try:
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_KEY")
-            
-            if not url or not key:
-                raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
-            
-            supabase_client = create_client(url, key)
-            print(f"✅ Supabase client initialized")
-        except Exception as e:
-            print(f"❌ Failed to initialize Supabase client: {e}")
-            raise
+        with _supabase_client_lock:
+            if supabase_client is None:
+                try:
+                    supabase_client = create_client_from_env()
+                    logger.info("Supabase client initialized (%s)", type(supabase_client).__name__,
+                                extra={"http2": supabase_client.http2, "pid": os.getpid()})
+                except Exception:
+                    logger.exception("Failed to initialize Supabase client")
+                    raise
     return supabase_client
 
+
+def _reset_supabase_client_after_fork():
+    """
+    fork後の子プロセスでクライアントを破棄（次の呼び出しで子プロセスの接続プールを作成）
+    親のソケットを閉じないよう aclose は呼ばずに参照のみ外す
+    """
+    global supabase_client, _supabase_client_lock
+    supabase_client = None
+    _supabase_client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_supabase_client_after_fork)
+
+
+# 起動時のウォームアップの状態（GET /health/ready）
+startup_state = StartupState(started=_startup_started)
+_warm_up_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    """ウォームアップをバックグラウンドで開始（完了まで /health/ready は503、/health/live は応答する）"""
+    global _warm_up_task
+    _warm_up_task = asyncio.create_task(run_warm_up(startup_state, get_supabase_client))
+
+
+@app.on_event("shutdown")
+async def close_supabase_client():
+    """
+    非同期モードのジョブの完了を待ち、dashboardへの書き込み待ちの行を書き込んでから接続プールを閉じる
+    （ウォームアップ中の場合は中断）
+    """
+    global supabase_client
+    if _warm_up_task is not None and not _warm_up_task.done():
+        _warm_up_task.cancel()
+    await job_queue.close()
+    await dashboard_writes.close()
+    if supabase_client is not None:
+        await supabase_client.aclose()
+        supabase_client = None
+
 # レスポンスモデル
 class PromptResponse(BaseModel):
     status: str
@@ -135,13 +198,31 @@ def generate_chatgpt_prompt(device_id: str, date: str, texts: List[str]) -> str:
 📊 分析対象の発話ログ（{date}）:
 {timeline_text}"""
     
+    observe_prompt("chatgpt", prompt)
     return prompt
 
 @app.get("/health")
 async def health_check():
-    """ヘルスチェックエンドポイント"""
+    """ヘルスチェックエンドポイント（プロセスが応答するか。/health/live と同じ）"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/health/live")
+async def liveness():
+    """liveness: イベントループが応答するか（ウォームアップ中も200）"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness(response: Response):
+    """readiness: ウォームアップが完了したか（完了まで503、各フェーズの所要時間を返す）"""
+    if not startup_state.ready:
+        response.status_code = 503
+    return startup_state.to_dict()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus形式のメトリクス（エンドポイント・DB呼び出し・キャッシュ・プロンプト文字数）"""
+    return Response(render_latest(), media_type=CONTENT_TYPE)
+
 @app.get("/generate-mood-prompt-supabase", response_model=PromptResponse)
 async def generate_mood_prompt_supabase(
     device_id: str = Query(..., description="デバイスID"),
@@ -171,7 +252,7 @@ async def generate_mood_prompt_supabase(
     - missing_files: 欠損している時間帯のリスト
     - generated_at: 生成日時
     """
-    print(f"🌟 Supabaseエンドポイントが呼ばれました: device_id={device_id}, date={date}")
+    logger.info("Supabaseエンドポイントが呼ばれました", extra={"device_id": device_id, "date": date})
     
     try:
         # 日付形式の検証
@@ -191,44 +272,52 @@ async def generate_mood_prompt_supabase(
         processed_files = []
         missing_files = []
         
-        # 時間帯リスト（00-00から23-30まで）
-        time_blocks = []
-        for hour in range(24):
-            for minute in ["00", "30"]:
-                time_blocks.append(f"{hour:02d}-{minute}")
+        # 1日分のレコードを1回のクエリでまとめて取得（時間帯ごとの48回のクエリを置き換え）
+        try:
+            rows_by_block = await get_day_rows(client, 'vibe_whisper', 'transcription', device_id, date)
+        except Exception as e:
+            logger.error("1日分のデータ取得エラー: %s", e, extra={"device_id": device_id, "date": date})
+            rows_by_block = None
         
-        # 各時間帯のデータを取得
-        for time_block in time_blocks:
+        # 各時間帯（00-00から23-30まで）に振り分け
+        for time_block in TIME_BLOCKS:
+            if rows_by_block is None:
+                missing_files.append(f"{time_block} (取得エラー)")
+                continue
+            
+            row = rows_by_block.get(time_block)
+            if row is None:
+                # レコードが存在しない場合のみ欠損として処理（nullとして扱う）
+                missing_files.append(time_block)
+                continue
+            
             try:
-                # Supabaseから該当レコードを取得
-                response = client.table('vibe_whisper').select('transcription').eq('device_id', device_id).eq('date', date).eq('time_block', time_block).execute()
-                
-                if response.data and len(response.data) > 0:
-                    transcription = response.data[0].get('transcription', '').strip()
-                    if transcription:
-                        # 発話あり：テキストを分析
-                        texts.append(f"[{time_block}] {transcription}")
-                        processed_files.append(time_block)
-                    else:
-                        # 空文字列の場合：録音は成功したが発話なし（0点として処理）
-                        texts.append(f"[{time_block}] (発話なし)")
-                        processed_files.append(time_block)
+                transcription = row.get('transcription', '').strip()
+                if transcription:
+                    # 発話あり：テキストを分析
+                    texts.append(f"[{time_block}] {transcription}")
+                    processed_files.append(time_block)
                 else:
-                    # レコードが存在しない場合のみ欠損として処理（nullとして扱う）
-                    missing_files.append(time_block)
-                    
+                    # 空文字列の場合：録音は成功したが発話なし（0点として処理）
+                    texts.append(f"[{time_block}] (発話なし)")
+                    processed_files.append(time_block)
             except Exception as e:
-                print(f"❌ 時間帯 {time_block} の取得エラー: {e}")
+                logger.error("時間帯の取得エラー: %s", e,
+                             extra={"device_id": device_id, "date": date, "time_block": time_block})
                 missing_files.append(f"{time_block} (取得エラー)")
         
         # デバッグ情報
-        print(f"✅ 処理済み: {len(processed_files)}個の時間帯")
-        print(f"❌ 欠損: {len(missing_files)}個の時間帯")
-        if missing_files[:5]:  # 最初の5個だけ表示
-            print(f"   欠損時間帯例: {missing_files[:5]}...")
+        logger.info("処理済み: %d個の時間帯、欠損: %d個の時間帯", len(processed_files), len(missing_files), extra={
+            "device_id": device_id,
+            "date": date,
+            "processed": len(processed_files),
+            "missing": len(missing_files),
+            "missing_examples": missing_files[:5]  # 最初の5個だけ出力
+        })
         
         # ChatGPT用プロンプトの生成
-        prompt = generate_chatgpt_prompt(device_id, date, texts)
+        with span("render"):
+            prompt = generate_chatgpt_prompt(device_id, date, texts)
         
         # vibe_whisper_promptテーブルに保存（UPSERT）
         prompt_data = {
@@ -242,9 +331,9 @@ async def generate_mood_prompt_supabase(
         
         try:
             # 既存レコードを更新または新規作成
-            response = client.table('vibe_whisper_prompt').upsert(prompt_data, on_conflict='device_id,date').execute()
+            response = await client.table('vibe_whisper_prompt').upsert(prompt_data, on_conflict='device_id,date').execute()
             
-            print(f"✅ vibe_whisper_promptテーブルに保存完了")
+            logger.info("vibe_whisper_promptテーブルに保存完了", extra={"device_id": device_id, "date": date})
             
             return PromptResponse(
                 status="success",
@@ -252,29 +341,39 @@ async def generate_mood_prompt_supabase(
             )
             
         except Exception as e:
-            print(f"❌ データベース保存エラー: {e}")
+            logger.error("データベース保存エラー: %s", e, extra={"device_id": device_id, "date": date})
             raise HTTPException(status_code=500, detail=f"データベース保存エラー: {str(e)}")
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ 予期しないエラー: {e}")
+        logger.exception("予期しないエラー", extra={"device_id": device_id, "date": date})
         raise HTTPException(status_code=500, detail=f"内部サーバーエラー: {str(e)}")
 
 # ===============================
 # 新規: タイムブロック単位の処理エンドポイント
 # ===============================
 from timeblock_endpoint import (
-    process_and_save_to_dashboard,
+    TIME_BLOCKS,
+    get_day_rows,
     get_weekday_info,
-    get_season,
-    generate_age_context
+    get_season
 )
-from timeblock_endpoint_v2 import process_timeblock_v3
+from timeblock_endpoint_v2 import process_timeblock_v3, process_day_v3
+from backfill import backfill_jobs, start_backfill_job
+from jobs import job_queue
+from singleflight import timeblock_flights, dashboard_summary_flights
+from subject_cache import subject_cache, get_cached_subject_info
+from calendar_index import get_calendar_day
+from summary_state import DaySummaryState, summary_states, burst_event_between
+
+register_cache("subject", subject_cache)
+register_cache("summary_state", summary_states)
+from prompt_templates import PromptTemplate
 
 def get_holiday_context(date: str) -> Dict[str, Any]:
     """
-    指定日の祝日・連休情報を取得
+    指定日の祝日・連休情報を取得（事前計算済みのカレンダー索引を参照）
     
     Args:
         date: 日付 (YYYY-MM-DD形式)
@@ -283,43 +382,15 @@ def get_holiday_context(date: str) -> Dict[str, Any]:
         祝日情報と連休コンテキストを含む辞書
     """
     try:
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        
-        # 祝日判定
-        holiday_name = jpholiday.is_holiday_name(date_obj)
-        is_holiday = holiday_name is not None
-        
-        # 前後の日付を確認して連休判定
-        day_before = date_obj - timedelta(days=1)
-        day_after = date_obj + timedelta(days=1)
-        
-        holiday_before = jpholiday.is_holiday_name(day_before)
-        holiday_after = jpholiday.is_holiday_name(day_after)
-        is_weekend_before = day_before.weekday() >= 5
-        is_weekend_after = day_after.weekday() >= 5
-        is_weekend_current = date_obj.weekday() >= 5
-        
-        # 連休のコンテキスト生成
-        consecutive_context = ""
-        if (holiday_before or is_weekend_before) and (holiday_after or is_weekend_after):
-            consecutive_context = "3連休の中日"
-        elif holiday_after or is_weekend_after:
-            consecutive_context = "連休初日"
-        elif holiday_before or is_weekend_before:
-            consecutive_context = "連休最終日"
-        elif is_holiday:
-            consecutive_context = "祝日"
-        elif is_weekend_current:
-            consecutive_context = "週末"
-        
+        day = get_calendar_day(date)
         return {
-            "is_holiday": is_holiday,
-            "holiday_name": holiday_name,
-            "consecutive_context": consecutive_context,
-            "is_weekend": is_weekend_current
+            "is_holiday": day.is_holiday,
+            "holiday_name": day.holiday_name,
+            "consecutive_context": day.consecutive_context,
+            "is_weekend": day.is_weekend
         }
     except Exception as e:
-        print(f"祝日情報の取得に失敗: {e}")
+        logger.warning("祝日情報の取得に失敗: %s", e, extra={"date": date})
         return {
             "is_holiday": False,
             "holiday_name": None,
@@ -331,24 +402,72 @@ def get_holiday_context(date: str) -> Dict[str, Any]:
 async def generate_timeblock_prompt(
     device_id: str = Query(..., description="デバイスID"),
     date: str = Query(..., description="日付 (YYYY-MM-DD)"),
-    time_block: str = Query(..., description="タイムブロック (例: 14-30)")
+    time_block: str = Query(..., description="タイムブロック (例: 14-30)"),
+    force: bool = Query(False, description="入力が前回と同一でもプロンプトを再生成・保存する"),
+    async_mode: bool = Query(False, description="ジョブキューに積んで202を返す（結果は GET /jobs/{job_id}）")
 ):
     """
     30分単位でWhisper + SEDデータ + 観測対象者情報を使用してプロンプト生成
+    入力が前回保存時と同一の場合は再生成せず status="unchanged" を返す
+    async_mode=true の場合はジョブキューに積んで 202 と job_id を返す（同じ条件の待機中のジョブがあればそのジョブを返す）
     """
+    if async_mode:
+        validate_job_params(date, time_block)
+        return enqueue_job(
+            "timeblock", {"device_id": device_id, "date": date, "time_block": time_block, "force": force},
+            lambda: run_timeblock(device_id, date, time_block, force)
+        )
+    
     try:
-        # Supabaseクライアント取得
-        supabase = get_supabase_client()
+        # 処理実行（改善版V3を使用、同じ条件の同時リクエストは1回の処理にまとめる）
+        result = await run_timeblock(device_id, date, time_block, force)
         
-        # 処理実行（改善版V3を使用）
-        result = await process_timeblock_v3(supabase, device_id, date, time_block)
-        
-        return result
+        # プロンプト本文を含むためjsonable_encoderを経由せずに直接エンコード
+        return FastJSONResponse(result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def run_timeblock(device_id: str, date: str, time_block: str, force: bool = False) -> Dict[str, Any]:
+    """タイムブロック処理（同じ条件の同時リクエスト・ジョブは singleflight で1回の処理にまとめる）"""
+    return await timeblock_flights.do(
+        (device_id, date, time_block, force),
+        lambda: process_timeblock_v3(get_supabase_client(), device_id, date, time_block, force)
+    )
+
+
+@app.get("/generate-timeblock-prompts-day")
+async def generate_timeblock_prompts_day(
+    device_id: str = Query(..., description="デバイスID"),
+    date: str = Query(..., description="日付 (YYYY-MM-DD)"),
+    start_block: Optional[str] = Query(None, description="開始タイムブロック (例: 00-00、省略時は1日の最初)"),
+    end_block: Optional[str] = Query(None, description="終了タイムブロック (例: 23-30、省略時は1日の最後)"),
+    include_prompts: bool = Query(False, description="結果に各ブロックのプロンプト本文を含める")
+):
+    """
+    1日分（またはタイムブロックの範囲）のプロンプトをまとめて生成してdashboardテーブルに保存
+    /generate-timeblock-promptを48回呼ぶ代わりに、各テーブル1回の取得・1回の複数行UPSERT・
+    テーブルごとのstatus一括更新で処理する
+    """
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無効な日付形式です。YYYY-MM-DD形式で入力してください。")
+    
+    for block in (start_block, end_block):
+        if block is not None and block not in TIME_BLOCKS:
+            raise HTTPException(status_code=400, detail=f"無効なタイムブロックです: {block}（例: 14-30）")
+    
+    try:
+        supabase = get_supabase_client()
+        result = await process_day_v3(supabase, device_id, date, start_block, end_block, include_prompts)
+        # 最大48ブロック分のプロンプト本文を含むためjsonable_encoderを経由せずに直接エンコード
+        return FastJSONResponse(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/test-timeblock")
 async def test_timeblock_processing():
     """
@@ -374,10 +493,101 @@ async def test_timeblock_processing():
         return {"error": str(e)}
 
 
+@app.post("/admin/backfill")
+async def start_backfill(
+    device_ids: str = Query(..., description="デバイスIDのカンマ区切りリスト"),
+    start_date: str = Query(..., description="開始日 (YYYY-MM-DD)"),
+    end_date: str = Query(..., description="終了日 (YYYY-MM-DD、含む)"),
+    start_block: Optional[str] = Query(None, description="開始タイムブロック (例: 00-00)"),
+    end_block: Optional[str] = Query(None, description="終了タイムブロック (例: 23-30)"),
+    concurrency: int = Query(4, ge=1, description="同時に処理するデバイス日数"),
+    rate: Optional[float] = Query(None, gt=0, description="1秒あたりに開始するデバイス日数の上限"),
+    job_id: Optional[str] = Query(None, description="再開するジョブID（チェックポイントから続きを処理）")
+):
+    """
+    複数デバイス・期間のタイムブロックプロンプトをバックグラウンドで再生成
+    進捗は GET /admin/backfill/{job_id} で確認
+    """
+    devices = [device_id.strip() for device_id in device_ids.split(",") if device_id.strip()]
+    try:
+        job = start_backfill_job(
+            get_supabase_client(), devices, start_date, end_date,
+            concurrency=concurrency, rate=rate,
+            start_block=start_block, end_block=end_block, job_id=job_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.progress()
+
+
+@app.get("/admin/backfill/{job_id}")
+async def get_backfill_status(job_id: str):
+    """バックフィルジョブの進捗（スループット・ETAを含む。ジョブの状態は開始したワーカーのみが保持）"""
+    job = backfill_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"バックフィルジョブが見つかりません: {job_id}")
+    return job.progress()
+
+
+def validate_job_params(date: str, time_block: Optional[str] = None):
+    """非同期モード: 受け付ける前に日付・タイムブロックを検証（不正なリクエストを202で受け付けない）"""
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無効な日付形式です。YYYY-MM-DD形式で入力してください。")
+    if time_block is not None and time_block not in TIME_BLOCKS:
+        raise HTTPException(status_code=400, detail=f"無効なタイムブロックです: {time_block}（例: 14-30）")
+
+
+def enqueue_job(kind: str, params: Dict[str, Any], run) -> FastJSONResponse:
+    """ジョブキューに積んで 202 Accepted を返す（キーは種類とパラメータ全体。同じキーの待機中のジョブがあればそのジョブ）"""
+    try:
+        job, deduplicated = job_queue.submit(kind, (kind, *params.values()), run, params)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="ジョブキューが上限に達しています。しばらくしてから再試行してください。")
+    return FastJSONResponse({
+        "job_id": job.job_id,
+        "status": job.status,
+        "deduplicated": deduplicated,
+        "status_url": f"/jobs/{job.job_id}"
+    }, status_code=202)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """非同期モードのジョブの状態（完了後は処理結果、失敗時はエラー。JOB_STATE_DIR 指定時は他のワーカーのジョブも参照）"""
+    info = await job_queue.status(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    # 処理結果にプロンプト本文を含むためjsonable_encoderを経由せずに直接エンコード
+    return FastJSONResponse(info)
+
+
+@app.post("/subject-cache/invalidate")
+async def invalidate_subject_cache(
+    device_id: Optional[str] = Query(None, description="デバイスID（省略時は全件を無効化）")
+):
+    """
+    観測対象者情報キャッシュの無効化
+    subjectsテーブルやデバイスの紐付けを変更した場合に呼び出す
+    キャッシュはワーカーごとのため、複数ワーカー（WEB_CONCURRENCY > 1）では受けたワーカーのキャッシュのみ無効化される
+    （他のワーカーは SUBJECT_CACHE_TTL まで変更前の情報を使う）
+    """
+    invalidated = subject_cache.invalidate(device_id)
+    return {
+        "status": "success",
+        "device_id": device_id,
+        "invalidated": invalidated,
+        "cache": subject_cache.stats()
+    }
+
+
 @app.get("/generate-dashboard-summary")
 async def generate_dashboard_summary(
     device_id: str = Query(..., description="デバイスID"),
-    date: str = Query(..., description="日付 (YYYY-MM-DD)")
+    date: str = Query(..., description="日付 (YYYY-MM-DD)"),
+    incremental: bool = Query(False, description="前回集計したlast_time_block以降のブロックのみ読み込んで集計に加える"),
+    async_mode: bool = Query(False, description="ジョブキューに積んで202を返す（結果は GET /jobs/{job_id}）")
 ):
     """
     dashboardテーブルの1日分の分析結果を統合してdashboard_summaryテーブルに保存
@@ -387,7 +597,35 @@ async def generate_dashboard_summary(
     2. summaryとvibe_scoreから累積型プロンプトを生成
     3. vibe_scoreから48要素の配列を生成（グラフ描画用）
     4. プロンプトをdashboard_summaryテーブルのpromptカラムに保存
+    
+    incremental=true の場合:
+    - プロセス内に保持した集計（vibe_scores配列・統計・タイムライン・バーストイベント候補）に
+      前回のlast_time_blockより後のブロックだけを読み込んで加える
+    - 集計が保持されていない場合（再起動直後など）は全件から集計する
+    - 集計済みブロックの後からの変更は反映されないため、必要に応じて通常モードで再集計する
+    
+    async_mode=true の場合はジョブキューに積んで 202 と job_id を返す（同じ条件の待機中のジョブがあればそのジョブを返す）
     """
+    if async_mode:
+        validate_job_params(date)
+        return enqueue_job(
+            "dashboard_summary", {"device_id": device_id, "date": date, "incremental": incremental},
+            lambda: run_dashboard_summary(device_id, date, incremental)
+        )
+    # プロンプト本文を含むためjsonable_encoderを経由せずに直接エンコード
+    return FastJSONResponse(await run_dashboard_summary(device_id, date, incremental))
+
+
+async def run_dashboard_summary(device_id: str, date: str, incremental: bool = False) -> Dict[str, Any]:
+    """dashboard_summaryの生成（同じ条件の同時リクエスト・ジョブは singleflight で1回の処理にまとめる）"""
+    return await dashboard_summary_flights.do(
+        (device_id, date, incremental),
+        lambda: build_dashboard_summary(device_id, date, incremental)
+    )
+
+
+async def build_dashboard_summary(device_id: str, date: str, incremental: bool = False) -> Dict[str, Any]:
+    """dashboard_summaryの生成・保存（/generate-dashboard-summary の処理本体、非同期モードではジョブから実行）"""
     try:
         # 日付形式の検証
         try:
@@ -401,136 +639,77 @@ async def generate_dashboard_summary(
         # Supabaseクライアント取得
         supabase = get_supabase_client()
         
+        # インクリメンタルモードでは保持済みの集計のコピーに新しいブロックを加える（保持中の集計は直接変更しない）
+        base_state = summary_states.get(device_id, date) if incremental else None
+        state = base_state.copy() if base_state is not None else None
+        
+        # 書き込みバッファに残っている該当日のdashboardの行を先に書き込む（直前の処理結果を読み込みに反映）
+        if dashboard_writes.enabled:
+            await dashboard_writes.flush_before_read(device_id, date)
+        
         # dashboardテーブルから該当日のvibe_scoreが存在するレコードを取得（時系列順）
         # ステータスに関係なく、データがあれば処理対象とする
-        dashboard_response = supabase.table("dashboard").select("*").eq(
+        query = supabase.table("dashboard").select("time_block", "summary", "vibe_score").eq(
             "device_id", device_id
         ).eq(
             "date", date
         ).not_.is_(
             "vibe_score", "null"  # vibe_scoreが存在するデータを全て対象とする
-        ).order(
+        )
+        if state is not None:
+            # 集計済みのブロックより後のみ読み込む
+            query = query.gt("time_block", state.last_time_block)
+        dashboard_response = await query.order(
             "time_block", desc=False
         ).execute()
         
-        if not dashboard_response.data:
-            return {
-                "status": "warning",
-                "message": f"vibe_scoreが存在するデータが見つかりません。device_id: {device_id}, date: {date}",
-                "processed_count": 0
-            }
-        
-        # データの整理と統合
-        processed_blocks = dashboard_response.data
-        processed_count = len(processed_blocks)
-        
-        # 最後のタイムブロックを取得
-        last_time_block = processed_blocks[-1]["time_block"] if processed_blocks else None
-        
-        # ========== 処理B: vibe_scores配列の生成（新規追加） ==========
-        # 48要素の配列を初期化（全てnull）
-        vibe_scores_array = [None] * 48
-        
-        # 時間ブロックのマッピング辞書を作成
-        time_block_to_index = {}
-        for hour in range(24):
-            for minute_idx, minute in enumerate(["00", "30"]):
-                time_block = f"{hour:02d}-{minute}"
-                index = hour * 2 + minute_idx
-                time_block_to_index[time_block] = index
-        
-        # vibe_scoreデータを配列の適切な位置に配置
-        vibe_score_sum = 0
-        vibe_score_count = 0
-        
-        for block in processed_blocks:
-            time_block = block.get("time_block")
-            vibe_score = block.get("vibe_score")
-            
-            # 対応するインデックスにvibe_scoreを設定
-            if time_block in time_block_to_index and vibe_score is not None:
-                index = time_block_to_index[time_block]
-                vibe_scores_array[index] = vibe_score
-                vibe_score_sum += vibe_score
-                vibe_score_count += 1
-        
-        # vibe_scoreの平均値を計算（nullを除外）
-        average_vibe = vibe_score_sum / vibe_score_count if vibe_score_count > 0 else None
-        
-        # ========== シンプル化されたタイムライン生成処理 ==========
-        # summaryとvibe_scoreのみを使用
-        timeline = []
-        total_vibe_score = 0
-        valid_score_count = 0
-        positive_blocks = 0
-        negative_blocks = 0
-        neutral_blocks = 0
-        
-        for block in processed_blocks:
-            # summaryとvibe_scoreのみを取得（analysis_resultは使わない）
-            summary = block.get("summary", "")
-            vibe_score = block.get("vibe_score")
-            
-            # スコアの統計
-            if vibe_score is not None:
-                total_vibe_score += vibe_score
-                valid_score_count += 1
-                
-                if vibe_score > 20:
-                    positive_blocks += 1
-                elif vibe_score < -20:
-                    negative_blocks += 1
-                else:
-                    neutral_blocks += 1
-            
-            # シンプルなタイムラインエントリの作成（summaryとvibe_scoreのみ）
-            timeline_entry = {
-                "time_block": block["time_block"],
-                "summary": summary,
-                "vibe_score": vibe_score
-            }
-            
-            timeline.append(timeline_entry)
-        
-        # 統計情報の計算（既存処理用）
-        avg_vibe_score = total_vibe_score / valid_score_count if valid_score_count > 0 else None
-        
-        # 観測対象者情報を取得（devicesテーブルとsubjectsテーブルを結合）
+        if state is None:
+            if not dashboard_response.data:
+                summary_states.discard(device_id, date)
+                return {
+                    "status": "warning",
+                    "message": f"vibe_scoreが存在するデータが見つかりません。device_id: {device_id}, date: {date}",
+                    "processed_count": 0
+                }
+            state = DaySummaryState()
+        
+        # 新しいブロックを集計に加える（vibe_scores配列・統計・タイムライン・バーストイベント候補を1パスで更新）
+        new_blocks = dashboard_response.data or []
+        state.fold(new_blocks)
+        # 全件集計は常に置き換える。インクリメンタル集計は読み込んだ後に並行した処理が集計を保存していた場合、
+        # 古い集計に加えたことになるため全件から集計し直す
+        if not summary_states.put(device_id, date, state,
+                                  expected_version=base_state.version if base_state is not None else None):
+            logger.info("並行した処理が集計を更新したため全件から再集計", extra={"device_id": device_id, "date": date})
+            return await build_dashboard_summary(device_id, date, incremental=False)
+        
+        processed_count = state.processed_count
+        last_time_block = state.last_time_block
+        vibe_scores_array = state.vibe_scores
+        vibe_score_count = state.vibe_score_count
+        average_vibe = state.average_vibe
+        timeline = state.timeline
+        statistics = state.statistics()
+        
+        # 観測対象者情報を取得（devicesテーブルとsubjectsテーブルを結合、キャッシュ経由）
         subject_info = None
         try:
-            # devicesテーブルからsubject_idを取得
-            device_response = supabase.table("devices").select("subject_id").eq(
-                "device_id", device_id
-            ).single().execute()
-            
-            if device_response.data and device_response.data.get("subject_id"):
-                subject_id = device_response.data["subject_id"]
-                # subjectsテーブルから情報を取得
-                subject_response = supabase.table("subjects").select("*").eq(
-                    "subject_id", subject_id
-                ).single().execute()
-                
-                if subject_response.data:
-                    subject_info = subject_response.data
+            subject_info = await get_cached_subject_info(supabase, device_id)
         except Exception as e:
             # エラーが発生しても処理を継続（subject_info = Noneのまま）
-            print(f"観測対象者情報の取得に失敗しました（処理は継続）: {e}")
+            logger.warning("観測対象者情報の取得に失敗しました（処理は継続）: %s", e, extra={"device_id": device_id})
         
         # 統合プロンプトの生成（累積型、subject_info追加）
-        daily_summary_prompt = generate_daily_summary_prompt(
-            device_id=device_id,
-            date=date,
-            timeline=timeline,
-            statistics={
-                "avg_vibe_score": avg_vibe_score,
-                "positive_blocks": positive_blocks,
-                "negative_blocks": negative_blocks,
-                "neutral_blocks": neutral_blocks,
-                "total_blocks": processed_count
-            },
-            last_time_block=last_time_block,
-            subject_info=subject_info
-        )
+        with span("render"):
+            daily_summary_prompt = generate_daily_summary_prompt(
+                device_id=device_id,
+                date=date,
+                timeline=timeline,
+                statistics=statistics,
+                last_time_block=last_time_block,
+                subject_info=subject_info,
+                burst_events=state.burst_events
+            )
         
         # dashboard_summaryテーブルにUPSERT
         upsert_data = {
@@ -544,8 +723,13 @@ async def generate_dashboard_summary(
             "updated_at": datetime.now().isoformat()
         }
         
-        # UPSERTの実行（既存データは上書き）
-        summary_response = supabase.table("dashboard_summary").upsert(
+        # インクリメンタル集計の保存後に並行した処理が集計を置き換えた場合は、古い集計で上書きしないよう全件から集計し直す
+        if base_state is not None and not summary_states.is_current(device_id, date, state):
+            logger.info("並行した処理が集計を更新したため全件から再集計", extra={"device_id": device_id, "date": date})
+            return await build_dashboard_summary(device_id, date, incremental=False)
+        
+        # UPSERTの実行（既存データは上書き、全件集計は常に保存）
+        summary_response = await supabase.table("dashboard_summary").upsert(
             upsert_data,
             on_conflict="device_id,date"
         ).execute()
@@ -555,26 +739,26 @@ async def generate_dashboard_summary(
             "message": f"ダッシュボードサマリーを生成しました。処理済みブロック数: {processed_count}",
             "device_id": device_id,
             "date": date,
+            "mode": "incremental" if incremental else "full",
+            "new_blocks": len(new_blocks),
             "prompt": daily_summary_prompt,  # Lambda関数が期待するプロンプトを追加
             "processed_count": processed_count,
             "last_time_block": last_time_block,
             "vibe_scores_count": vibe_score_count,  # 新規追加: 有効なスコア数
             "average_vibe": average_vibe,           # 新規追加: 平均値
             "statistics": {
-                "avg_vibe_score": avg_vibe_score,
-                "positive_blocks": positive_blocks,
-                "negative_blocks": negative_blocks,
-                "neutral_blocks": neutral_blocks,
-                "valid_score_count": valid_score_count
+                "avg_vibe_score": statistics["avg_vibe_score"],
+                "positive_blocks": statistics["positive_blocks"],
+                "negative_blocks": statistics["negative_blocks"],
+                "neutral_blocks": statistics["neutral_blocks"],
+                "valid_score_count": state.valid_score_count
             }
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"エラー詳細: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("ダッシュボード統合処理のエラー", extra={"device_id": device_id, "date": date})
         raise HTTPException(status_code=500, detail=f"サーバーエラー: {str(e)}")
 
 
@@ -592,29 +776,97 @@ def detect_burst_events(timeline: List[Dict], threshold: int = 30) -> List[Dict]
     burst_events = []
     
     for i in range(1, len(timeline)):
-        prev_score = timeline[i-1].get('vibe_score')
-        curr_score = timeline[i].get('vibe_score')
-        
-        if prev_score is not None and curr_score is not None:
-            change = curr_score - prev_score
-            
-            # 大きな変化を検出
-            if abs(change) >= threshold:
-                time_block = timeline[i]['time_block']
-                time_str = time_block.replace('-', ':')
-                
-                burst_events.append({
-                    'time': time_str,
-                    'from_score': prev_score,
-                    'to_score': curr_score,
-                    'change': change,
-                    'summary': timeline[i].get('summary', '')
-                })
+        # 大きな変化を検出
+        burst_event = burst_event_between(timeline[i-1], timeline[i], threshold)
+        if burst_event:
+            burst_events.append(burst_event)
     
     return burst_events
 
 
-def generate_daily_summary_prompt(device_id: str, date: str, timeline: List[Dict], statistics: Dict, last_time_block: str, subject_info: Optional[Dict] = None) -> str:
+# 1日全体の総合分析プロンプトのテンプレート（import時にコンパイル）
+DAILY_SUMMARY_PROMPT = PromptTemplate("""## 1日全体の総合分析依頼
+    
+### 分析対象
+観測対象者: {subject_description}
+日付: {date}（{weekday}、{day_context}）
+季節: {season}、地域: 日本
+分析範囲: **1日全体（00:00〜{hour:02d}:{minute:02d}）の記録**
+
+{holiday_notice}
+
+録音される音声には本人だけでなく、周囲の人物（家族、友人、テレビ等）の声も含まれます。
+観測対象者のプロファイルと発話内容に乖離がある場合は、周囲の人物の発話である可能性を考慮してください。
+（例：年齢や発達段階に不相応な専門的内容は周囲の大人の会話、観測対象者の属性と異なる声質は他者の発話など）
+
+### 1日の活動記録（{total_blocks}ブロック記録）
+{timeline_text}
+{burst_events_text}
+
+### 重要：1日全体を総合的に評価してください
+これは{hour:02d}:{minute:02d}時点での**1日全体のラップアップ**です。
+朝から現在までの全タイムブロックのデータを俯瞰し、1日の流れと変化を総合的に評価してください。
+特定の時間帯だけでなく、1日を通しての活動パターン、感情の推移、特徴的な出来事を含めてください。
+
+### 出力形式
+以下のJSON形式で出力してください。
+
+```json
+{{
+  "current_time": "{hour:02d}:{minute:02d}",
+  "time_context": "{time_context}",
+  "cumulative_evaluation": "【最初の2文：1日のラップアップ】朝から{hour:02d}:{minute:02d}までの観測対象者の1日を総括。主要な活動、感情の流れ、特徴的な出来事を時系列で要約。【最後の1文：インサイト】この日の観測データから読み取れる、観測対象者の心理状態、行動パターン、または環境との相互作用に関する洞察。",
+  "mood_trajectory": "positive_trend/negative_trend/stable/fluctuating",
+  "current_state_score": -100から+100の整数（1日全体の総合スコア）,
+  "burst_events": [
+    {{
+      "time": "HH:MM",
+      "event": "感情変化の要因となった出来事や状況の説明（日本語で簡潔に）",
+      "score_change": 変化量（-100〜+100の整数）,
+      "from_score": 変化前のスコア（-100〜+100の整数）,
+      "to_score": 変化後のスコア（-100〜+100の整数）
+    }}
+  ]
+}}
+```
+
+### cumulative_evaluationの記述ガイドライン
+1. **最初の2文（ラップアップ）**：
+   - 1文目：朝〜昼の主要な活動と感情状態
+   - 2文目：午後〜現在までの活動と感情の変化
+   
+2. **最後の1文（インサイト）**：
+   - 1日のデータから見える観測対象者の特徴、パターン、または注目すべき変化についての洞察
+   - 例：「終日を通して○○の傾向が見られ、特に△△の時間帯に□□という特徴的な反応を示している」
+
+### 分析の視点
+- 1日の時間経過に沿った活動と感情の変化を追跡
+- 朝・昼・午後・夕方の各時間帯の特徴を統合
+- 観測対象者の年齢・特性を考慮した自然な解釈
+- データから読み取れる行動パターンや心理的傾向の発見
+
+### burst_events（バーストイベント）の記述ガイドライン
+感情が大きく変化した時点を特定し、以下の基準で記録してください：
+1. **検出基準**：
+   - 前後30分でスコアが30ポイント以上変化した時点
+   - ポジティブ⇔ネガティブの転換点
+   - 特定の出来事により感情が急変した瞬間
+
+2. **eventの記述**：
+   - その時間帯のsummaryから推測される具体的な出来事
+   - 観測対象者の年齢・特性に応じた自然な解釈
+   - 例: "朝の活動開始で気分が向上"、"昼食後の満足感"、"夕方の疲れによる気分低下"
+
+3. **最大3〜5件程度**：
+   - 1日で最も顕著な変化点のみを抽出
+   - 些細な変動は除外し、意味のある変化に焦点""", subject_description=str, date=str, weekday=str, day_context=str,
+    season=str, hour=int, minute=int, holiday_notice=str, total_blocks=object, timeline_text=str,
+    burst_events_text=str, time_context=str)
+
+HOLIDAY_NOTICE = "【注意】本日は祝日のため、学校・幼稚園等の教育機関は休業です。観測場所は自宅または外出先と推測してください。"
+
+
+def generate_daily_summary_prompt(device_id: str, date: str, timeline: List[Dict], statistics: Dict, last_time_block: str, subject_info: Optional[Dict] = None, burst_events: Optional[List[Dict]] = None) -> str:
     """
     改善版：コンテキストを活用し、実データから得られる価値ある情報に集中
     バーストイベント検出機能を追加
@@ -626,6 +878,7 @@ def generate_daily_summary_prompt(device_id: str, date: str, timeline: List[Dict
         statistics: 統計情報
         last_time_block: 最後に処理したタイムブロック
         subject_info: 観測対象者情報（オプション）
+        burst_events: 検出済みのバーストイベント（省略時はtimelineから検出）
         
     Returns:
         str: ChatGPT用の累積評価プロンプト（バーストイベント検出を含む）
@@ -698,7 +951,8 @@ def generate_daily_summary_prompt(device_id: str, date: str, timeline: List[Dict
     timeline_text = "\n".join(timeline_texts) if timeline_texts else "有意なデータが記録されていません。"
     
     # バーストイベントの検出
-    burst_events = detect_burst_events(timeline)
+    if burst_events is None:
+        burst_events = detect_burst_events(timeline)
     burst_events_text = ""
     if burst_events:
         burst_events_text = "\n### 検出された感情の変化点（参考情報）\n"
@@ -716,85 +970,30 @@ def generate_daily_summary_prompt(device_id: str, date: str, timeline: List[Dict
     end_time = f"{end_hour:02d}:{end_minute:02d}"
     
     # ==================== 改善版プロンプト：1日全体の総合評価を促す ====================
-    prompt = f"""## 1日全体の総合分析依頼
+    prompt = DAILY_SUMMARY_PROMPT.render(
+        subject_description=subject_description,
+        date=date,
+        weekday=weekday_info['weekday'],
+        day_context=day_context,
+        season=season,
+        hour=hour,
+        minute=minute,
+        holiday_notice=HOLIDAY_NOTICE if holiday_info['is_holiday'] else '',
+        total_blocks=statistics.get('total_blocks', 0),
+        timeline_text=timeline_text,
+        burst_events_text=burst_events_text,
+        time_context=time_context
+    )
     
-### 分析対象
-観測対象者: {subject_description}
-日付: {date}（{weekday_info['weekday']}、{day_context}）
-季節: {season}、地域: 日本
-分析範囲: **1日全体（00:00〜{hour:02d}:{minute:02d}）の記録**
-
-{'【注意】本日は祝日のため、学校・幼稚園等の教育機関は休業です。観測場所は自宅または外出先と推測してください。' if holiday_info['is_holiday'] else ''}
-
-録音される音声には本人だけでなく、周囲の人物（家族、友人、テレビ等）の声も含まれます。
-観測対象者のプロファイルと発話内容に乖離がある場合は、周囲の人物の発話である可能性を考慮してください。
-（例：年齢や発達段階に不相応な専門的内容は周囲の大人の会話、観測対象者の属性と異なる声質は他者の発話など）
-
-### 1日の活動記録（{statistics.get('total_blocks', 0)}ブロック記録）
-{timeline_text}
-{burst_events_text}
-
-### 重要：1日全体を総合的に評価してください
-これは{hour:02d}:{minute:02d}時点での**1日全体のラップアップ**です。
-朝から現在までの全タイムブロックのデータを俯瞰し、1日の流れと変化を総合的に評価してください。
-特定の時間帯だけでなく、1日を通しての活動パターン、感情の推移、特徴的な出来事を含めてください。
-
-### 出力形式
-以下のJSON形式で出力してください。
-
-```json
-{{
-  "current_time": "{hour:02d}:{minute:02d}",
-  "time_context": "{time_context}",
-  "cumulative_evaluation": "【最初の2文：1日のラップアップ】朝から{hour:02d}:{minute:02d}までの観測対象者の1日を総括。主要な活動、感情の流れ、特徴的な出来事を時系列で要約。【最後の1文：インサイト】この日の観測データから読み取れる、観測対象者の心理状態、行動パターン、または環境との相互作用に関する洞察。",
-  "mood_trajectory": "positive_trend/negative_trend/stable/fluctuating",
-  "current_state_score": -100から+100の整数（1日全体の総合スコア）,
-  "burst_events": [
-    {{
-      "time": "HH:MM",
-      "event": "感情変化の要因となった出来事や状況の説明（日本語で簡潔に）",
-      "score_change": 変化量（-100〜+100の整数）,
-      "from_score": 変化前のスコア（-100〜+100の整数）,
-      "to_score": 変化後のスコア（-100〜+100の整数）
-    }}
-  ]
-}}
-```
-
-### cumulative_evaluationの記述ガイドライン
-1. **最初の2文（ラップアップ）**：
-   - 1文目：朝〜昼の主要な活動と感情状態
-   - 2文目：午後〜現在までの活動と感情の変化
-   
-2. **最後の1文（インサイト）**：
-   - 1日のデータから見える観測対象者の特徴、パターン、または注目すべき変化についての洞察
-   - 例：「終日を通して○○の傾向が見られ、特に△△の時間帯に□□という特徴的な反応を示している」
-
-### 分析の視点
-- 1日の時間経過に沿った活動と感情の変化を追跡
-- 朝・昼・午後・夕方の各時間帯の特徴を統合
-- 観測対象者の年齢・特性を考慮した自然な解釈
-- データから読み取れる行動パターンや心理的傾向の発見
-
-### burst_events（バーストイベント）の記述ガイドライン
-感情が大きく変化した時点を特定し、以下の基準で記録してください：
-1. **検出基準**：
-   - 前後30分でスコアが30ポイント以上変化した時点
-   - ポジティブ⇔ネガティブの転換点
-   - 特定の出来事により感情が急変した瞬間
+    observe_prompt("daily_summary", prompt)
+    return prompt
 
-2. **eventの記述**：
-   - その時間帯のsummaryから推測される具体的な出来事
-   - 観測対象者の年齢・特性に応じた自然な解釈
-   - 例: "朝の活動開始で気分が向上"、"昼食後の満足感"、"夕方の疲れによる気分低下"
 
-3. **最大3〜5件程度**：
-   - 1日で最も顕著な変化点のみを抽出
-   - 些細な変動は除外し、意味のある変化に焦点"""
-    
-    return prompt
+# ここまでがモジュールのimport（ルート・テンプレート・ミドルウェアの定義）
+startup_state.record_phase("import", time.perf_counter() - _startup_started)
 
 
 if __name__ == "__main__":
-    # アプリケーションの起動
+    # アプリケーションの起動（main をimportするスクリプト・ベンチマークでは不要のためここでimport）
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8009)
\ No newline at end of file
@@ -0,0 +1,338 @@
+"""
+Metrics
+=======
+Prometheus形式（テキスト形式 0.0.4）のメトリクスをプロセス内で集計し、GET /metrics で公開する
+外部ライブラリ（prometheus_client）は使わず、カウンター・ゲージ・ヒストグラムのみを実装
+
+公開するメトリクス:
+- http_requests_total / http_request_duration_seconds / http_requests_in_flight: エンドポイントごと
+- db_calls_total / db_call_duration_seconds: テーブル・操作（select / upsert / update ...）ごと
+- cache_hits_total / cache_misses_total / cache_hit_ratio / cache_entries: 観測対象者情報・インクリメンタル集計
+- prompt_length_chars: プロンプト生成関数ごとの文字数
+- status_updates_total: データソーステーブルのstatus更新の結果（ブロック数）
+- timeblock_results_total: タイムブロック処理の結果（success / unchanged / skipped / error）
+- write_behind_*: dashboardへの書き込みバッファ（write_behind.py）の1回のUPSERTの行数・所要時間・マージされた書き込み数
+- startup_phase_seconds / startup_time_to_ready_seconds: 起動時のimport・ウォームアップの各フェーズとready までの時間
+
+値はワーカープロセスごと（複数ワーカーの場合は各ワーカーの値をPrometheus側で合算する）
+"""
+
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from starlette.routing import Match
+
+
+# レイテンシのヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# プロンプト文字数のヒストグラムのバケット
+PROMPT_LENGTH_BUCKETS = (500, 1000, 2000, 3000, 4000, 5000, 6000, 8000, 10000, 15000, 20000)
+# 書き込みバッファの1回のUPSERTの行数のヒストグラムのバケット
+BATCH_ROWS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """ラベルの値の組 → 値 を保持するメトリクスの基底クラス"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """バケットごとの件数（非累積で保持し、出力時に累積）・合計・件数"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [バケットごとの件数（最後は+Inf）, 合計, 件数]
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state is not None else 0
+
+    def samples(self) -> Iterable[str]:
+        bounds = [*self.buckets, float("inf")]
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    """メトリクスと、出力時に値を読み取るコレクター（キャッシュの統計など）の一覧"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], List[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by endpoint and status code", ("method", "path", "status")))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ("method", "path")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed by endpoint", ("path",)))
+
+DB_CALLS = REGISTRY.register(Counter(
+    "db_calls_total", "Database calls by table, operation and outcome", ("table", "operation", "outcome")))
+DB_CALL_DURATION = REGISTRY.register(Histogram(
+    "db_call_duration_seconds", "Database call latency by table and operation", ("table", "operation")))
+
+PROMPT_LENGTH = REGISTRY.register(Histogram(
+    "prompt_length_chars", "Generated prompt length in characters by generator", ("generator",),
+    buckets=PROMPT_LENGTH_BUCKETS))
+
+STATUS_UPDATES = REGISTRY.register(Counter(
+    "status_updates_total", "Source table status updates (blocks) by table and outcome", ("table", "outcome")))
+
+TIMEBLOCK_RESULTS = REGISTRY.register(Counter(
+    "timeblock_results_total", "Time block processing results by mode and status", ("mode", "status")))
+
+WRITE_BEHIND_FLUSHES = REGISTRY.register(Counter(
+    "write_behind_flushes_total", "Write-behind batch upserts by buffer, trigger and outcome", ("buffer", "reason", "outcome")))
+WRITE_BEHIND_BATCH_ROWS = REGISTRY.register(Histogram(
+    "write_behind_batch_rows", "Rows per write-behind batch upsert", ("buffer",), buckets=BATCH_ROWS_BUCKETS))
+WRITE_BEHIND_FLUSH_DURATION = REGISTRY.register(Histogram(
+    "write_behind_flush_duration_seconds", "Write-behind batch upsert latency", ("buffer",)))
+WRITE_BEHIND_COALESCED = REGISTRY.register(Counter(
+    "write_behind_coalesced_total", "Writes merged into a row already waiting in the write-behind buffer", ("buffer",)))
+
+JOBS = REGISTRY.register(Counter(
+    "jobs_total", "Async-mode jobs by kind and outcome (queued, deduplicated, rejected, completed, failed, cancelled)",
+    ("kind", "outcome")))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "job_queue_depth", "Jobs waiting in the in-process job queue"))
+JOB_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "job_queue_wait_seconds", "Time from job submission until a worker started it", ("kind",)))
+JOB_RUN_DURATION = REGISTRY.register(Histogram(
+    "job_run_duration_seconds", "Job processing time in the worker", ("kind",)))
+
+SINGLEFLIGHT_REQUESTS = REGISTRY.register(Counter(
+    "singleflight_requests_total",
+    "Single-flight computations started (executed) and requests served by a run they did not start (shared)",
+    ("group", "outcome")))
+
+STARTUP_PHASE_DURATION = REGISTRY.register(Gauge(
+    "startup_phase_seconds", "Duration of startup phases (import and warm-up)", ("phase",)))
+STARTUP_READY = REGISTRY.register(Gauge(
+    "startup_time_to_ready_seconds", "Seconds from the start of app import until the process became ready"))
+
+
+# ===== 記録用のヘルパー =====
+
+def observe_db_call(table: str, operation: str, seconds: float, ok: bool):
+    """1回のデータベース呼び出し（data_access / fake_supabase の execute から呼ぶ）"""
+    DB_CALLS.inc(table=table, operation=operation, outcome="ok" if ok else "error")
+    DB_CALL_DURATION.observe(seconds, table=table, operation=operation)
+
+
+def observe_prompt(generator: str, prompt: str):
+    PROMPT_LENGTH.observe(len(prompt), generator=generator)
+
+
+def record_status_updates(table: str, updated: int, failed: int = 0):
+    if updated:
+        STATUS_UPDATES.inc(updated, table=table, outcome="updated")
+    if failed:
+        STATUS_UPDATES.inc(failed, table=table, outcome="failed")
+
+
+def observe_write_behind_flush(buffer: str, reason: str, rows: int, seconds: float, ok: bool):
+    """書き込みバッファの1回の複数行UPSERT（reason: timer / size / read / shutdown）"""
+    WRITE_BEHIND_FLUSHES.inc(buffer=buffer, reason=reason, outcome="ok" if ok else "error")
+    WRITE_BEHIND_BATCH_ROWS.observe(rows, buffer=buffer)
+    WRITE_BEHIND_FLUSH_DURATION.observe(seconds, buffer=buffer)
+
+
+# 登録されたキャッシュ（名前, hits / misses 属性と __len__ を持つオブジェクト）
+_caches: List[Tuple[str, Any]] = []
+
+
+def register_cache(name: str, cache: Any):
+    """キャッシュを登録（ヒット率等は /metrics の出力時に読み取る）"""
+    _caches.append((name, cache))
+
+
+def _collect_caches() -> List[Metric]:
+    hits_total = Counter("cache_hits_total", "Cache hits", ("cache",))
+    misses_total = Counter("cache_misses_total", "Cache misses", ("cache",))
+    hit_ratio = Gauge("cache_hit_ratio", "Cache hit ratio since process start", ("cache",))
+    entries = Gauge("cache_entries", "Entries currently held in the cache", ("cache",))
+    for name, cache in _caches:
+        hits, misses = cache.hits, cache.misses
+        hits_total.inc(hits, cache=name)
+        misses_total.inc(misses, cache=name)
+        hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+        entries.set(len(cache), cache=name)
+    return [hits_total, misses_total, hit_ratio, entries]
+
+
+REGISTRY.collectors.append(_collect_caches)
+
+
+# ===== HTTPミドルウェア =====
+
+def route_path(scope: Dict[str, Any]) -> str:
+    """
+    リクエストに一致するルートのパステンプレート（例: /admin/backfill/{job_id}）
+    パスのみ一致（メソッド不一致で405）の場合もそのルートのテンプレート、一致なしは "unmatched"
+    （存在しないパスごとにラベルが増えないようにする）
+    """
+    app = scope.get("app")
+    partial = None
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+        if match == Match.PARTIAL and partial is None:
+            partial = getattr(route, "path", None)
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """エンドポイントごとのリクエスト数・レイテンシ・処理中の件数を記録するASGIミドルウェア"""
+
+    # (method, path) → パステンプレートの対応を保持する最大件数（パスパラメータで無制限に増えないように）
+    MAX_CACHED_PATHS = 1024
+
+    def __init__(self, app):
+        self.app = app
+        self._paths: Dict[Tuple[str, str], str] = {}
+
+    def _route_path(self, scope: Dict[str, Any]) -> str:
+        """route_path の結果をリクエストのパスごとに記憶（ルートの照合は1リクエストあたり約20µs）"""
+        key = (scope["method"], scope["path"])
+        path = self._paths.get(key)
+        if path is None:
+            path = route_path(scope)
+            if len(self._paths) < self.MAX_CACHED_PATHS:
+                self._paths[key] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = self._route_path(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(path=path)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(path=path)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=method, path=path)
+            HTTP_REQUESTS.inc(method=method, path=path, status=status_code)
+
+
+def render_latest() -> str:
+    """/metrics のレスポンス本文"""
+    return REGISTRY.render()
+
+
+# Starlette の Response が text/* に "; charset=utf-8" を付加する
+CONTENT_TYPE = "text/plain; version=0.0.4"
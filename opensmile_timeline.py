@@ -0,0 +1,105 @@
+"""
+OpenSMILE Timeline
+==================
+emotion_opensmile の selected_features_timeline（1秒ごとの辞書のリスト）を
+特徴量ごとの array('d') 列とタイムスタンプ列に一度だけ変換した列指向のコンテナ
+
+- プロンプト生成で使う特徴量（Loudness_sma3 / jitterLocal_sma3nz）のみ保持する
+- 平均・最小・最大・ゼロ件数・発話割合は配列に対する組み込み関数で計算
+- スライスは列ごとの配列スライス（先頭N秒の時系列表示用）
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+
+LOUDNESS_FEATURE = "Loudness_sma3"
+JITTER_FEATURE = "jitterLocal_sma3nz"
+
+
+class OpenSmileTimeline:
+    """1タイムブロック分のOpenSMILE時系列（列指向）"""
+
+    __slots__ = ("timestamps", "loudness", "jitter")
+
+    def __init__(self, timestamps: List[Any], loudness: array, jitter: array):
+        self.timestamps = timestamps
+        self.loudness = loudness
+        self.jitter = jitter
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "OpenSmileTimeline":
+        """selected_features_timeline の各要素（timestamp と features）から1パスで作成"""
+        timestamps = []
+        loudness = array("d")
+        jitter = array("d")
+        for item in records:
+            features = item.get("features", {})
+            timestamps.append(item.get("timestamp", "N/A"))
+            loudness.append(features.get(LOUDNESS_FEATURE, 0))
+            jitter.append(features.get(JITTER_FEATURE, 0))
+        return cls(timestamps, loudness, jitter)
+
+    def __len__(self) -> int:
+        return len(self.jitter)
+
+    def __getitem__(self, index: slice) -> "OpenSmileTimeline":
+        if not isinstance(index, slice):
+            raise TypeError("OpenSmileTimeline only supports slicing")
+        return OpenSmileTimeline(self.timestamps[index], self.loudness[index], self.jitter[index])
+
+    def rows(self):
+        """(タイムスタンプ, 音量, Jitter) を1秒ずつ返す"""
+        return zip(self.timestamps, self.loudness, self.jitter)
+
+    # ===== 統計 =====
+
+    @property
+    def loudness_mean(self) -> float:
+        return sum(self.loudness) / len(self.loudness)
+
+    @property
+    def loudness_min(self) -> float:
+        return min(self.loudness)
+
+    @property
+    def loudness_max(self) -> float:
+        return max(self.loudness)
+
+    @property
+    def jitter_mean(self) -> float:
+        return sum(self.jitter) / len(self.jitter)
+
+    @property
+    def jitter_max(self) -> float:
+        return max(self.jitter)
+
+    @property
+    def silent_seconds(self) -> int:
+        """Jitter=0（発話なし）の秒数"""
+        return self.jitter.count(0)
+
+    @property
+    def speaking_seconds(self) -> int:
+        """Jitter>0（人の声あり）の秒数"""
+        return sum(map((0.0).__lt__, self.jitter))
+
+    @property
+    def speech_ratio(self) -> float:
+        """発話の割合（0.0〜1.0）"""
+        return self.speaking_seconds / len(self.jitter) if len(self.jitter) > 0 else 0
+
+    def fingerprint_payload(self) -> Dict[str, List[Any]]:
+        """入力フィンガープリント用の列データ（プロンプト生成で参照する値のみ）"""
+        return {
+            "timestamps": self.timestamps,
+            "loudness": self.loudness.tolist(),
+            "jitter": self.jitter.tolist()
+        }
+
+
+def as_opensmile_timeline(data: Union[None, list, OpenSmileTimeline]) -> Optional[OpenSmileTimeline]:
+    """辞書のリスト・OpenSmileTimelineのどちらでも受け取り、OpenSmileTimelineに揃える"""
+    if data is None or isinstance(data, OpenSmileTimeline):
+        return data
+    return OpenSmileTimeline.from_records(data)
@@ -0,0 +1,67 @@
+"""
+Compiled Prompt Templates
+=========================
+プロンプトの静的な部分（指示文・JSONスキーマ）と動的なスロットをimport時に一度だけ分解し、
+生成時は事前に用意した部品リストにスロットの値を埋めて join するだけにするテンプレート層
+
+- テンプレートの書式は str.format と同じ（{name} / {name:02d} / リテラルの波括弧は {{ }}、!r等の変換は非対応）
+- スロットは名前と型を宣言する（宣言漏れ・未使用の宣言はimport時にエラー）
+- 同じ名前・書式のスロットが複数回現れる場合は1回だけフォーマットして使い回す
+- 出力は同じ値で f-string を評価した結果と同一
+"""
+
+from string import Formatter
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class PromptTemplate:
+    """
+    静的セグメントと型付きスロットに分解済みのテンプレート
+
+    使用例:
+        HEADER = PromptTemplate("時刻: {hour:02d}:{minute:02d}", hour=int, minute=int)
+        HEADER.render(hour=9, minute=30)  # => "時刻: 09:30"
+    """
+
+    def __init__(self, source: str, **slot_types: type):
+        self.source = source
+        self.slot_types = slot_types
+
+        parts: List[str] = []
+        slot_indices: Dict[Tuple[str, str], List[int]] = {}
+        used_names = set()
+
+        for literal_text, field_name, format_spec, conversion in Formatter().parse(source):
+            if literal_text:
+                parts.append(literal_text)
+            if field_name is None:
+                continue
+            if field_name not in slot_types:
+                raise ValueError(f"Undeclared template slot: {field_name}")
+            if conversion or "{" in format_spec:
+                raise ValueError(f"Conversions and nested format specs are not supported: {field_name}")
+            used_names.add(field_name)
+            slot_indices.setdefault((field_name, format_spec), []).append(len(parts))
+            parts.append("")
+
+        unused = set(slot_types) - used_names
+        if unused:
+            raise ValueError(f"Declared but unused template slots: {', '.join(sorted(unused))}")
+
+        self._parts = parts
+        # (スロット名, 書式指定 ※書式なしの文字列スロットはNone, 埋め込む位置)
+        self._slots: List[Tuple[str, Optional[str], Tuple[int, ...]]] = [
+            (name, None if slot_types[name] is str and not format_spec else format_spec, tuple(indices))
+            for (name, format_spec), indices in slot_indices.items()
+        ]
+
+    def render(self, **values: Any) -> str:
+        """スロットに値を埋めてプロンプト文字列を生成"""
+        parts = self._parts.copy()
+        for name, format_spec, indices in self._slots:
+            value = values[name]
+            # 文字列スロットはそのまま埋め込む（str以外が渡された場合は join でTypeError）
+            text = value if format_spec is None else format(value, format_spec)
+            for index in indices:
+                parts[index] = text
+        return "".join(parts)
@@ -33,8 +33,8 @@ docker-compose -f docker-compose.prod.yml up -d
 
 # 5. ヘルスチェック
 echo -e "\n${YELLOW}🔍 ヘルスチェック中...${NC}"
-sleep 5
-curl -f http://localhost:8009/health
+# ウォームアップ完了（/health/ready が200）まで最大60秒待つ
+curl -f --retry 12 --retry-delay 5 --retry-connrefused http://localhost:8009/health/ready
 if [ $? -eq 0 ]; then
     echo -e "\n${GREEN}✅ ヘルスチェック成功${NC}"
 else
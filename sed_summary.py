@@ -0,0 +1,148 @@
+"""
+SED (YAMNet) Event Summary
+==========================
+behavior_yamnet の events（label と prob の辞書のリスト）をプロンプト用に要約する
+V1（generate_timeblock_prompt）とV2（generate_timeblock_prompt_v2）で共通に使用
+（V2は元の順序の先頭のラベルのみ使うため、並べ替えを行わない leading_labels を直接使用）
+
+- ラベルは静的な語彙で整数IDに変換し、カテゴリ（発話・子供の声・ノイズ）のフラグはID登録時に1回だけ判定
+- 確率は1回だけ取り出し、上位K件のみ heapq.nlargest で選択（全件のソートは行わない。同確率は元の順序を維持）
+- 確率帯ごとの件数はCレベルの map/sum で集計
+- ラベルのカテゴリ判定は上位イベントのみ（Speechが上位に無い場合のみ全件のSpeechの最大確率を求める）
+"""
+
+import heapq
+from typing import Any, Dict, List, NamedTuple, Optional
+
+
+# カテゴリフラグ（ラベルに含まれる文字列で判定、大文字小文字を区別）
+SPEECH = 1   # "Speech"
+CHILD = 2    # "Child" / "Baby"
+NOISE = 4    # "Noise"
+
+TOP_K = 20            # 詳細表示・子供の声・活動音の多様性の判定に使う上位件数
+NOISE_TOP_K = 10      # 環境ノイズの判定に使う上位件数
+LEADING_COUNT = 5     # V2の環境音要約に使う先頭件数（元の順序）
+MAX_VOCABULARY = 4096  # 語彙の最大数（超えた未知ラベルはIDを割り当てずにその場で判定）
+
+UNKNOWN_LABEL = "Unknown"
+
+# 語彙の初期値（YAMNetでよく検出されるラベル）。未知のラベルは初出時に追加する
+YAMNET_LABELS = [
+    UNKNOWN_LABEL,
+    "Speech", "Child speech, kid speaking", "Conversation", "Narration, monologue", "Babbling",
+    "Male speech, man speaking", "Female speech, woman speaking", "Speech synthesizer",
+    "Shout", "Yell", "Children shouting", "Screaming", "Whispering", "Laughter", "Baby laughter",
+    "Giggle", "Crying, sobbing", "Baby cry, infant cry", "Sigh", "Singing", "Humming",
+    "Children playing", "Music", "Television", "Radio", "Video game music",
+    "Silence", "Noise", "Environmental noise", "White noise", "Pink noise", "Static", "Hum",
+    "Inside, small room", "Inside, large room or hall", "Outside, urban or manmade",
+    "Vehicle", "Car", "Walk, footsteps", "Door", "Knock", "Dishes, pots, and pans",
+    "Cutlery, silverware", "Water tap, faucet", "Typing", "Clock", "Tick",
+    "Dog", "Cat", "Bird", "Rain", "Wind", "Air conditioning", "Mechanical fan",
+]
+
+
+def _label_flags(label: str) -> int:
+    """ラベル文字列からカテゴリフラグを判定"""
+    flags = 0
+    if 'Speech' in label:
+        flags |= SPEECH
+    if 'Child' in label or 'Baby' in label:
+        flags |= CHILD
+    if 'Noise' in label:
+        flags |= NOISE
+    return flags
+
+
+class LabelVocabulary:
+    """ラベル → 整数ID と ID → カテゴリフラグ の対応表"""
+
+    def __init__(self, labels: List[str], max_size: int = MAX_VOCABULARY):
+        self.max_size = max_size
+        self.ids: Dict[str, int] = {}
+        self.labels: List[str] = []
+        self.flags: List[int] = []
+        for label in labels:
+            self.intern(label)
+
+    def intern(self, label: str) -> Optional[int]:
+        """ラベルのIDを取得（未登録なら登録、語彙が上限に達している場合はNone）"""
+        label_id = self.ids.get(label)
+        if label_id is None and len(self.labels) < self.max_size:
+            label_id = len(self.labels)
+            self.ids[label] = label_id
+            self.labels.append(label)
+            self.flags.append(_label_flags(label))
+        return label_id
+
+    def flags_of(self, label: str) -> int:
+        """ラベルのカテゴリフラグ"""
+        label_id = self.intern(label)
+        return self.flags[label_id] if label_id is not None else _label_flags(label)
+
+    def flags_of_labels(self, labels: List[Optional[str]]) -> List[int]:
+        """ラベルのリストのカテゴリフラグ（登録済みのラベルは辞書引きのみ、Noneは0）"""
+        ids = self.ids
+        flags = self.flags
+        return [
+            flags[ids[label]] if label in ids else (self.flags_of(label) if label is not None else 0)
+            for label in labels
+        ]
+
+
+VOCABULARY = LabelVocabulary(YAMNET_LABELS)
+
+
+class SedSummary(NamedTuple):
+    """1タイムブロック分のSEDイベントの要約"""
+    event_count: int                 # 検出イベント総数
+    high_prob_count: int             # 確率70%以上のイベント数
+    mid_prob_count: int              # 確率40〜70%のイベント数
+    speech_prob: float               # Speechを含むラベルの最大確率（%）
+    has_child_voice: bool            # 上位20件に Child / Baby を含むラベルがあるか
+    has_noise: bool                  # 上位10件に Noise を含むラベルがあるか
+    activity_diversity: int          # 上位20件のうち確率30%超の件数
+    top_events: List[tuple]          # 確率順の上位20件 (label, prob)
+
+
+def leading_labels(sed_data: List[Dict[str, Any]]) -> List[str]:
+    """元の順序の先頭N件のうち確率30%超のラベル（V2の環境音要約、並べ替え不要）"""
+    return [event.get('label', '') for event in sed_data[:LEADING_COUNT] if event.get('prob', 0) > 0.3]
+
+
+def summarize_sed_events(sed_data: List[Dict[str, Any]], vocabulary: LabelVocabulary = VOCABULARY) -> SedSummary:
+    """SEDイベントのリストを集計し、上位イベントを選択"""
+    # 確率を1回だけ取り出し、件数の集計はCレベルの map/sum で行う
+    probs = [event.get('prob', 0) for event in sed_data]
+    high_prob_count = sum(map((0.7).__le__, probs))
+    mid_prob_count = sum(map((0.4).__le__, probs)) - high_prob_count
+
+    # 確率順の上位K件のインデックス（同確率は元の順序）
+    top_indices = heapq.nlargest(TOP_K, range(len(probs)), key=probs.__getitem__)
+    top_labels = [sed_data[i].get('label') for i in top_indices]
+    top_flags = vocabulary.flags_of_labels(top_labels)
+
+    # Speech検出率: Speechを含むラベルの最大確率（上位K件に無い場合のみ全件を判定）
+    speech_prob = 0
+    for i, label_flags in zip(top_indices, top_flags):
+        if label_flags & SPEECH:
+            speech_prob = probs[i] * 100
+            break
+    else:
+        all_flags = vocabulary.flags_of_labels([event.get('label') for event in sed_data])
+        speech_prob = max((prob for prob, label_flags in zip(probs, all_flags) if label_flags & SPEECH), default=0) * 100
+
+    return SedSummary(
+        event_count=len(probs),
+        high_prob_count=high_prob_count,
+        mid_prob_count=mid_prob_count,
+        speech_prob=speech_prob,
+        has_child_voice=any(label_flags & CHILD for label_flags in top_flags),
+        has_noise=any(label_flags & NOISE for label_flags in top_flags[:NOISE_TOP_K]),
+        activity_diversity=sum(1 for i in top_indices if probs[i] > 0.3),
+        top_events=[
+            (label if label is not None else UNKNOWN_LABEL, probs[i])
+            for i, label in zip(top_indices, top_labels)
+        ],
+    )
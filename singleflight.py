@@ -0,0 +1,125 @@
+"""
+Single-flight
+=============
+同じキー（/generate-timeblock-prompt は device_id + date + time_block、/generate-dashboard-summary は device_id + date）の
+リクエストが同時に届いた場合に、取得・生成・保存を1回の実行にまとめ、同じ結果を返す
+
+- 実行中の処理がない場合: そのリクエストが処理を実行する
+- 実行中の処理がある場合: 実行中の処理には相乗りせず、その完了後に1回だけ実行する「次の処理」に相乗りする
+- メトリクス singleflight_requests_total の executed は実際に開始した処理の回数、shared は次の処理に相乗りしたリクエスト数
+  実行中の処理は新しいリクエストの契機となったデータ（直前に完了したYAMNet・OpenSMILE等）を読み込む前の可能性があるため
+  同じキーの処理は最大で「実行中1回 + 次の1回」となり、各リクエストには到着後に読み込みを開始した処理の結果を返す
+- 例外も相乗りした全リクエストに同じものを返す
+- 処理はリクエストとは別のタスクで実行するため、呼び出し側が切断・キャンセルされても処理（保存）は最後まで実行する
+
+環境変数:
+    SINGLEFLIGHT_ENABLED: 同じキーの同時リクエストをまとめるか（既定: true）
+"""
+
+import os
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from metrics import SINGLEFLIGHT_REQUESTS
+from tracing import span
+
+
+class _Flight:
+    """キーごとの実行中の処理と、その完了後に実行する次の処理"""
+
+    __slots__ = ("running", "next", "next_run", "next_context")
+
+    def __init__(self, running: asyncio.Task):
+        self.running = running
+        self.next: Optional[asyncio.Future] = None
+        self.next_run: Optional[Callable[[], Awaitable[Any]]] = None
+        self.next_context: Optional[contextvars.Context] = None
+
+
+class SingleFlight:
+    """キーごとに同時実行を1回（+ 完了後の1回）にまとめる"""
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, run: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        run() を実行して結果を返す（同じキーの処理が実行中の場合は、その完了後の1回の実行に相乗りする）
+
+        Args:
+            key: まとめる単位のキー
+            run: 処理本体（相乗りした場合は呼ばれない）
+        """
+        if not self.enabled:
+            return await run()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            # 実行中の処理がない: このリクエストのコンテキスト（トレース）で実行
+            task = asyncio.get_running_loop().create_task(run())
+            self._flights[key] = _Flight(task)
+            task.add_done_callback(lambda done: self._finish(key, done))
+            SINGLEFLIGHT_REQUESTS.inc(group=self.name, outcome="executed")
+            return await asyncio.shield(task)
+
+        if flight.next is None:
+            # 次の処理を予約（最初に予約したリクエストのコンテキストで実行）
+            flight.next = asyncio.get_running_loop().create_future()
+            flight.next.add_done_callback(_retrieve_exception)
+            flight.next_run = run
+            flight.next_context = contextvars.copy_context()
+        # 予約したリクエストも含め、次の処理の結果を待つ（次の処理は開始時に executed として数える）
+        SINGLEFLIGHT_REQUESTS.inc(group=self.name, outcome="shared")
+        future = flight.next
+        with span("singleflight.wait"):
+            return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, done: asyncio.Task):
+        """処理の完了時: 予約された次の処理があれば開始し、なければキーを解放"""
+        _retrieve_exception(done)
+        flight = self._flights.get(key)
+        if flight is None or flight.running is not done:
+            return
+        if flight.next is None:
+            del self._flights[key]
+            return
+
+        future, run, context = flight.next, flight.next_run, flight.next_context
+        flight.next = flight.next_run = flight.next_context = None
+        task = asyncio.get_running_loop().create_task(run(), context=context)
+        flight.running = task
+        SINGLEFLIGHT_REQUESTS.inc(group=self.name, outcome="executed")
+        task.add_done_callback(lambda next_done: self._finish(key, next_done))
+        task.add_done_callback(lambda next_done: _copy_outcome(next_done, future))
+
+
+def _retrieve_exception(future: asyncio.Future):
+    """相乗りした呼び出し側が全てキャンセル済みの場合の「例外が取得されていない」警告を抑止"""
+    if not future.cancelled():
+        future.exception()
+
+
+def _copy_outcome(task: asyncio.Task, future: asyncio.Future):
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+def create_single_flight_from_env(name: str) -> SingleFlight:
+    return SingleFlight(name, enabled=os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true")
+
+
+# エンドポイントごとの同時リクエストのまとめ
+timeblock_flights = create_single_flight_from_env("timeblock")
+dashboard_summary_flights = create_single_flight_from_env("dashboard_summary")
@@ -0,0 +1,181 @@
+"""
+Subject Info Cache
+==================
+device_id → 観測対象者情報（subjectsテーブル）の解決結果をプロセス内にキャッシュする
+観測対象者のプロフィールはほとんど変化しないため、タイムブロックごとの再取得を避ける
+
+- TTL付き・最大件数を超えた場合は最も古く使われたものから削除（LRU）
+- 存在しないデバイス・subject未設定のデバイスも短いTTLでキャッシュ（ネガティブキャッシュ）
+- キャッシュミス時は devices と subjects を埋め込みリソースで結合した1回のクエリで取得
+- 起動時のウォームアップ（warmup.py）では稼働中のデバイスの分を prefetch_subject_info でまとめて取得
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TTL = 600           # 観測対象者情報のキャッシュ秒数
+DEFAULT_NEGATIVE_TTL = 60   # 見つからなかった場合のキャッシュ秒数
+DEFAULT_MAX_SIZE = 1000     # キャッシュする最大デバイス数
+PREFETCH_BATCH_SIZE = 100   # まとめて取得する際の1回のクエリのデバイス数（URLの長さの上限のため）
+
+# 取得するsubjectsテーブルのカラム
+SUBJECT_COLUMNS = "subject_id,name,age,gender,notes"
+
+
+class SubjectCache:
+    """TTL + LRUのdevice_id単位キャッシュ"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, device_id: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        キャッシュを参照
+
+        Returns:
+            (キャッシュにあったか, 観測対象者情報またはNone)
+        """
+        entry = self._entries.get(device_id)
+        if entry is not None:
+            expires_at, subject_info = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(device_id)
+                self.hits += 1
+                return True, subject_info
+            del self._entries[device_id]
+        self.misses += 1
+        return False, None
+
+    def resize(self, max_size: int):
+        """最大件数を変更（超えている分は古いものから削除）"""
+        self.max_size = max_size
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, device_id: str, subject_info: Optional[Dict]):
+        """キャッシュに登録（Noneはネガティブキャッシュとして短いTTLで保持）"""
+        ttl = self.ttl if subject_info is not None else self.negative_ttl
+        self._entries[device_id] = (time.monotonic() + ttl, subject_info)
+        self._entries.move_to_end(device_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, device_id: Optional[str] = None) -> int:
+        """
+        キャッシュを無効化
+
+        Args:
+            device_id: 対象デバイス。省略時は全件を無効化
+
+        Returns:
+            削除した件数
+        """
+        if device_id is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        return 1 if self._entries.pop(device_id, None) is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの状態"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# プロセス内で共有するキャッシュ
+subject_cache = SubjectCache(
+    ttl=float(os.getenv("SUBJECT_CACHE_TTL", DEFAULT_TTL)),
+    negative_ttl=float(os.getenv("SUBJECT_CACHE_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL)),
+    max_size=int(os.getenv("SUBJECT_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE)),
+)
+
+
+async def fetch_subject_info(supabase_client, device_id: str) -> Optional[Dict]:
+    """
+    devices と subjects を埋め込みリソースで結合し、1回のクエリで観測対象者情報を取得
+    デバイスが存在しない・subject未設定の場合はNone
+    """
+    result = await supabase_client.table('devices').select(
+        'subject_id', f'subjects({SUBJECT_COLUMNS})'
+    ).eq(
+        'device_id', device_id
+    ).execute()
+
+    if not result.data or len(result.data) == 0:
+        logger.info("Device not found", extra={"device_id": device_id})
+        return None
+
+    subject_info = _embedded_subject(result.data[0])
+    if not subject_info:
+        logger.info("No subject for device", extra={"device_id": device_id})
+        return None
+    return subject_info
+
+
+def _embedded_subject(row: Dict[str, Any]) -> Optional[Dict]:
+    subject_info = row.get('subjects')
+    # 多対1の埋め込みはオブジェクトで返るが、配列で返る場合にも対応
+    if isinstance(subject_info, list):
+        subject_info = subject_info[0] if subject_info else None
+    return subject_info or None
+
+
+async def prefetch_subject_info(supabase_client, device_ids: List[str]) -> int:
+    """
+    複数デバイスの観測対象者情報を PREFETCH_BATCH_SIZE 件ずつまとめて取得してキャッシュに登録
+    （見つからなかったデバイスはネガティブキャッシュ）
+
+    Returns:
+        観測対象者情報が見つかったデバイス数
+    """
+    found = 0
+    for start in range(0, len(device_ids), PREFETCH_BATCH_SIZE):
+        batch = device_ids[start:start + PREFETCH_BATCH_SIZE]
+        result = await supabase_client.table('devices').select(
+            'device_id', 'subject_id', f'subjects({SUBJECT_COLUMNS})'
+        ).in_(
+            'device_id', batch
+        ).execute()
+
+        subjects = {row['device_id']: _embedded_subject(row) for row in result.data or []}
+        for device_id in batch:
+            subject_info = subjects.get(device_id)
+            subject_cache.set(device_id, subject_info)
+            found += subject_info is not None
+    return found
+
+
+async def get_cached_subject_info(supabase_client, device_id: str) -> Optional[Dict]:
+    """
+    キャッシュ経由で観測対象者情報を取得
+    取得エラーはキャッシュせず呼び出し側に送出する
+    """
+    with span("subject"):
+        found, subject_info = subject_cache.get(device_id)
+        if found:
+            return subject_info
+
+        subject_info = await fetch_subject_info(supabase_client, device_id)
+        subject_cache.set(device_id, subject_info)
+        return subject_info
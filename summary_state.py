@@ -0,0 +1,215 @@
+"""
+Dashboard Summary State
+=======================
+/generate-dashboard-summary 用の device_id + date ごとの累積集計
+タイムブロックが完了するたびに1日分を全件再集計する代わりに、
+前回の last_time_block より後のブロックだけを読み込んで集計に加える（インクリメンタルモード）
+
+保持する集計:
+- 48要素のvibe_scores配列、合計・件数
+- positive / negative / neutral のブロック数
+- タイムライン（summary と vibe_score）とバーストイベント候補
+
+同じ日の処理が並行した場合の整合性:
+- 全件集計（通常モード）は読み込んだdashboardが正のため、保持中の集計を常に置き換える
+- インクリメンタル集計は保持中の集計のコピーに加え、読み込んだ時点の version から変わっていない場合のみ保存する
+  （変わっていた場合は呼び出し側で全件集計し直す）
+"""
+
+import os
+import itertools
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+from timeblock_endpoint import TIME_BLOCKS
+
+
+# 時間ブロック → 48要素配列のインデックス
+TIME_BLOCK_TO_INDEX = {time_block: index for index, time_block in enumerate(TIME_BLOCKS)}
+
+DEFAULT_MAX_STATES = 2000   # 保持するdevice_id + dateの最大数
+BURST_THRESHOLD = 30        # バーストイベントとみなすスコア変化量
+
+
+def burst_event_between(prev: Dict, curr: Dict, threshold: int = BURST_THRESHOLD) -> Optional[Dict]:
+    """
+    連続する2つのタイムラインエントリ間の感情の大きな変化（バーストイベント）を判定
+    """
+    prev_score = prev.get('vibe_score')
+    curr_score = curr.get('vibe_score')
+
+    if prev_score is None or curr_score is None:
+        return None
+
+    change = curr_score - prev_score
+    if abs(change) < threshold:
+        return None
+
+    return {
+        'time': curr['time_block'].replace('-', ':'),
+        'from_score': prev_score,
+        'to_score': curr_score,
+        'change': change,
+        'summary': curr.get('summary', '')
+    }
+
+
+class DaySummaryState:
+    """1日分（device_id + date）の累積集計"""
+
+    def __init__(self):
+        self.vibe_scores: List[Optional[float]] = [None] * 48
+        # vibe_scores配列に配置できたスコアの合計・件数（average_vibe用）
+        self.vibe_score_sum = 0
+        self.vibe_score_count = 0
+        # 統計情報用（全ブロック対象）
+        self.total_vibe_score = 0
+        self.valid_score_count = 0
+        self.positive_blocks = 0
+        self.negative_blocks = 0
+        self.neutral_blocks = 0
+        self.timeline: List[Dict[str, Any]] = []
+        self.burst_events: List[Dict[str, Any]] = []
+        self.last_time_block: Optional[str] = None
+        self.version = 0   # SummaryStateStore に保存した時点の版（保存のたびに増加）
+
+    def copy(self) -> "DaySummaryState":
+        """インクリメンタル集計用のコピー（保持中の集計を直接変更しないため）"""
+        state = DaySummaryState.__new__(DaySummaryState)
+        state.__dict__.update(self.__dict__)
+        state.vibe_scores = list(self.vibe_scores)
+        state.timeline = list(self.timeline)
+        state.burst_events = list(self.burst_events)
+        return state
+
+    @property
+    def processed_count(self) -> int:
+        return len(self.timeline)
+
+    @property
+    def average_vibe(self) -> Optional[float]:
+        return self.vibe_score_sum / self.vibe_score_count if self.vibe_score_count > 0 else None
+
+    @property
+    def avg_vibe_score(self) -> Optional[float]:
+        return self.total_vibe_score / self.valid_score_count if self.valid_score_count > 0 else None
+
+    def fold(self, blocks: List[Dict[str, Any]]):
+        """
+        time_block順のdashboardレコードを集計に加える（1パス）
+        last_time_block以前のブロックは集計済みとして無視する
+        """
+        for block in blocks:
+            time_block = block.get("time_block")
+            vibe_score = block.get("vibe_score")
+
+            # 集計済みのブロックは加えない（同時リクエストで同じブロックを二重に数えないため）
+            if self.last_time_block is not None and time_block <= self.last_time_block:
+                continue
+
+            # 対応するインデックスにvibe_scoreを設定
+            if time_block in TIME_BLOCK_TO_INDEX and vibe_score is not None:
+                self.vibe_scores[TIME_BLOCK_TO_INDEX[time_block]] = vibe_score
+                self.vibe_score_sum += vibe_score
+                self.vibe_score_count += 1
+
+            # スコアの統計
+            if vibe_score is not None:
+                self.total_vibe_score += vibe_score
+                self.valid_score_count += 1
+
+                if vibe_score > 20:
+                    self.positive_blocks += 1
+                elif vibe_score < -20:
+                    self.negative_blocks += 1
+                else:
+                    self.neutral_blocks += 1
+
+            # シンプルなタイムラインエントリ（summaryとvibe_scoreのみ）
+            entry = {
+                "time_block": block["time_block"],
+                "summary": block.get("summary", ""),
+                "vibe_score": vibe_score
+            }
+
+            # 直前のエントリとの比較でバーストイベント候補を更新
+            if self.timeline:
+                burst_event = burst_event_between(self.timeline[-1], entry)
+                if burst_event:
+                    self.burst_events.append(burst_event)
+
+            self.timeline.append(entry)
+            self.last_time_block = block["time_block"]
+
+    def statistics(self) -> Dict[str, Any]:
+        """プロンプト生成用の統計情報"""
+        return {
+            "avg_vibe_score": self.avg_vibe_score,
+            "positive_blocks": self.positive_blocks,
+            "negative_blocks": self.negative_blocks,
+            "neutral_blocks": self.neutral_blocks,
+            "total_blocks": self.processed_count
+        }
+
+
+class SummaryStateStore:
+    """device_id + date → DaySummaryState（最大件数を超えたら古いものから削除）"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_STATES):
+        self.max_size = max_size
+        self._states: "OrderedDict[tuple[str, str], DaySummaryState]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._versions = itertools.count(1)
+
+    def get(self, device_id: str, date: str) -> Optional[DaySummaryState]:
+        state = self._states.get((device_id, date))
+        if state is not None:
+            self._states.move_to_end((device_id, date))
+            self.hits += 1
+        else:
+            self.misses += 1
+        return state
+
+    def put(self, device_id: str, date: str, state: DaySummaryState,
+            expected_version: Optional[int] = None) -> bool:
+        """
+        集計を保存して version を振る
+
+        Args:
+            expected_version: 指定した場合、保持中の集計の version が一致するときのみ保存する
+                （インクリメンタル集計で、読み込んだ後に並行した処理が保存していた場合はFalse）
+        """
+        key = (device_id, date)
+        if expected_version is not None:
+            current = self._states.get(key)
+            if current is None or current.version != expected_version:
+                return False
+        state.version = next(self._versions)
+        self._states[key] = state
+        self._states.move_to_end(key)
+        self._evict()
+        return True
+
+    def is_current(self, device_id: str, date: str, state: DaySummaryState) -> bool:
+        """state が保持中の最新の集計か（保存後に並行した処理が置き換えていないか）"""
+        return self._states.get((device_id, date)) is state
+
+    def _evict(self):
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+
+    def resize(self, max_size: int):
+        """最大件数を変更（超えている分は古いものから削除）"""
+        self.max_size = max_size
+        self._evict()
+
+    def discard(self, device_id: str, date: str):
+        self._states.pop((device_id, date), None)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+# プロセス内で共有する集計状態
+summary_states = SummaryStateStore(int(os.getenv("SUMMARY_STATE_MAX_SIZE", DEFAULT_MAX_STATES)))
@@ -4,23 +4,20 @@ Supabase Client for vibe_whisper and vibe_whisper_prompt tables
 """
 
 import os
+import logging
 from typing import List, Dict, Any, Optional
-from supabase import create_client, Client
+from data_access import AsyncDataClient, create_async_client_from_env
 from datetime import datetime, date
-import json
+import fast_json
+
+logger = logging.getLogger(__name__)
 
 class SupabaseClient:
     def __init__(self):
         """Initialize Supabase client"""
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_KEY")
-        
-        if not url or not key:
-            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
-        
-        # proxyパラメータを除外してクライアントを作成
-        self.client: Client = create_client(url, key)
-        print(f"✅ Supabase client initialized: {url}")
+        # 非同期データアクセス層（接続プール共有）でクライアントを作成
+        self.client: AsyncDataClient = create_async_client_from_env()
+        logger.info("Supabase client initialized", extra={"url": os.getenv('SUPABASE_URL')})
     
     async def get_vibe_whisper_data(self, device_id: str, target_date: str) -> List[Dict[str, Any]]:
         """
@@ -35,17 +32,18 @@ class SupabaseClient:
         """
         try:
             # dateカラムで日付を絞り込み
-            response = self.client.table('vibe_whisper').select('*').eq('device_id', device_id).eq('date', target_date).order('time_block').execute()
+            response = await self.client.table('vibe_whisper').select('*').eq('device_id', device_id).eq('date', target_date).order('time_block').execute()
             
             if response.data:
-                print(f"✅ Found {len(response.data)} records for device_id={device_id}, date={target_date}")
+                logger.info("Found %d records", len(response.data),
+                            extra={"device_id": device_id, "date": target_date, "records": len(response.data)})
                 return response.data
             else:
-                print(f"📊 No records found for device_id={device_id}, date={target_date}")
+                logger.info("No records found", extra={"device_id": device_id, "date": target_date})
                 return []
                 
         except Exception as e:
-            print(f"❌ Error fetching vibe_whisper data: {str(e)}")
+            logger.error("Error fetching vibe_whisper data: %s", e, extra={"device_id": device_id, "date": target_date})
             raise e
     
     async def save_to_vibe_whisper_prompt(self, device_id: str, target_date: str, prompt: str, processed_files: int, missing_files: List[str]) -> bool:
@@ -73,17 +71,17 @@ class SupabaseClient:
             }
             
             # UPSERT (既存レコードがあれば更新、なければ挿入)
-            response = self.client.table('vibe_whisper_prompt').upsert(data).execute()
+            response = await self.client.table('vibe_whisper_prompt').upsert(data).execute()
             
             if response.data:
-                print(f"✅ Successfully saved to vibe_whisper_prompt: device_id={device_id}, date={target_date}")
+                logger.info("Successfully saved to vibe_whisper_prompt", extra={"device_id": device_id, "date": target_date})
                 return True
             else:
-                print(f"❌ Failed to save to vibe_whisper_prompt")
+                logger.error("Failed to save to vibe_whisper_prompt", extra={"device_id": device_id, "date": target_date})
                 return False
                 
         except Exception as e:
-            print(f"❌ Error saving to vibe_whisper_prompt: {str(e)}")
+            logger.error("Error saving to vibe_whisper_prompt: %s", e, extra={"device_id": device_id, "date": target_date})
             raise e
     
     def extract_text_from_transcription(self, transcription_data: Any) -> Optional[str]:
@@ -102,9 +100,12 @@ class SupabaseClient:
         
         # 文字列の場合
         if isinstance(transcription_data, str):
+            # 先頭文字からJSONでないと判定できる通常の文字列はパースを試みない
+            if not fast_json.may_be_json(transcription_data):
+                return transcription_data.strip()
             try:
                 # JSON文字列の場合はパース
-                data = json.loads(transcription_data)
+                data = fast_json.loads(transcription_data)
                 if isinstance(data, dict):
                     # よくあるフィールド名をチェック
                     for field in ['text', 'transcript', 'transcription', 'content']:
@@ -115,7 +116,7 @@ class SupabaseClient:
                 else:
                     # JSONだがdictでない場合
                     return str(data).strip()
-            except json.JSONDecodeError:
+            except fast_json.JSONDecodeError:
                 # JSON形式でない通常の文字列
                 return transcription_data.strip()
         
@@ -8,39 +8,35 @@ Phase 3: + OpenSMILE
 """
 
 from datetime import datetime
-from typing import Optional, Dict, Any, List
-import json
-import traceback
-
-
-def get_season(month: int) -> str:
-    """月から季節を判定（日本の季節）"""
-    if month in [3, 4, 5]:
-        return "春"
-    elif month in [6, 7, 8]:
-        return "夏"
-    elif month in [9, 10, 11]:
-        return "秋"
-    else:
-        return "冬"
+from typing import Optional, Dict, Any, List, Tuple, Union
+import asyncio
+import logging
+
+from postgrest.types import ReturnMethod
+
+from calendar_index import get_calendar_day, get_season
+from prompt_templates import PromptTemplate
+from subject_cache import get_cached_subject_info
+from opensmile_timeline import OpenSmileTimeline, as_opensmile_timeline
+from sed_summary import summarize_sed_events
+import fast_json
+from metrics import observe_prompt, record_status_updates
+from tracing import span
+from log_config import get_block_logger
+from write_behind import dashboard_writes
+
+logger = logging.getLogger(__name__)
+block_logger = get_block_logger(__name__)
 
 
 def get_weekday_info(date_str: str) -> Dict[str, Any]:
-    """日付文字列から曜日情報を取得"""
+    """日付文字列から曜日情報を取得（事前計算済みのカレンダー索引を参照）"""
     try:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        
-        # 曜日名（日本語）
-        weekdays_ja = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
-        weekday_ja = weekdays_ja[date_obj.weekday()]
-        
-        # 週末判定
-        is_weekend = date_obj.weekday() >= 5  # 土曜日(5)または日曜日(6)
-        
+        day = get_calendar_day(date_str)
         return {
-            "weekday": weekday_ja,
-            "is_weekend": is_weekend,
-            "day_type": "週末" if is_weekend else "平日"
+            "weekday": day.weekday,
+            "is_weekend": day.is_weekend,
+            "day_type": day.day_type
         }
     except (ValueError, TypeError):
         return {
@@ -78,13 +74,40 @@ def generate_time_context(hour: int, minute: int) -> str:
     """時刻を表示用フォーマットで返す"""
     return f"{hour:02d}:{minute:02d}"
 
+
+# 1日分のタイムブロック一覧（00-00から23-30までの48個）
+TIME_BLOCKS = [f"{hour:02d}-{minute}" for hour in range(24) for minute in ["00", "30"]]
+
+
+async def get_day_rows(supabase_client, table: str, columns: str, device_id: str, date: str) -> Dict[str, Dict]:
+    """
+    指定テーブルから1日分（device_id, date）のレコードを1回のクエリで取得し、time_blockごとに振り分ける
+    48回の個別クエリの代わりに使用する。取得エラーは呼び出し側で処理する
+    
+    Returns:
+        time_block → レコードの辞書（同じtime_blockに複数行ある場合は最初の行を採用）
+    """
+    result = await supabase_client.table(table).select('time_block', columns).eq(
+        'device_id', device_id
+    ).eq(
+        'date', date
+    ).order(
+        'time_block', desc=False
+    ).execute()
+    
+    rows_by_block = {}
+    for row in result.data or []:
+        rows_by_block.setdefault(row.get('time_block'), row)
+    return rows_by_block
+
+
 async def get_whisper_data(supabase_client, device_id: str, date: str, time_block: str) -> Optional[str]:
     """
     vibe_whisperテーブルから特定のタイムブロックのトランスクリプトを取得
     """
     try:
         # time_blockをtime_block形式に変換 (14-30 -> 14:30形式などに対応)
-        result = supabase_client.table('vibe_whisper').select('transcription').eq(
+        result = await supabase_client.table('vibe_whisper').select('transcription').eq(
             'device_id', device_id
         ).eq(
             'date', date
@@ -97,43 +120,20 @@ async def get_whisper_data(supabase_client, device_id: str, date: str, time_bloc
             return result.data[0].get('transcription', '')
         return None
     except Exception as e:
-        print(f"Error fetching whisper data: {e}")
+        logger.warning("Error fetching whisper data: %s", e,
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
         return None
 
 
 async def get_subject_info(supabase_client, device_id: str) -> Optional[Dict]:
     """
     device_idから観測対象者情報を取得
-    devices → subjects テーブルを結合して情報を取得
+    devices → subjects を結合した1回のクエリで取得し、結果はプロセス内にキャッシュする
     """
     try:
-        # まず devices テーブルから subject_id を取得
-        device_result = supabase_client.table('devices').select('subject_id').eq(
-            'device_id', device_id
-        ).execute()
-        
-        if not device_result.data or len(device_result.data) == 0:
-            print(f"Device not found: {device_id}")
-            return None
-            
-        subject_id = device_result.data[0].get('subject_id')
-        if not subject_id:
-            print(f"No subject_id for device: {device_id}")
-            return None
-        
-        # subjects テーブルから情報を取得
-        subject_result = supabase_client.table('subjects').select(
-            'subject_id', 'name', 'age', 'gender', 'notes'
-        ).eq(
-            'subject_id', subject_id
-        ).execute()
-        
-        if subject_result.data and len(subject_result.data) > 0:
-            return subject_result.data[0]
-        
-        return None
+        return await get_cached_subject_info(supabase_client, device_id)
     except Exception as e:
-        print(f"Error fetching subject info: {e}")
+        logger.warning("Error fetching subject info: %s", e, extra={"device_id": device_id})
         return None
 
 async def get_sed_data(supabase_client, device_id: str, date: str, time_block: str) -> Optional[list]:
@@ -142,7 +142,7 @@ async def get_sed_data(supabase_client, device_id: str, date: str, time_block: s
     eventsカラムからYAMNetの音響イベント検出結果を取得
     """
     try:
-        result = supabase_client.table('behavior_yamnet').select('events').eq(
+        result = await supabase_client.table('behavior_yamnet').select('events').eq(
             'device_id', device_id
         ).eq(
             'date', date
@@ -155,17 +155,30 @@ async def get_sed_data(supabase_client, device_id: str, date: str, time_block: s
             return result.data[0].get('events', [])
         return None
     except Exception as e:
-        print(f"Error fetching SED data from behavior_yamnet: {e}")
+        logger.warning("Error fetching SED data from behavior_yamnet: %s", e,
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
         return None
 
 
-async def get_opensmile_data(supabase_client, device_id: str, date: str, time_block: str) -> Optional[list]:
+def extract_opensmile_timeline(row: Dict) -> OpenSmileTimeline:
+    """
+    emotion_opensmileのレコードからselected_features_timelineを取り出し、列指向の時系列に変換
+    """
+    # selected_features_timelineは既にJSONとしてパースされているはず
+    timeline = row.get('selected_features_timeline', [])
+    # JSON文字列の場合はパース
+    if isinstance(timeline, str):
+        timeline = fast_json.loads(timeline)
+    return OpenSmileTimeline.from_records(timeline)
+
+
+async def get_opensmile_data(supabase_client, device_id: str, date: str, time_block: str) -> Optional[OpenSmileTimeline]:
     """
     emotion_opensmileテーブルから特定のタイムブロックのOpenSMILEデータを取得
-    selected_features_timelineカラムから音声特徴の時系列データを取得
+    selected_features_timelineカラムから音声特徴の時系列データを取得（列指向の時系列として返す）
     """
     try:
-        result = supabase_client.table('emotion_opensmile').select('selected_features_timeline').eq(
+        result = await supabase_client.table('emotion_opensmile').select('selected_features_timeline').eq(
             'device_id', device_id
         ).eq(
             'date', date
@@ -174,57 +187,19 @@ async def get_opensmile_data(supabase_client, device_id: str, date: str, time_bl
         ).execute()
         
         if result.data and len(result.data) > 0:
-            # selected_features_timelineは既にJSONとしてパースされているはず
-            timeline = result.data[0].get('selected_features_timeline', [])
-            # JSON文字列の場合はパース
-            if isinstance(timeline, str):
-                import json
-                timeline = json.loads(timeline)
-            return timeline
+            return extract_opensmile_timeline(result.data[0])
         return None
     except Exception as e:
-        print(f"Error fetching OpenSMILE data from emotion_opensmile: {e}")
+        logger.warning("Error fetching OpenSMILE data from emotion_opensmile: %s", e,
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
         return None
 
 
 
-def generate_timeblock_prompt(transcription: Optional[str], sed_data: Optional[list], time_block: str, 
-                              date: str = None, subject_info: Optional[Dict] = None, 
-                              opensmile_data: Optional[list] = None) -> str:
-    """
-    Transcription + SEDデータ + OpenSMILEデータ + 観測対象者情報でプロンプト生成
-    時系列データを含む包括的な分析を促す
-    """
-    prompt_parts = []
-    
-    # 時間情報から時間帯を判定
-    hour = int(time_block.split('-')[0])
-    minute = int(time_block.split('-')[1])
-    time_context = ""
-    if 5 <= hour < 9:
-        time_context = "早朝"
-    elif 9 <= hour < 12:
-        time_context = "午前"
-    elif 12 <= hour < 14:
-        time_context = "昼"
-    elif 14 <= hour < 17:
-        time_context = "午後"
-    elif 17 <= hour < 20:
-        time_context = "夕方"
-    elif 20 <= hour < 23:
-        time_context = "夜"
-    else:
-        time_context = "深夜"
-    
-    # 終了時刻の計算（30分後）
-    end_minute = minute + 30
-    end_hour = hour
-    if end_minute >= 60:
-        end_hour = hour + 1
-        end_minute = end_minute - 60
-    
-    # ==================== 1. ヘッダー（タスク宣言） ====================
-    prompt_parts.append(f"""📊 音声データ分析タスク
+# ==================== プロンプトテンプレート（import時にコンパイル） ====================
+
+# 1〜4. タスク宣言・出力スキーマ・分析の前提条件・採点ポリシー
+TIMEBLOCK_PROMPT_HEADER = PromptTemplate("""📊 音声データ分析タスク
 
 あなたは「発話と音響特徴から、感情や行動の傾向を推定することに特化した臨床心理士」です。  観測データは1日48回、30分ごとのブロックに区切られ、各ブロックごとに約60秒の音声サンプルが与えられます。  このタスクの目的は、発話内容を主軸とし、音響特徴や季節、時間帯の文脈を補助的に考慮して、状況や感情をJSON形式で出力することです。
 
@@ -290,7 +265,7 @@ def generate_timeblock_prompt(transcription: Optional[str], sed_data: Optional[l
     # ==================== 3. 分析の前提条件と制約（最重要） ====================
     
 **観測対象者のプロファイリング:**
-{generate_age_context(subject_info)}
+{age_context}
 
 **分析方針:**
 - 観測対象者の年齢・性別、プロフィールを考慮した自然な解釈を行う
@@ -332,22 +307,101 @@ def generate_timeblock_prompt(transcription: Optional[str], sed_data: Optional[l
 - voice_stability_score: 声の安定性（0.0〜1.0）。0.8以上は安定、0.5以下は不安定
 - pitch_variability: 音程の変化。monotone=単調、normal=通常、expressive=表現豊か
 - rhythm_regularity: リズムの規則性（0.0〜1.0）。高いほど規則的な話し方
-""")
+""", time_block=str, age_context=str)
+
+# 5. メタ情報
+TIMEBLOCK_PROMPT_META = PromptTemplate("""
+【分析対象】
+- 地域: 日本
+- 季節: {season}
+- 日付: {date}
+- 曜日: {weekday}（{day_type}）
+- 時刻: {time_context}
+- 時間範囲: {hour:02d}:{minute:02d}〜{end_hour:02d}:{end_minute:02d}（30分ブロック）
+""", season=str, date=str, weekday=str, day_type=str, time_context=str,
+    hour=int, minute=int, end_hour=int, end_minute=int)
+
+# 6. 要約統計（OpenSMILE）
+TIMEBLOCK_PROMPT_OPENSMILE_STATS = PromptTemplate("""◆ 音声特徴（OpenSMILE）統計:
+  - 記録時間: {seconds}秒
+  - 平均音量: {avg_loudness:.3f} (範囲: {min_loudness:.3f}〜{max_loudness:.3f})
+  - 平均声の震え: {avg_jitter:.6f} (最大: {max_jitter:.6f})
+  - 無音区間: {silent_seconds}秒 / {total_seconds}秒""", seconds=int, avg_loudness=float,
+    min_loudness=float, max_loudness=float, avg_jitter=float, max_jitter=float,
+    silent_seconds=int, total_seconds=int)
+
+# 6. 要約統計（YAMNet）
+TIMEBLOCK_PROMPT_SED_STATS = PromptTemplate("""◆ 音響イベント（YAMNet）統計:
+  - 検出イベント総数: {event_count}種類
+  - 高確率イベント（70%以上）: {high_prob_count}個
+  - 中確率イベント（40-70%）: {mid_prob_count}個
+  - Speech検出率: {speech_prob:.1f}%
+  - 子供の声: {child_voice}
+  - 環境ノイズ: {noise_level}
+  - 活動音の多様性: {activity_diversity}種類""", event_count=int, high_prob_count=int,
+    mid_prob_count=int, speech_prob=float, child_voice=str, noise_level=str, activity_diversity=int)
+
+
+def generate_timeblock_prompt(transcription: Optional[str], sed_data: Optional[list], time_block: str, 
+                              date: str = None, subject_info: Optional[Dict] = None, 
+                              opensmile_data: Union[None, list, OpenSmileTimeline] = None) -> str:
+    """
+    Transcription + SEDデータ + OpenSMILEデータ + 観測対象者情報でプロンプト生成
+    時系列データを含む包括的な分析を促す
+    
+    opensmile_data は辞書のリスト・OpenSmileTimelineのどちらでも可
+    """
+    prompt_parts = []
+    opensmile_data = as_opensmile_timeline(opensmile_data)
+    
+    # 時間情報から時間帯を判定
+    hour = int(time_block.split('-')[0])
+    minute = int(time_block.split('-')[1])
+    time_context = ""
+    if 5 <= hour < 9:
+        time_context = "早朝"
+    elif 9 <= hour < 12:
+        time_context = "午前"
+    elif 12 <= hour < 14:
+        time_context = "昼"
+    elif 14 <= hour < 17:
+        time_context = "午後"
+    elif 17 <= hour < 20:
+        time_context = "夕方"
+    elif 20 <= hour < 23:
+        time_context = "夜"
+    else:
+        time_context = "深夜"
+    
+    # 終了時刻の計算（30分後）
+    end_minute = minute + 30
+    end_hour = hour
+    if end_minute >= 60:
+        end_hour = hour + 1
+        end_minute = end_minute - 60
+    
+    # ==================== 1. ヘッダー（タスク宣言） ====================
+    prompt_parts.append(TIMEBLOCK_PROMPT_HEADER.render(
+        time_block=time_block,
+        age_context=generate_age_context(subject_info)
+    ))
     
     # ==================== 5. メタ情報 ====================
     
     # 曜日情報を取得
     weekday_info = get_weekday_info(date) if date else {"weekday": "不明", "day_type": "不明"}
     
-    prompt_parts.append(f"""
-【分析対象】
-- 地域: 日本
-- 季節: {get_season(int(date.split('-')[1])) if date else '不明'}
-- 日付: {date if date else '不明'}
-- 曜日: {weekday_info['weekday']}（{weekday_info['day_type']}）
-- 時刻: {generate_time_context(hour, minute)}
-- 時間範囲: {hour:02d}:{minute:02d}〜{end_hour:02d}:{end_minute:02d}（30分ブロック）
-""")
+    prompt_parts.append(TIMEBLOCK_PROMPT_META.render(
+        season=get_season(int(date.split('-')[1])) if date else '不明',
+        date=date if date else '不明',
+        weekday=weekday_info['weekday'],
+        day_type=weekday_info['day_type'],
+        time_context=generate_time_context(hour, minute),
+        hour=hour,
+        minute=minute,
+        end_hour=end_hour,
+        end_minute=end_minute
+    ))
     
     # 観測対象者情報をメタ情報に含める
     if subject_info:
@@ -376,45 +430,31 @@ def generate_timeblock_prompt(transcription: Optional[str], sed_data: Optional[l
     
     # OpenSMILEの統計情報を先に計算
     if opensmile_data and len(opensmile_data) > 0:
-        loudness_values = [item.get('features', {}).get('Loudness_sma3', 0) for item in opensmile_data]
-        jitter_values = [item.get('features', {}).get('jitterLocal_sma3nz', 0) for item in opensmile_data]
-        
-        avg_loudness = sum(loudness_values) / len(loudness_values)
-        max_loudness = max(loudness_values)
-        min_loudness = min(loudness_values)
-        avg_jitter = sum(jitter_values) / len(jitter_values)
-        max_jitter = max(jitter_values)
-        
-        prompt_parts.append(f"""◆ 音声特徴（OpenSMILE）統計:
-  - 記録時間: {len(opensmile_data)}秒
-  - 平均音量: {avg_loudness:.3f} (範囲: {min_loudness:.3f}〜{max_loudness:.3f})
-  - 平均声の震え: {avg_jitter:.6f} (最大: {max_jitter:.6f})
-  - 無音区間: {jitter_values.count(0)}秒 / {len(jitter_values)}秒""")
+        prompt_parts.append(TIMEBLOCK_PROMPT_OPENSMILE_STATS.render(
+            seconds=len(opensmile_data),
+            avg_loudness=opensmile_data.loudness_mean,
+            min_loudness=opensmile_data.loudness_min,
+            max_loudness=opensmile_data.loudness_max,
+            avg_jitter=opensmile_data.jitter_mean,
+            max_jitter=opensmile_data.jitter_max,
+            silent_seconds=opensmile_data.silent_seconds,
+            total_seconds=len(opensmile_data)
+        ))
     else:
         prompt_parts.append("◆ 音声特徴（OpenSMILE）: データなし")
     
-    # SEDデータ（音響イベント）の統計
-    if sed_data:
-        # 確率の高い上位イベントを抽出
-        sorted_events = sorted(sed_data, key=lambda x: x.get('prob', 0), reverse=True)
-        
-        # 主要な音響イベントの統計
-        high_prob_events = [e for e in sorted_events if e.get('prob', 0) >= 0.7]
-        mid_prob_events = [e for e in sorted_events if 0.4 <= e.get('prob', 0) < 0.7]
-        
-        speech_prob = next((e.get('prob', 0)*100 for e in sorted_events if 'Speech' in e.get('label', '')), 0)
-        has_child_voice = any('Child' in e.get('label', '') or 'Baby' in e.get('label', '') for e in sorted_events[:20])
-        has_noise = any('Noise' in e.get('label', '') for e in sorted_events[:10])
-        activity_diversity = len([e for e in sorted_events[:20] if e.get('prob', 0) > 0.3])
-        
-        prompt_parts.append(f"""◆ 音響イベント（YAMNet）統計:
-  - 検出イベント総数: {len(sed_data)}種類
-  - 高確率イベント（70%以上）: {len(high_prob_events)}個
-  - 中確率イベント（40-70%）: {len(mid_prob_events)}個
-  - Speech検出率: {speech_prob:.1f}%
-  - 子供の声: {'検出' if has_child_voice else '未検出'}
-  - 環境ノイズ: {'高' if has_noise else '低'}
-  - 活動音の多様性: {activity_diversity}種類""")
+    # SEDデータ（音響イベント）の統計（1パスで集計し、確率の高い上位イベントを抽出）
+    sed_summary = summarize_sed_events(sed_data) if sed_data else None
+    if sed_summary:
+        prompt_parts.append(TIMEBLOCK_PROMPT_SED_STATS.render(
+            event_count=sed_summary.event_count,
+            high_prob_count=sed_summary.high_prob_count,
+            mid_prob_count=sed_summary.mid_prob_count,
+            speech_prob=sed_summary.speech_prob,
+            child_voice='検出' if sed_summary.has_child_voice else '未検出',
+            noise_level='高' if sed_summary.has_noise else '低',
+            activity_diversity=sed_summary.activity_diversity
+        ))
     else:
         prompt_parts.append("◆ 音響イベント（YAMNet）: データなし")
     
@@ -434,25 +474,20 @@ def generate_timeblock_prompt(transcription: Optional[str], sed_data: Optional[l
         prompt_parts.append("時刻 | 音量(Loudness) | 声の震え(Jitter)")
         prompt_parts.append("-----|---------------|----------------")
         
-        for item in opensmile_data[:60]:  # 最大60秒分
-            timestamp = item.get('timestamp', 'N/A')
-            features = item.get('features', {})
-            loudness = features.get('Loudness_sma3', 0)
-            jitter = features.get('jitterLocal_sma3nz', 0)
+        for timestamp, loudness, jitter in opensmile_data[:60].rows():  # 最大60秒分
             prompt_parts.append(f"{timestamp} | {loudness:.3f} | {jitter:.6f}")
     
     # SEDイベントの詳細リスト
-    if sed_data:
-        sorted_events = sorted(sed_data, key=lambda x: x.get('prob', 0), reverse=True)
+    if sed_summary:
         prompt_parts.append("\n◆ 音響イベント詳細（YAMNet、確率順）:")
         
         # 上位20個のイベントのみ表示
-        for i, event in enumerate(sorted_events[:20], 1):
-            label = event.get('label', 'Unknown')
-            prob = event.get('prob', 0)
+        for i, (label, prob) in enumerate(sed_summary.top_events, 1):
             prompt_parts.append(f"  {i}. {label}: {prob*100:.1f}%")
     
-    return "\n".join(prompt_parts)
+    prompt = "\n".join(prompt_parts)
+    observe_prompt("timeblock_v1", prompt)
+    return prompt
 
 
 async def update_whisper_status(supabase_client, device_id: str, date: str, time_block: str):
@@ -464,7 +499,7 @@ async def update_whisper_status(supabase_client, device_id: str, date: str, time
             'status': 'completed'
         }
         
-        result = supabase_client.table('vibe_whisper').update(data).eq(
+        result = await supabase_client.table('vibe_whisper').update(data).eq(
             'device_id', device_id
         ).eq(
             'date', date
@@ -472,10 +507,14 @@ async def update_whisper_status(supabase_client, device_id: str, date: str, time
             'time_block', time_block
         ).execute()
         
-        print(f"✅ Updated vibe_whisper status to completed for {time_block}")
+        block_logger.debug("Updated vibe_whisper status to completed",
+                           extra={"device_id": device_id, "date": date, "time_block": time_block})
+        record_status_updates('vibe_whisper', updated=1)
         return True
     except Exception as e:
-        print(f"⚠️ Error updating vibe_whisper status: {e}")
+        logger.warning("Error updating vibe_whisper status: %s", e,
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
+        record_status_updates('vibe_whisper', updated=0, failed=1)
         return False
 
 
@@ -488,7 +527,7 @@ async def update_yamnet_status(supabase_client, device_id: str, date: str, time_
             'status': 'completed'
         }
         
-        result = supabase_client.table('behavior_yamnet').update(data).eq(
+        result = await supabase_client.table('behavior_yamnet').update(data).eq(
             'device_id', device_id
         ).eq(
             'date', date
@@ -496,10 +535,14 @@ async def update_yamnet_status(supabase_client, device_id: str, date: str, time_
             'time_block', time_block
         ).execute()
         
-        print(f"✅ Updated behavior_yamnet status to completed for {time_block}")
+        block_logger.debug("Updated behavior_yamnet status to completed",
+                           extra={"device_id": device_id, "date": date, "time_block": time_block})
+        record_status_updates('behavior_yamnet', updated=1)
         return True
     except Exception as e:
-        print(f"⚠️ Error updating behavior_yamnet status: {e}")
+        logger.warning("Error updating behavior_yamnet status: %s", e,
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
+        record_status_updates('behavior_yamnet', updated=0, failed=1)
         return False
 
 
@@ -512,7 +555,7 @@ async def update_opensmile_status(supabase_client, device_id: str, date: str, ti
             'status': 'completed'
         }
         
-        result = supabase_client.table('emotion_opensmile').update(data).eq(
+        result = await supabase_client.table('emotion_opensmile').update(data).eq(
             'device_id', device_id
         ).eq(
             'date', date
@@ -520,16 +563,148 @@ async def update_opensmile_status(supabase_client, device_id: str, date: str, ti
             'time_block', time_block
         ).execute()
         
-        print(f"✅ Updated emotion_opensmile status to completed for {time_block}")
+        block_logger.debug("Updated emotion_opensmile status to completed",
+                           extra={"device_id": device_id, "date": date, "time_block": time_block})
+        record_status_updates('emotion_opensmile', updated=1)
         return True
     except Exception as e:
-        print(f"⚠️ Error updating emotion_opensmile status: {e}")
+        logger.warning("Error updating emotion_opensmile status: %s", e,
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
+        record_status_updates('emotion_opensmile', updated=0, failed=1)
         return False
 
 
-async def save_prompt_to_dashboard(supabase_client, device_id: str, date: str, time_block: str, prompt: str):
+# statusを管理するデータソーステーブル
+STATUS_TABLES = ('vibe_whisper', 'behavior_yamnet', 'emotion_opensmile')
+
+
+async def mark_status_completed_bulk(supabase_client, table: str,
+                                     keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], bool]:
+    """
+    複数の(device_id, date, time_block)のstatusをまとめてcompletedに更新
+    device_id + date ごとに time_block の in_ フィルタで1回のUPDATEを発行する
+    （1日分なら48ブロックでも1回、複数日なら日数分の更新を並行実行）
+    
+    Args:
+        table: 更新対象テーブル（vibe_whisper / behavior_yamnet / emotion_opensmile）
+        keys: (device_id, date, time_block) のリスト
+    
+    Returns:
+        キーごとの更新成否（更新した行として time_block が返されたキーのみTrue。該当行がないキーはFalse）
+    """
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    for device_id, date, time_block in keys:
+        blocks = groups.setdefault((device_id, date), [])
+        if time_block not in blocks:
+            blocks.append(time_block)
+    
+    results: Dict[Tuple[str, str, str], bool] = {}
+    
+    async def update_group(device_id: str, date: str, time_blocks: List[str]):
+        try:
+            # 実際に更新した行を判定するため time_block のみを返させる
+            response = await supabase_client.table(table).update({'status': 'completed'}).eq(
+                'device_id', device_id
+            ).eq(
+                'date', date
+            ).in_(
+                'time_block', time_blocks
+            ).select_returned('time_block').execute()
+            updated_blocks = {row['time_block'] for row in response.data or []}
+        except Exception as e:
+            logger.warning("Error updating %s status: %s", table, e,
+                           extra={"table": table, "device_id": device_id, "date": date})
+            updated_blocks = set()
+        for time_block in time_blocks:
+            results[(device_id, date, time_block)] = time_block in updated_blocks
+    
+    await asyncio.gather(*(
+        update_group(device_id, date, time_blocks)
+        for (device_id, date), time_blocks in groups.items()
+    ))
+    
+    updated = sum(1 for success in results.values() if success)
+    logger.info("Updated %s status to completed for %d/%d blocks", table, updated, len(results),
+                extra={"table": table, "updated": updated, "blocks": len(results), "statements": len(groups)})
+    record_status_updates(table, updated=updated, failed=len(results) - updated)
+    return results
+
+
+async def mark_statuses_completed_bulk(supabase_client,
+                                       keys_by_table: Dict[str, List[Tuple[str, str, str]]]
+                                       ) -> Dict[str, Dict[Tuple[str, str, str], bool]]:
+    """
+    複数テーブルのstatus一括更新を並行実行
+    
+    Args:
+        keys_by_table: テーブル名 → (device_id, date, time_block) のリスト
+    
+    Returns:
+        テーブル名 → キーごとの更新成否
+    """
+    tables = [table for table, keys in keys_by_table.items() if keys]
+    results = await asyncio.gather(*(
+        mark_status_completed_bulk(supabase_client, table, keys_by_table[table])
+        for table in tables
+    ))
+    return dict(zip(tables, results))
+
+
+# dashboard.prompt_fingerprint カラムの有無（None: 未確認）。カラム追加前のDBではフィンガープリントを使わない
+_fingerprint_column: Optional[bool] = None
+
+# PostgRESTの「カラムが存在しない」エラー（SELECT: 42703 undefined_column、書き込み: PGRST204）
+MISSING_COLUMN_CODES = ("42703", "PGRST204")
+
+
+async def has_fingerprint_column(supabase_client) -> bool:
+    """
+    dashboardテーブルに prompt_fingerprint カラムがあるか（プロセスごとに最初の1回だけ確認）
+    確認のクエリがカラム以外の理由で失敗した場合は、今回はフィンガープリントを使わず次回に再確認する
+    """
+    global _fingerprint_column
+    if _fingerprint_column is None:
+        try:
+            await supabase_client.table('dashboard').select('prompt_fingerprint').limit(1).execute()
+        except Exception as e:
+            if getattr(e, 'code', None) not in MISSING_COLUMN_CODES:
+                logger.warning("Could not check dashboard.prompt_fingerprint column: %s", e)
+                return False
+            logger.warning("dashboard.prompt_fingerprint column not found, input fingerprints are disabled")
+            _fingerprint_column = False
+        else:
+            _fingerprint_column = True
+    return _fingerprint_column
+
+
+async def get_dashboard_prompt(supabase_client, device_id: str, date: str, time_block: str) -> Optional[Dict]:
+    """
+    dashboardテーブルに保存済みのプロンプトと入力フィンガープリントを取得
+    未保存の場合はNone
+    """
+    result = await supabase_client.table('dashboard').select(
+        'prompt', 'prompt_fingerprint'
+    ).eq(
+        'device_id', device_id
+    ).eq(
+        'date', date
+    ).eq(
+        'time_block', time_block
+    ).execute()
+    
+    if result.data and len(result.data) > 0:
+        return result.data[0]
+    return None
+
+
+async def save_prompt_to_dashboard(supabase_client, device_id: str, date: str, time_block: str, prompt: str,
+                                   prompt_fingerprint: Optional[str] = None):
     """
     生成したプロンプトをdashboardテーブルに保存
+    （DASHBOARD_WRITE_BEHIND=true の場合は書き込みバッファ経由で、他のリクエストの行とまとめて書き込む）
+    
+    Args:
+        prompt_fingerprint: プロンプトの入力フィンガープリント（指定時のみ保存）
     """
     try:
         data = {
@@ -539,13 +714,56 @@ async def save_prompt_to_dashboard(supabase_client, device_id: str, date: str, t
             'prompt': prompt,
             'updated_at': datetime.now().isoformat()
         }
+        if prompt_fingerprint is not None:
+            data['prompt_fingerprint'] = prompt_fingerprint
         
-        result = supabase_client.table('dashboard').upsert(data).execute()
-        print(f"✅ Prompt saved to dashboard table for {time_block}")
+        if dashboard_writes.enabled:
+            if not await dashboard_writes.write(supabase_client, data):
+                return False
+        else:
+            result = await supabase_client.table('dashboard').upsert(data).execute()
+        block_logger.debug("Prompt saved to dashboard table",
+                           extra={"device_id": device_id, "date": date, "time_block": time_block})
         return True
-    except Exception as e:
-        print(f"Error saving prompt to dashboard: {e}")
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error saving prompt to dashboard",
+                         extra={"device_id": device_id, "date": date, "time_block": time_block})
+        return False
+
+
+async def save_prompts_to_dashboard(supabase_client, rows: List[Dict[str, Any]]) -> bool:
+    """
+    複数タイムブロックのプロンプトを1回の複数行UPSERTでdashboardテーブルに保存
+    
+    Args:
+        rows: device_id, date, time_block, prompt（と任意で prompt_fingerprint）を含む辞書のリスト
+    """
+    if not rows:
+        return True
+    try:
+        updated_at = datetime.now().isoformat()
+        data = []
+        for row in rows:
+            item = {
+                'device_id': row['device_id'],
+                'date': row['date'],
+                'time_block': row['time_block'],
+                'prompt': row['prompt'],
+                'updated_at': updated_at
+            }
+            if row.get('prompt_fingerprint') is not None:
+                item['prompt_fingerprint'] = row['prompt_fingerprint']
+            data.append(item)
+        
+        if dashboard_writes.enabled:
+            if not await dashboard_writes.write_many(supabase_client, data):
+                return False
+        else:
+            await supabase_client.table('dashboard').upsert(data, returning=ReturnMethod.minimal).execute()
+        logger.info("%d prompts saved to dashboard table", len(data), extra={"rows": len(data)})
+        return True
+    except Exception:
+        logger.exception("Error saving prompts to dashboard", extra={"rows": len(rows)})
         return False
 
 
@@ -568,14 +786,34 @@ async def process_and_save_to_dashboard(supabase_client, device_id: str, date: s
         if vibe_score is not None:
             data['vibe_score'] = vibe_score
         
-        result = supabase_client.table('dashboard').upsert(data).execute()
+        if dashboard_writes.enabled:
+            return await dashboard_writes.write(supabase_client, data)
+        result = await supabase_client.table('dashboard').upsert(data).execute()
         return True
-    except Exception as e:
-        print(f"Error saving to dashboard: {e}")
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error saving to dashboard",
+                         extra={"device_id": device_id, "date": date, "time_block": time_block})
         return False
 
 
+def log_block_inputs(device_id: str, date: str, time_block: str, transcription: Optional[str],
+                     sed_data: Optional[list], opensmile_data: Optional[OpenSmileTimeline],
+                     subject_info: Optional[Dict]):
+    """タイムブロックの取得データの概要をデバッグログに出力（無効時は項目を組み立てない）"""
+    if not block_logger.isEnabledFor(logging.DEBUG):
+        return
+    block_logger.debug("Data retrieved", extra={
+        "device_id": device_id,
+        "date": date,
+        "time_block": time_block,
+        "transcription_chars": len(transcription) if transcription else 0,
+        "has_transcription": transcription is not None,
+        "sed_events": len(sed_data) if sed_data else 0,
+        "opensmile_seconds": len(opensmile_data) if opensmile_data else 0,
+        "has_subject_info": bool(subject_info),
+    })
+
+
 # エクスポート用の処理関数
 
 
@@ -596,14 +834,11 @@ async def process_timeblock_v2(supabase_client, device_id: str, date: str, time_
     has_opensmile = opensmile_data is not None and len(opensmile_data) > 0
     
     # プロンプト生成（OpenSMILEデータも含めて渡す）
-    prompt = generate_timeblock_prompt(transcription, sed_data, time_block, date, subject_info, opensmile_data)
+    with span("render"):
+        prompt = generate_timeblock_prompt(transcription, sed_data, time_block, date, subject_info, opensmile_data)
     
     # デバッグ用：取得したデータの情報を出力
-    print(f"📊 Data retrieved for {time_block}:")
-    print(f"  - Transcription: {'Yes' if has_whisper else 'No'} ({len(transcription) if transcription else 0} chars)")
-    print(f"  - SED Events: {'Yes' if has_yamnet else 'No'} ({len(sed_data) if sed_data else 0} events)")
-    print(f"  - OpenSMILE Timeline: {'Yes' if has_opensmile else 'No'} ({len(opensmile_data) if opensmile_data else 0} seconds)")
-    print(f"  - Subject Info: {'Yes' if subject_info else 'No'}")
+    log_block_inputs(device_id, date, time_block, transcription, sed_data, opensmile_data, subject_info)
     
     # プロンプト保存（dashboardテーブルへ）
     dashboard_saved = await save_prompt_to_dashboard(supabase_client, device_id, date, time_block, prompt)
@@ -616,8 +851,6 @@ async def process_timeblock_v2(supabase_client, device_id: str, date: str, time_
     }
     
     if dashboard_saved:
-        print(f"\n📝 Updating status for used data sources...")
-        
         # 実際にデータが存在した場合のみstatusを更新
         if has_whisper:
             status_updates["whisper_updated"] = await update_whisper_status(
@@ -635,12 +868,12 @@ async def process_timeblock_v2(supabase_client, device_id: str, date: str, time_
             )
         
         # 更新結果のサマリー
-        print(f"\n✨ Status update summary:")
-        print(f"  - vibe_whisper: {'✅ Updated' if status_updates['whisper_updated'] else '⏭️ Skipped (no data)' if not has_whisper else '⚠️ Update failed'}")
-        print(f"  - behavior_yamnet: {'✅ Updated' if status_updates['yamnet_updated'] else '⏭️ Skipped (no data)' if not has_yamnet else '⚠️ Update failed'}")
-        print(f"  - emotion_opensmile: {'✅ Updated' if status_updates['opensmile_updated'] else '⏭️ Skipped (no data)' if not has_opensmile else '⚠️ Update failed'}")
+        block_logger.debug("Status update summary", extra={
+            "device_id": device_id, "date": date, "time_block": time_block, **status_updates
+        })
     else:
-        print(f"⚠️ Dashboard save failed, skipping status updates")
+        logger.warning("Dashboard save failed, skipping status updates",
+                       extra={"device_id": device_id, "date": date, "time_block": time_block})
     
     return {
         "status": "success",
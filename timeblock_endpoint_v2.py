@@ -4,139 +4,38 @@ Time Block Processing Endpoint V2
 改善版：AIの常識的判断を活用し、シンプルで効果的なプロンプト生成
 """
 
-from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
+import asyncio
+import hashlib
 import json
-import traceback
+import logging
 
+from calendar_index import get_calendar_day
+from prompt_templates import PromptTemplate
+from opensmile_timeline import OpenSmileTimeline, as_opensmile_timeline
+from sed_summary import leading_labels
+from metrics import observe_prompt, TIMEBLOCK_RESULTS
+from tracing import span
+from log_config import get_block_logger
 
-def get_season(month: int) -> str:
-    """月から季節を判定（日本の季節）"""
-    if month in [3, 4, 5]:
-        return "春"
-    elif month in [6, 7, 8]:
-        return "夏"
-    elif month in [9, 10, 11]:
-        return "秋"
-    else:
-        return "冬"
-
-
-def get_weekday_info(date_str: str) -> Dict[str, Any]:
-    """日付文字列から曜日情報を取得"""
-    try:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        
-        # 曜日名（日本語）
-        weekdays_ja = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
-        weekday_ja = weekdays_ja[date_obj.weekday()]
-        
-        # 週末判定
-        is_weekend = date_obj.weekday() >= 5  # 土曜日(5)または日曜日(6)
-        
-        return {
-            "weekday": weekday_ja,
-            "is_weekend": is_weekend,
-            "day_type": "週末" if is_weekend else "平日"
-        }
-    except (ValueError, TypeError):
-        return {
-            "weekday": "不明",
-            "is_weekend": None,
-            "day_type": "不明"
-        }
+logger = logging.getLogger(__name__)
+block_logger = get_block_logger(__name__)
 
 
 def get_holiday_context(date: str) -> Dict[str, Any]:
     """
-    祝日情報を取得（jpholidayが利用可能な場合）
+    祝日情報を取得（事前計算済みのカレンダー索引を参照）
     """
-    try:
-        import jpholiday
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        holiday_name = jpholiday.is_holiday_name(date_obj)
-        is_holiday = holiday_name is not None
-        
-        return {
-            "is_holiday": is_holiday,
-            "holiday_name": holiday_name,
-            "is_weekend": date_obj.weekday() >= 5
-        }
-    except:
-        # jpholidayが利用できない場合
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        return {
-            "is_holiday": False,
-            "holiday_name": None,
-            "is_weekend": date_obj.weekday() >= 5
-        }
-
+    day = get_calendar_day(date)
+    return {
+        "is_holiday": day.is_holiday,
+        "holiday_name": day.holiday_name,
+        "is_weekend": day.is_weekend
+    }
 
-def generate_timeblock_prompt_v2(transcription: Optional[str], sed_data: Optional[list], time_block: str,
-                                 date: str = None, subject_info: Optional[Dict] = None,
-                                 opensmile_data: Optional[list] = None) -> str:
-    """
-    改善版プロンプト生成：LLMの常識的判断を最大限活用
-    """
-    
-    # 時間情報の解析
-    hour = int(time_block.split('-')[0])
-    minute = int(time_block.split('-')[1])
-    
-    # 観測対象者情報
-    age = subject_info.get('age', '不明') if subject_info else '不明'
-    gender = subject_info.get('gender', '不明') if subject_info else '不明'
-    
-    # 曜日・祝日情報
-    weekday_info = get_weekday_info(date) if date else {"weekday": "不明", "day_type": "不明"}
-    holiday_info = get_holiday_context(date) if date else {"is_holiday": False, "holiday_name": None}
-    
-    # OpenSMILEデータの分析と時系列表示
-    speech_analysis = ""
-    if opensmile_data and len(opensmile_data) > 0:
-        # Jitterから発話の有無を判定
-        jitter_values = []
-        loudness_values = []
-        for item in opensmile_data:
-            features = item.get('features', {})
-            jitter_values.append(features.get('jitterLocal_sma3nz', 0))
-            loudness_values.append(features.get('Loudness_sma3', 0))
-        
-        speaking_seconds = sum(1 for j in jitter_values if j > 0)
-        total_seconds = len(jitter_values)
-        speech_ratio = speaking_seconds / total_seconds if total_seconds > 0 else 0
-        
-        # 時系列の最初の20秒を表示
-        timeline = ["時刻|音量|Jitter|状態"]
-        timeline.append("---|---|---|---")
-        for i in range(min(20, len(opensmile_data))):
-            features = opensmile_data[i].get('features', {})
-            loudness = features.get('Loudness_sma3', 0)
-            jitter = features.get('jitterLocal_sma3nz', 0)
-            state = "発話" if jitter > 0 else "無音"
-            timeline.append(f"{i:02d}秒|{loudness:.3f}|{jitter:.6f}|{state}")
-        
-        speech_analysis = f"""
-### 音響分析（60秒間の客観的データ）
-- **発話検出**: {speaking_seconds}秒/{total_seconds}秒（{speech_ratio:.0%}が発話）
-- **重要**: Jitter=0は発話なし、Jitter>0は人の声あり
 
-#### 音響データ時系列（最初の20秒）
-{chr(10).join(timeline)}
-"""
-    
-    # 環境音の簡潔な要約
-    sound_summary = "環境音データなし"
-    if sed_data and len(sed_data) > 0:
-        top_sounds = []
-        for e in sed_data[:5]:
-            if e.get('prob', 0) > 0.3:
-                top_sounds.append(e.get('label', ''))
-        if top_sounds:
-            sound_summary = f"検出音: {', '.join(top_sounds)}"
-    
-    # プロンプト生成
-    prompt = f"""
+# 改善版プロンプトのテンプレート（import時にコンパイル）
+TIMEBLOCK_PROMPT_V2 = PromptTemplate("""
 あなたは子どもの行動観察の専門家です。
 与えられたデータから、その時点で最も可能性の高い状況を、あなたの専門知識と常識を使って推測してください。
 
@@ -145,13 +44,13 @@ def generate_timeblock_prompt_v2(transcription: Optional[str], sed_data: Optiona
 
 ## 時間情報  
 - 日時: {date} {hour:02d}:{minute:02d}
-- 曜日: {weekday_info['weekday']}（{weekday_info['day_type']}）
-{'- 🎌 祝日: ' + holiday_info['holiday_name'] if holiday_info['is_holiday'] else ''}
+- 曜日: {weekday}（{day_type}）
+{holiday_line}
 
 {speech_analysis}
 
 ### 発話内容
-{f'「{transcription}」' if transcription and transcription.strip() else '録音された明確な発話なし'}
+{transcription_text}
 
 ### 環境音
 {sound_summary}
@@ -205,77 +104,259 @@ def generate_timeblock_prompt_v2(transcription: Optional[str], sed_data: Optiona
 - 例：5歳児の午前2時＋発話なし → 「睡眠」が最も自然
 - 例：休日の午前中＋断続的な発話 → 「家族と過ごしている」が自然
 - 睡眠は「ニュートラル」であり、ポジティブでもネガティブでもない。behaviorを睡眠と判定したら、vibe_scoreは自動的に0
+""", age=object, gender=object, date=object, hour=int, minute=int,
+    weekday=str, day_type=str, holiday_line=str, speech_analysis=str, transcription_text=str,
+    sound_summary=str, time_block=str)
+
+
+def generate_timeblock_prompt_v2(transcription: Optional[str], sed_data: Optional[list], time_block: str,
+                                 date: str = None, subject_info: Optional[Dict] = None,
+                                 opensmile_data: Union[None, list, OpenSmileTimeline] = None) -> str:
+    """
+    改善版プロンプト生成：LLMの常識的判断を最大限活用
+    opensmile_data は辞書のリスト・OpenSmileTimelineのどちらでも可
+    """
+    opensmile_data = as_opensmile_timeline(opensmile_data)
+    
+    # 時間情報の解析
+    hour = int(time_block.split('-')[0])
+    minute = int(time_block.split('-')[1])
+    
+    # 観測対象者情報
+    age = subject_info.get('age', '不明') if subject_info else '不明'
+    gender = subject_info.get('gender', '不明') if subject_info else '不明'
+    
+    # 曜日・祝日情報
+    weekday_info = get_weekday_info(date) if date else {"weekday": "不明", "day_type": "不明"}
+    holiday_info = get_holiday_context(date) if date else {"is_holiday": False, "holiday_name": None}
+    
+    # OpenSMILEデータの分析と時系列表示
+    speech_analysis = ""
+    if opensmile_data and len(opensmile_data) > 0:
+        # Jitterから発話の有無を判定
+        speaking_seconds = opensmile_data.speaking_seconds
+        total_seconds = len(opensmile_data)
+        speech_ratio = opensmile_data.speech_ratio
+        
+        # 時系列の最初の20秒を表示
+        timeline = ["時刻|音量|Jitter|状態"]
+        timeline.append("---|---|---|---")
+        first_seconds = opensmile_data[:20]
+        for i, (loudness, jitter) in enumerate(zip(first_seconds.loudness, first_seconds.jitter)):
+            state = "発話" if jitter > 0 else "無音"
+            timeline.append(f"{i:02d}秒|{loudness:.3f}|{jitter:.6f}|{state}")
+        
+        speech_analysis = f"""
+### 音響分析（60秒間の客観的データ）
+- **発話検出**: {speaking_seconds}秒/{total_seconds}秒（{speech_ratio:.0%}が発話）
+- **重要**: Jitter=0は発話なし、Jitter>0は人の声あり
+
+#### 音響データ時系列（最初の20秒）
+{chr(10).join(timeline)}
 """
     
+    # 環境音の簡潔な要約
+    sound_summary = "環境音データなし"
+    if sed_data and len(sed_data) > 0:
+        # 先頭5件のうち確率30%超のラベル
+        top_sounds = leading_labels(sed_data)
+        if top_sounds:
+            sound_summary = f"検出音: {', '.join(top_sounds)}"
+    
+    # プロンプト生成
+    prompt = TIMEBLOCK_PROMPT_V2.render(
+        age=age,
+        gender=gender,
+        date=date,
+        hour=hour,
+        minute=minute,
+        weekday=weekday_info['weekday'],
+        day_type=weekday_info['day_type'],
+        holiday_line='- 🎌 祝日: ' + holiday_info['holiday_name'] if holiday_info['is_holiday'] else '',
+        speech_analysis=speech_analysis,
+        transcription_text=f'「{transcription}」' if transcription and transcription.strip() else '録音された明確な発話なし',
+        sound_summary=sound_summary,
+        time_block=time_block
+    )
+    
+    observe_prompt("timeblock_v2", prompt)
     return prompt
 
 
 # 既存の関数をインポート可能にするため
 from timeblock_endpoint import (
+    TIME_BLOCKS,
+    get_weekday_info,
+    get_day_rows,
     get_whisper_data,
     get_sed_data,
     get_opensmile_data,
     get_subject_info,
+    extract_opensmile_timeline,
+    get_dashboard_prompt,
+    has_fingerprint_column,
     save_prompt_to_dashboard,
+    save_prompts_to_dashboard,
+    mark_statuses_completed_bulk,
     update_whisper_status,
     update_yamnet_status,
-    update_opensmile_status
+    update_opensmile_status,
+    log_block_inputs
 )
 
 
-async def process_timeblock_v3(supabase_client, device_id: str, date: str, time_block: str) -> Dict[str, Any]:
+# プロンプトのバージョン（生成ロジックを変更した場合は更新する。テンプレート本文の変更はハッシュで反映）
+PROMPT_VERSION = "v3-improved:" + hashlib.sha256(TIMEBLOCK_PROMPT_V2.source.encode("utf-8")).hexdigest()[:12]
+
+
+def compute_input_fingerprint(transcription: Optional[str], sed_data: Optional[list],
+                              opensmile_data: Union[None, list, OpenSmileTimeline], subject_info: Optional[Dict],
+                              date: str, time_block: str) -> str:
+    """
+    プロンプトの入力（発話・SEDイベント・OpenSMILE時系列・観測対象者情報・日時・プロンプトバージョン）の
+    フィンガープリント（キー順を固定したJSONのSHA-256）
+    """
+    opensmile_data = as_opensmile_timeline(opensmile_data)
+    canonical = json.dumps(
+        {
+            "prompt_version": PROMPT_VERSION,
+            "date": date,
+            "time_block": time_block,
+            "transcription": transcription,
+            "sed_data": sed_data,
+            "opensmile_data": opensmile_data.fingerprint_payload() if opensmile_data is not None else None,
+            "subject_info": subject_info
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def fetched_or_none(results: List[Any]) -> List[Any]:
+    """
+    gather(..., return_exceptions=True) の結果のうち、取得に失敗したもの（Exception）をNoneに置き換える
+    キャンセル等の Exception 以外の BaseException はデータとして扱わず再送出する
+    """
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            raise result
+    return [None if isinstance(result, Exception) else result for result in results]
+
+
+async def update_source_statuses(supabase_client, device_id: str, date: str, time_block: str,
+                                 has_whisper: bool, has_yamnet: bool, has_opensmile: bool) -> Dict[str, bool]:
+    """データが存在した各データソースのstatusをcompletedに更新"""
+    status_updates = {
+        "whisper_updated": False,
+        "yamnet_updated": False,
+        "opensmile_updated": False
+    }
+    
+    if has_whisper:
+        status_updates["whisper_updated"] = await update_whisper_status(
+            supabase_client, device_id, date, time_block
+        )
+    
+    if has_yamnet:
+        status_updates["yamnet_updated"] = await update_yamnet_status(
+            supabase_client, device_id, date, time_block
+        )
+    
+    if has_opensmile:
+        status_updates["opensmile_updated"] = await update_opensmile_status(
+            supabase_client, device_id, date, time_block
+        )
+    
+    return status_updates
+
+
+async def process_timeblock_v3(supabase_client, device_id: str, date: str, time_block: str,
+                               force: bool = False) -> Dict[str, Any]:
     """
     改善版処理: V2プロンプトを使用
+    
+    入力のフィンガープリントが保存済みのものと一致する場合は、プロンプト生成・dashboardへの保存を行わず
+    status="unchanged" を返す（force=True で常に再生成）
+    ステータス更新は unchanged の場合も行う（前回の保存後にステータス更新が失敗していた場合に未完了のまま残さないため）
+    dashboardテーブルに prompt_fingerprint カラムがない場合はフィンガープリントを使わず常に生成・保存する
     """
-    # データ取得
-    transcription = await get_whisper_data(supabase_client, device_id, date, time_block)
-    sed_data = await get_sed_data(supabase_client, device_id, date, time_block)
-    opensmile_data = await get_opensmile_data(supabase_client, device_id, date, time_block)
-    subject_info = await get_subject_info(supabase_client, device_id)
+    use_fingerprint = await has_fingerprint_column(supabase_client)
+    
+    # データ取得と保存済みフィンガープリントの取得（互いに独立しているため並行して実行）
+    fetches = [
+        get_whisper_data(supabase_client, device_id, date, time_block),
+        get_sed_data(supabase_client, device_id, date, time_block),
+        get_opensmile_data(supabase_client, device_id, date, time_block),
+        get_subject_info(supabase_client, device_id),
+    ]
+    if use_fingerprint and not force:
+        fetches.append(get_dashboard_prompt(supabase_client, device_id, date, time_block))
+    results = await asyncio.gather(*fetches, return_exceptions=True)
+    # 取得に失敗したデータソースはNoneとして扱う（各取得関数のエラー時と同じ）
+    transcription, sed_data, opensmile_data, subject_info, *saved = fetched_or_none(results)
+    saved = saved[0] if saved else None
     
     # データ存在フラグ
     has_whisper = transcription is not None
     has_yamnet = sed_data is not None and len(sed_data) > 0
     has_opensmile = opensmile_data is not None and len(opensmile_data) > 0
     
+    fingerprint = None
+    if use_fingerprint:
+        with span("fingerprint"):
+            fingerprint = compute_input_fingerprint(transcription, sed_data, opensmile_data, subject_info, date, time_block)
+    if saved and saved.get('prompt_fingerprint') == fingerprint:
+        block_logger.debug("Inputs unchanged, skipping generation",
+                           extra={"device_id": device_id, "date": date, "time_block": time_block})
+        status_updates = await update_source_statuses(
+            supabase_client, device_id, date, time_block, has_whisper, has_yamnet, has_opensmile
+        )
+        TIMEBLOCK_RESULTS.inc(mode="single", status="unchanged")
+        prompt = saved.get('prompt') or ""
+        return {
+            "status": "unchanged",
+            "version": "v3-improved",
+            "device_id": device_id,
+            "date": date,
+            "time_block": time_block,
+            "prompt": prompt,
+            "prompt_length": len(prompt),
+            "prompt_fingerprint": fingerprint,
+            "has_transcription": has_whisper and len(transcription.strip()) > 0 if transcription else False,
+            "has_sed_data": has_yamnet,
+            "has_opensmile_data": has_opensmile,
+            "sed_events_count": len(sed_data) if sed_data else 0,
+            "opensmile_seconds": len(opensmile_data) if opensmile_data else 0,
+            "dashboard_saved": False,
+            "status_updates": status_updates
+        }
+    
     # 改善版プロンプト生成
-    prompt = generate_timeblock_prompt_v2(transcription, sed_data, time_block, date, subject_info, opensmile_data)
+    with span("render"):
+        prompt = generate_timeblock_prompt_v2(transcription, sed_data, time_block, date, subject_info, opensmile_data)
     
     # デバッグ出力
-    print(f"📊 Data retrieved for {time_block}:")
-    print(f"  - Transcription: {'Yes' if has_whisper else 'No'} ({len(transcription) if transcription else 0} chars)")
-    print(f"  - SED Events: {'Yes' if has_yamnet else 'No'} ({len(sed_data) if sed_data else 0} events)")
-    print(f"  - OpenSMILE Timeline: {'Yes' if has_opensmile else 'No'} ({len(opensmile_data) if opensmile_data else 0} seconds)")
-    print(f"  - Subject Info: {'Yes' if subject_info else 'No'}")
+    log_block_inputs(device_id, date, time_block, transcription, sed_data, opensmile_data, subject_info)
     
     # プロンプト保存
-    dashboard_saved = await save_prompt_to_dashboard(supabase_client, device_id, date, time_block, prompt)
-    
-    # ステータス更新
-    status_updates = {
-        "whisper_updated": False,
-        "yamnet_updated": False,
-        "opensmile_updated": False
-    }
+    dashboard_saved = await save_prompt_to_dashboard(supabase_client, device_id, date, time_block, prompt, fingerprint)
     
+    # ステータス更新（dashboardへの保存が成功した場合のみ）
     if dashboard_saved:
-        print(f"\n📝 Updating status for used data sources...")
-        
-        if has_whisper:
-            status_updates["whisper_updated"] = await update_whisper_status(
-                supabase_client, device_id, date, time_block
-            )
-        
-        if has_yamnet:
-            status_updates["yamnet_updated"] = await update_yamnet_status(
-                supabase_client, device_id, date, time_block
-            )
-        
-        if has_opensmile:
-            status_updates["opensmile_updated"] = await update_opensmile_status(
-                supabase_client, device_id, date, time_block
-            )
+        status_updates = await update_source_statuses(
+            supabase_client, device_id, date, time_block, has_whisper, has_yamnet, has_opensmile
+        )
+    else:
+        status_updates = {
+            "whisper_updated": False,
+            "yamnet_updated": False,
+            "opensmile_updated": False
+        }
     
+    TIMEBLOCK_RESULTS.inc(mode="single", status="success")
     return {
         "status": "success",
         "version": "v3-improved",
@@ -284,6 +365,7 @@ async def process_timeblock_v3(supabase_client, device_id: str, date: str, time_
         "time_block": time_block,
         "prompt": prompt,
         "prompt_length": len(prompt),
+        "prompt_fingerprint": fingerprint,
         "has_transcription": has_whisper and len(transcription.strip()) > 0 if transcription else False,
         "has_sed_data": has_yamnet,
         "has_opensmile_data": has_opensmile,
@@ -291,4 +373,150 @@ async def process_timeblock_v3(supabase_client, device_id: str, date: str, time_
         "opensmile_seconds": len(opensmile_data) if opensmile_data else 0,
         "dashboard_saved": dashboard_saved,
         "status_updates": status_updates
-    }
\ No newline at end of file
+    }
+
+
+async def process_day_v3(supabase_client, device_id: str, date: str,
+                         start_block: Optional[str] = None, end_block: Optional[str] = None,
+                         include_prompts: bool = False) -> Dict[str, Any]:
+    """
+    1日分（または指定範囲）のタイムブロックをV2プロンプトでまとめて処理
+    
+    - 各データソーステーブルは1日分を1回ずつ取得、観測対象者情報も1回のみ取得
+    - dashboardテーブルへは1回の複数行UPSERTで保存
+    - 各データソースのstatusはテーブルごとに一括更新
+    - データが1つも存在しないタイムブロックはスキップ
+    
+    Args:
+        start_block / end_block: 処理範囲（両端を含む、例: "09-00"〜"12-30"）。省略時は1日全体
+        include_prompts: 結果にプロンプト本文を含めるか
+    """
+    time_blocks = [
+        time_block for time_block in TIME_BLOCKS
+        if (start_block is None or time_block >= start_block)
+        and (end_block is None or time_block <= end_block)
+    ]
+    
+    use_fingerprint = await has_fingerprint_column(supabase_client)
+    
+    # データ取得（各テーブル1回ずつ、並行して実行）
+    results = await asyncio.gather(
+        get_day_rows(supabase_client, 'vibe_whisper', 'transcription', device_id, date),
+        get_day_rows(supabase_client, 'behavior_yamnet', 'events', device_id, date),
+        get_day_rows(supabase_client, 'emotion_opensmile', 'selected_features_timeline', device_id, date),
+        get_subject_info(supabase_client, device_id),
+        return_exceptions=True
+    )
+    # 取得に失敗したデータソースはデータなしとして扱う
+    whisper_rows, sed_rows, opensmile_rows, subject_info = fetched_or_none(results)
+    sources = ('vibe_whisper', 'behavior_yamnet', 'emotion_opensmile', 'subjects')
+    for source, result in zip(sources, results):
+        if isinstance(result, Exception):
+            logger.warning("Error fetching %s data: %s", source, result,
+                           extra={"source": source, "device_id": device_id, "date": date})
+    whisper_rows = whisper_rows or {}
+    sed_rows = sed_rows or {}
+    opensmile_rows = opensmile_rows or {}
+    
+    block_results: Dict[str, Dict[str, Any]] = {}
+    dashboard_rows = []
+    status_keys = {table: [] for table in ('vibe_whisper', 'behavior_yamnet', 'emotion_opensmile')}
+    
+    for time_block in time_blocks:
+        whisper_row = whisper_rows.get(time_block)
+        sed_row = sed_rows.get(time_block)
+        opensmile_row = opensmile_rows.get(time_block)
+        
+        if whisper_row is None and sed_row is None and opensmile_row is None:
+            block_results[time_block] = {"status": "skipped", "reason": "no_data"}
+            continue
+        
+        transcription = whisper_row.get('transcription', '') if whisper_row is not None else None
+        sed_data = sed_row.get('events', []) if sed_row is not None else None
+        try:
+            opensmile_data = extract_opensmile_timeline(opensmile_row) if opensmile_row is not None else None
+        except Exception as e:
+            logger.warning("Error parsing OpenSMILE data: %s", e,
+                           extra={"device_id": device_id, "date": date, "time_block": time_block})
+            opensmile_data = None
+        
+        # データ存在フラグ
+        has_whisper = transcription is not None
+        has_yamnet = sed_data is not None and len(sed_data) > 0
+        has_opensmile = opensmile_data is not None and len(opensmile_data) > 0
+        
+        with span("render"):
+            prompt = generate_timeblock_prompt_v2(transcription, sed_data, time_block, date, subject_info, opensmile_data)
+        fingerprint = None
+        if use_fingerprint:
+            with span("fingerprint"):
+                fingerprint = compute_input_fingerprint(
+                    transcription, sed_data, opensmile_data, subject_info, date, time_block
+                )
+        dashboard_rows.append({
+            'device_id': device_id,
+            'date': date,
+            'time_block': time_block,
+            'prompt': prompt,
+            'prompt_fingerprint': fingerprint
+        })
+        
+        key = (device_id, date, time_block)
+        if has_whisper:
+            status_keys['vibe_whisper'].append(key)
+        if has_yamnet:
+            status_keys['behavior_yamnet'].append(key)
+        if has_opensmile:
+            status_keys['emotion_opensmile'].append(key)
+        
+        block_results[time_block] = {
+            "status": "success",
+            "prompt_length": len(prompt),
+            "has_transcription": has_whisper and len(transcription.strip()) > 0 if transcription else False,
+            "has_sed_data": has_yamnet,
+            "has_opensmile_data": has_opensmile,
+            "sed_events_count": len(sed_data) if sed_data else 0,
+            "opensmile_seconds": len(opensmile_data) if opensmile_data else 0
+        }
+        if include_prompts:
+            block_results[time_block]["prompt"] = prompt
+    
+    logger.info("Day data retrieved: %d/%d blocks with data", len(dashboard_rows), len(time_blocks),
+                extra={"device_id": device_id, "date": date, "blocks_with_data": len(dashboard_rows),
+                       "blocks": len(time_blocks)})
+    
+    # プロンプト保存（1回の複数行UPSERT）
+    dashboard_saved = await save_prompts_to_dashboard(supabase_client, dashboard_rows)
+    
+    # ステータス一括更新（dashboardへの保存が成功した場合のみ）
+    status_results = {}
+    if dashboard_saved:
+        status_results = await mark_statuses_completed_bulk(supabase_client, status_keys)
+    
+    for row in dashboard_rows:
+        time_block = row['time_block']
+        key = (device_id, date, time_block)
+        block_results[time_block]["dashboard_saved"] = dashboard_saved
+        block_results[time_block]["status_updates"] = {
+            "whisper_updated": status_results.get('vibe_whisper', {}).get(key, False),
+            "yamnet_updated": status_results.get('behavior_yamnet', {}).get(key, False),
+            "opensmile_updated": status_results.get('emotion_opensmile', {}).get(key, False)
+        }
+        if not dashboard_saved:
+            block_results[time_block]["status"] = "error"
+    
+    for block_result in block_results.values():
+        TIMEBLOCK_RESULTS.inc(mode="day", status=block_result["status"])
+    
+    return {
+        "status": "success" if dashboard_saved else "error",
+        "version": "v3-improved",
+        "device_id": device_id,
+        "date": date,
+        "start_block": time_blocks[0] if time_blocks else start_block,
+        "end_block": time_blocks[-1] if time_blocks else end_block,
+        "processed_count": len(dashboard_rows),
+        "skipped_count": len(time_blocks) - len(dashboard_rows),
+        "dashboard_saved": dashboard_saved,
+        "results": block_results
+    }
@@ -0,0 +1,273 @@
+"""
+Tracing
+=======
+リクエスト単位の軽量なスパン計測
+現在のトレースは contextvars で保持するため、asyncio.gather で並行実行した取得処理のスパンも同じトレースに記録される
+
+- TracingMiddleware: リクエストごとにトレースを開始し、フェーズごとの所要時間を Server-Timing ヘッダーで返す
+  （同名のスパンは合算し、件数を desc に記載。例: render;dur=12.3;desc="48 spans"）
+- span(name): with文で囲んだ区間を現在のトレースに記録（トレース外では何もしない）
+- DB呼び出しは data_access / fake_supabase の execute で "<テーブル>.<操作>"（例: vibe_whisper.select）として自動記録
+- TRACE_EXPORT_PATH を指定すると、リクエストごとのトレースをJSON Lines形式でファイルに追記
+  （ログと同じくキュー経由でエクスポーター用のスレッドが書き込み、イベントループでファイルI/Oを行わない）
+
+環境変数:
+    TRACE_SERVER_TIMING: Server-Timing ヘッダーを付けるか（既定: true）
+    TRACE_EXPORT_PATH: トレースの出力先ファイル（JSON Lines、既定: 出力しない）
+    TRACE_EXPORT_SAMPLE_RATE: ファイルに出力するリクエストの割合（0〜1、既定: 1）
+"""
+
+import os
+import time
+import queue
+import atexit
+import random
+import weakref
+import itertools
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import fast_json
+from metrics import route_path
+
+
+class Span:
+    """1区間の計測結果（開始はトレース開始からの経過秒）"""
+
+    __slots__ = ("name", "start", "duration")
+
+    def __init__(self, name: str, start: float, duration: float):
+        self.name = name
+        self.start = start
+        self.duration = duration
+
+
+class Trace:
+    """1リクエスト分のスパンのリスト"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.trace_id = f"{os.getpid():x}-{next(self._ids):x}"
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.spans: List[Span] = []
+
+    def add(self, name: str, started: float, finished: float):
+        self.spans.append(Span(name, started - self.started, finished - started))
+
+    def phases(self) -> Dict[str, List[float]]:
+        """スパン名 → [合計秒, 件数]（最初に記録された順）"""
+        phases: Dict[str, List[float]] = {}
+        for span_ in self.spans:
+            phase = phases.get(span_.name)
+            if phase is None:
+                phases[span_.name] = [span_.duration, 1]
+            else:
+                phase[0] += span_.duration
+                phase[1] += 1
+        return phases
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing ヘッダーの値（所要時間はミリ秒）"""
+        entries = []
+        for name, (duration, count) in self.phases().items():
+            entry = f"{name};dur={duration * 1000:.2f}"
+            if count > 1:
+                entry += f';desc="{count} spans"'
+            entries.append(entry)
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+    def to_record(self, scope: Dict[str, Any], status: int, total: float) -> Dict[str, Any]:
+        """JSON Lines に出力するレコード（時間はミリ秒、route はパステンプレート）"""
+        return {
+            "trace_id": self.trace_id,
+            "timestamp": self.started_at.isoformat(),
+            "method": scope["method"],
+            "route": route_path(scope),
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "status": status,
+            "duration_ms": round(total * 1000, 3),
+            "spans": [
+                {"name": s.name, "start_ms": round(s.start * 1000, 3), "duration_ms": round(s.duration * 1000, 3)}
+                for s in self.spans
+            ],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class _SpanTimer:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.name, self.started, time.perf_counter())
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str):
+    """
+    with span("render"): ... の区間を現在のトレースに記録
+    例外で抜けた場合も記録する。トレース外（CLI・ベンチマーク等）では何もしない
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return _SpanTimer(trace, name)
+
+
+_STOP = object()
+
+# fork後にスレッドを起動し直すエクスポーター
+_exporters: "weakref.WeakSet[TraceExporter]" = weakref.WeakSet()
+
+
+class TraceExporter:
+    """
+    トレースをJSON Lines形式でファイルに追記（1リクエスト1行）
+    export() はキューに積むのみで、シリアライズと書き込みはエクスポーター用のスレッドで行う
+    （キューに溜まっている分をまとめて1回で書き込む。tail -f で追える）
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # バッファなし: fork時に未書き込みのバッファが子プロセスに複製されない
+        self._file = open(path, "ab", buffering=0)
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start()
+        _exporters.add(self)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict[str, Any]):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in records)
+            lines = b"".join(fast_json.dumps(record) + b"\n" for record in records if record is not _STOP)
+            while lines:
+                lines = lines[self._file.write(lines):]
+            if stop:
+                return
+
+    def close(self):
+        """キューに残っているトレースを書き出してスレッドを停止"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        if not self._file.closed:
+            self._file.close()
+
+    def _restart_after_fork(self):
+        # 親プロセスのキューに残っている分は親プロセスが書き込む
+        self._queue = queue.SimpleQueue()
+        if self._thread is not None:
+            self._start()
+
+
+def _close_exporters():
+    for exporter in list(_exporters):
+        exporter.close()
+
+
+def _restart_exporters_after_fork():
+    """fork後の子プロセスでエクスポーターのスレッドを起動し直す（スレッドはforkで引き継がれないため）"""
+    for exporter in list(_exporters):
+        exporter._restart_after_fork()
+
+
+atexit.register(_close_exporters)
+os.register_at_fork(after_in_child=_restart_exporters_after_fork)
+
+
+def create_exporter_from_env() -> Optional[TraceExporter]:
+    """TRACE_EXPORT_PATH が指定されている場合のみエクスポーターを作成"""
+    path = os.getenv("TRACE_EXPORT_PATH")
+    if not path:
+        return None
+    return TraceExporter(path, sample_rate=float(os.getenv("TRACE_EXPORT_SAMPLE_RATE", "1")))
+
+
+class TracingMiddleware:
+    """リクエストごとにトレースを開始し、Server-Timing ヘッダーの付与とファイルへの出力を行うASGIミドルウェア"""
+
+    def __init__(self, app, server_timing: Optional[bool] = None, exporter: Optional[TraceExporter] = None):
+        self.app = app
+        if server_timing is None:
+            server_timing = os.getenv("TRACE_SERVER_TIMING", "true").lower() == "true"
+        self.server_timing = server_timing
+        self.exporter = exporter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.server_timing or self.exporter):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    # レスポンス開始時点までのスパン（エンドポイントの処理全体）をヘッダーに載せる
+                    value = trace.server_timing(time.perf_counter() - trace.started)
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if self.exporter is not None:
+                total = time.perf_counter() - trace.started
+                self.exporter.export(trace.to_record(scope, status_code, total))
@@ -0,0 +1,142 @@
+"""
+Startup Warm-up
+===============
+起動直後の最初のリクエストが負担していた初期化をプロセス起動時に済ませ、完了するまでは
+GET /health/ready で 503 を返す（ロードバランサー・ECSのヘルスチェックはreadinessで判定し、温まったプロセスにのみ振り分ける）
+
+ウォームアップの各フェーズ（所要時間は /health/ready・/metrics・起動ログに出力）:
+- calendar: カレンダー索引（jpholidayの祝日計算、既定5年分で約0.7〜2秒）の作成
+  gunicornの preload_app ではマスターで作成済み（gunicorn.conf.py）のため0秒
+- pool: 接続プールに WARMUP_POOL_CONNECTIONS 本の接続を開く（TLSハンドシェイクを済ませる）
+- subjects: 直近 WARMUP_SUBJECT_DAYS 日に dashboard_summary があるデバイスの観測対象者情報をキャッシュ（0で無効）
+
+失敗したフェーズはエラーを記録して次に進み、全フェーズの完了（または WARMUP_TIMEOUT 秒経過）でready
+（ウォームアップは最適化のため、Supabaseの一時的な障害で起動できなくなるのを避ける）
+
+環境変数:
+    WARMUP_ENABLED: 起動時にウォームアップするか（既定: true。falseの場合は起動直後からready）
+    WARMUP_POOL_CONNECTIONS: 起動時に開く接続数（既定: 4）
+    WARMUP_SUBJECT_DAYS: 観測対象者情報を先読みする稼働中デバイスの判定日数（既定: 0 = 先読みしない）
+    WARMUP_TIMEOUT: ウォームアップ全体のタイムアウト秒数（既定: 30）
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from calendar_index import get_calendar_index
+from metrics import STARTUP_PHASE_DURATION, STARTUP_READY
+from subject_cache import prefetch_subject_info
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_SUBJECT_DAYS = 0
+DEFAULT_TIMEOUT = 30.0
+
+
+class StartupState:
+    """起動からreadyまでの各フェーズの所要時間とエラー（時間は起動計測開始からの経過秒）"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.ready = False
+        self.ready_seconds: Optional[float] = None
+
+    def record_phase(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        STARTUP_PHASE_DURATION.set(seconds, phase=name)
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_seconds = time.perf_counter() - self.started
+        STARTUP_READY.set(self.ready_seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "degraded": bool(self.errors),
+            "time_to_ready_ms": round(self.ready_seconds * 1000, 1) if self.ready_seconds is not None else None,
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "errors": self.errors,
+        }
+
+
+async def open_pool_connections(supabase_client, connections: int):
+    """
+    軽量なクエリを同時に connections 本発行し、接続プールに接続を確立する
+    （HTTP/2の場合は1本の接続に多重化されるため、実際に開く接続数はそれより少ない）
+    """
+    await asyncio.gather(*(
+        supabase_client.table('devices').select('device_id').limit(1).execute()
+        for _ in range(connections)
+    ))
+
+
+async def active_device_ids(supabase_client, days: int) -> List[str]:
+    """直近 days 日に dashboard_summary が作成されたデバイス"""
+    since = (date.today() - timedelta(days=days)).isoformat()
+    result = await supabase_client.table('dashboard_summary').select('device_id').gte('date', since).execute()
+    return sorted({row['device_id'] for row in result.data or []})
+
+
+async def _run_phase(state: StartupState, name: str, phase: Callable[[], Awaitable[Any]]):
+    started = time.perf_counter()
+    try:
+        await phase()
+    except Exception as e:
+        state.errors[name] = f"{type(e).__name__}: {e}"
+        logger.warning("Warm-up phase failed", extra={"phase": name, "error": state.errors[name]})
+    finally:
+        state.record_phase(name, time.perf_counter() - started)
+
+
+async def warm_up(state: StartupState, get_client: Callable[[], Any],
+                  pool_connections: Optional[int] = None, subject_days: Optional[int] = None):
+    """
+    各フェーズを順に実行（引数の省略時は環境変数 WARMUP_POOL_CONNECTIONS / WARMUP_SUBJECT_DAYS）
+
+    Args:
+        get_client: Supabaseクライアントの取得関数（クライアントの作成自体もウォームアップに含める）
+    """
+    if pool_connections is None:
+        pool_connections = int(os.getenv("WARMUP_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS))
+    if subject_days is None:
+        subject_days = int(os.getenv("WARMUP_SUBJECT_DAYS", DEFAULT_SUBJECT_DAYS))
+
+    # CPU処理のためスレッドで実行（その間もイベントループは /health/live に応答する）
+    await _run_phase(state, "calendar", lambda: asyncio.to_thread(get_calendar_index))
+
+    if pool_connections > 0:
+        await _run_phase(state, "pool", lambda: open_pool_connections(get_client(), pool_connections))
+
+    if subject_days > 0:
+        async def prefetch_subjects():
+            client = get_client()
+            device_ids = await active_device_ids(client, subject_days)
+            found = await prefetch_subject_info(client, device_ids)
+            logger.info("Prefetched subject info", extra={"devices": len(device_ids), "found": found})
+        await _run_phase(state, "subjects", prefetch_subjects)
+
+
+async def run_warm_up(state: StartupState, get_client: Callable[[], Any]):
+    """
+    ウォームアップを実行してreadyにする（WARMUP_ENABLED=false の場合は即座にready）
+    タイムアウト・失敗時もready（degraded）にして起動時間を記録する
+    """
+    if os.getenv("WARMUP_ENABLED", "true").lower() == "true":
+        timeout = float(os.getenv("WARMUP_TIMEOUT", DEFAULT_TIMEOUT))
+        try:
+            await asyncio.wait_for(warm_up(state, get_client), timeout)
+        except asyncio.TimeoutError:
+            state.errors["timeout"] = f"warm-up did not finish within {timeout:g}s"
+            logger.warning("Warm-up timed out", extra={"timeout": timeout})
+
+    state.mark_ready()
+    logger.info("Ready", extra={"pid": os.getpid(), **state.to_dict()})
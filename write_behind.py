@@ -0,0 +1,198 @@
+"""
+Write-behind Buffer
+===================
+同時に処理中の複数リクエストのdashboardテーブルへの書き込みを集め、複数行のUPSERTにまとめて書き込むバッファ
+（DASHBOARD_WRITE_BEHIND=true の場合のみ。既定は各リクエストがそのままUPSERTする）
+
+- 最初の書き込みから DASHBOARD_WRITE_BEHIND_DELAY_MS ミリ秒後、または DASHBOARD_WRITE_BEHIND_MAX_ROWS 行に達した時点で書き込む
+- 同じキー（device_id, date, time_block）への書き込みは1行にマージ（後の書き込みの列の値で上書き）
+  各UPSERTは渡した列のみ更新するため、順に実行した場合と同じ結果になる
+- 書き込む列の組み合わせ（prompt系 / summary系）ごとに1回のUPSERT（複数行UPSERTでは全行が同じ列を持つ必要があるため）
+- 書き込み（フラッシュ）は1件ずつ順に実行し、同じキーへの古い書き込みが新しい書き込みを上書きしないようにする
+- write() は書き込み完了時に成否（bool）が設定されるFutureを返す
+  呼び出し側は await してから statusの更新等を行う（保存が確定する前に完了扱いにしない）
+- 読み込み前（/generate-dashboard-summary）は flush_before_read() で、読み込む範囲の行が書き込み待ち・書き込み中の場合のみ
+  それらの書き込み完了を待つ。シャットダウン時は close() で全て書き込む
+
+環境変数:
+    DASHBOARD_WRITE_BEHIND: dashboardへの書き込みをまとめるか（既定: false）
+    DASHBOARD_WRITE_BEHIND_DELAY_MS: 最初の書き込みから書き込むまでの最大待ち時間（ミリ秒、既定: 20）
+    DASHBOARD_WRITE_BEHIND_MAX_ROWS: この行数に達したら待たずに書き込む（既定: 200）
+"""
+
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from postgrest.types import ReturnMethod
+
+from metrics import observe_write_behind_flush, WRITE_BEHIND_COALESCED
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_DELAY_MS = 20
+DEFAULT_MAX_ROWS = 200
+
+
+class _PendingRow:
+    """書き込み待ちの1行と、その行にマージされた書き込みのFuture"""
+
+    __slots__ = ("row", "futures")
+
+    def __init__(self, row: Dict[str, Any], future: asyncio.Future):
+        self.row = row
+        self.futures = [future]
+
+
+class WriteBehindBuffer:
+    """キーごとに行をマージし、一定時間・行数ごとに複数行UPSERTで書き込むバッファ"""
+
+    def __init__(self, name: str, table: str, key_columns: Sequence[str], enabled: bool = True,
+                 delay: float = DEFAULT_DELAY_MS / 1000, max_rows: int = DEFAULT_MAX_ROWS):
+        self.name = name
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.enabled = enabled
+        self.delay = delay
+        self.max_rows = max_rows
+        # クライアント → キー → 書き込み待ちの行
+        self._pending: Dict[Any, Dict[Tuple, _PendingRow]] = {}
+        self._count = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_scheduled = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._tasks = set()
+        # 書き込み中（フラッシュ中）の行のキー
+        self._inflight: Tuple[Tuple, ...] = ()
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        """実行中のイベントループ用のロックを用意（ベンチマーク等で asyncio.run を繰り返す場合に作り直す）"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._timer = None
+            self._flush_scheduled = False
+        return loop
+
+    def __len__(self) -> int:
+        return self._count
+
+    def write(self, supabase_client, row: Dict[str, Any]) -> "asyncio.Future[bool]":
+        """
+        1行を書き込み待ちに追加（同じキーの行があれば列の値をマージ）
+
+        Returns:
+            書き込み完了時に成否が設定されるFuture
+        """
+        loop = self._bind_loop()
+        future = loop.create_future()
+        key = tuple(row[column] for column in self.key_columns)
+        rows = self._pending.setdefault(supabase_client, {})
+        pending = rows.get(key)
+        if pending is None:
+            rows[key] = _PendingRow(dict(row), future)
+            self._count += 1
+        else:
+            pending.row.update(row)
+            pending.futures.append(future)
+            WRITE_BEHIND_COALESCED.inc(buffer=self.name)
+
+        if not self._flush_scheduled:
+            if self._count >= self.max_rows:
+                self._schedule_flush("size")
+            elif self._timer is None:
+                self._timer = loop.call_later(self.delay, self._schedule_flush, "timer")
+        return future
+
+    async def write_many(self, supabase_client, rows: List[Dict[str, Any]]) -> bool:
+        """複数行を書き込み待ちに追加し、全行の書き込み完了を待つ（全行成功した場合True）"""
+        futures = [self.write(supabase_client, row) for row in rows]
+        return all(await asyncio.gather(*futures))
+
+    def _schedule_flush(self, reason: str):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._flush_scheduled = True
+        # フラッシュのきっかけになったリクエストのコンテキスト（トレース）を引き継がないよう空のコンテキストで実行
+        task = asyncio.get_running_loop().create_task(self.flush(reason), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, reason: str = "manual"):
+        """
+        書き込み待ちの行を全て書き込む（書き込み中のフラッシュがあれば、その完了を待ってから）
+        読み込み前・シャットダウン時に呼び出し、それまでの書き込みを反映させる
+        """
+        self._bind_loop()
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._flush_scheduled = False
+            pending, self._pending, self._count = self._pending, {}, 0
+            self._inflight = tuple(key for rows in pending.values() for key in rows)
+            batches = []
+            for supabase_client, rows in pending.items():
+                # 列の組み合わせごとに1回のUPSERT
+                groups: Dict[Tuple[str, ...], List[_PendingRow]] = {}
+                for pending_row in rows.values():
+                    groups.setdefault(tuple(sorted(pending_row.row)), []).append(pending_row)
+                batches.extend((supabase_client, group) for group in groups.values())
+            try:
+                if batches:
+                    await asyncio.gather(*(self._write_batch(client, group, reason) for client, group in batches))
+            finally:
+                self._inflight = ()
+
+    def has_pending(self, *prefix: Any) -> bool:
+        """キーの先頭の列の値が prefix に一致する行が書き込み待ち・書き込み中か"""
+        size = len(prefix)
+        if any(key[:size] == prefix for key in self._inflight):
+            return True
+        return any(key[:size] == prefix for rows in self._pending.values() for key in rows)
+
+    async def flush_before_read(self, *prefix: Any):
+        """読み込む範囲（キーの先頭の列の値）の行が書き込み待ち・書き込み中の場合のみ、書き込み完了を待つ"""
+        if self.has_pending(*prefix):
+            await self.flush("read")
+
+    async def _write_batch(self, supabase_client, rows: List[_PendingRow], reason: str):
+        started = time.perf_counter()
+        try:
+            await supabase_client.table(self.table).upsert(
+                [pending_row.row for pending_row in rows], returning=ReturnMethod.minimal
+            ).execute()
+            ok = True
+        except Exception:
+            logger.exception("Write-behind flush failed", extra={"buffer": self.name, "rows": len(rows)})
+            ok = False
+        observe_write_behind_flush(self.name, reason, len(rows), time.perf_counter() - started, ok)
+        for pending_row in rows:
+            for future in pending_row.futures:
+                if not future.done():
+                    future.set_result(ok)
+
+    async def close(self):
+        """シャットダウン時: 書き込み待ちの行を全て書き込む"""
+        if self._loop is not None:
+            await self.flush("shutdown")
+
+
+def create_dashboard_buffer_from_env() -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        "dashboard", "dashboard", ("device_id", "date", "time_block"),
+        enabled=os.getenv("DASHBOARD_WRITE_BEHIND", "false").lower() == "true",
+        delay=float(os.getenv("DASHBOARD_WRITE_BEHIND_DELAY_MS", DEFAULT_DELAY_MS)) / 1000,
+        max_rows=int(os.getenv("DASHBOARD_WRITE_BEHIND_MAX_ROWS", DEFAULT_MAX_ROWS)),
+    )
+
+
+# プロセス内で共有するdashboardテーブルの書き込みバッファ
+dashboard_writes = create_dashboard_buffer_from_env()